@@ -0,0 +1,144 @@
+import re
+from collections import defaultdict
+
+import numpy as np
+
+
+class AnimeSearchIndex:
+
+    # name tokens shorter than this are matched as word prefixes, longer tokens as substrings through the trigrams
+    TRIGRAM = 3
+
+    # indexes the rows of an anime dataframe for filtering -- the lowercased names by trigram and by word, the genres as
+    # the bitmasks of mask_column, the type as category codes and each range column as a sorted permutation
+    # filters are dicts keyed by column, see mask
+    def __init__(self, df, name_column, genre_column, mask_column, genres, type_column, range_columns):
+        self.name_column = name_column
+        self.genre_column = genre_column
+        self.type_column = type_column
+        self.range_columns = list(range_columns)
+        self.n_rows = len(df)
+
+        self._names = [name.lower() if isinstance(name, str) else '' for name in df[name_column].tolist()]
+        self._trigrams, self._words, self._word_rows = AnimeSearchIndex._index_names(self._names)
+
+        self._genre_bits = {genre: np.uint64(1) << np.uint64(i) for i, genre in enumerate(genres)}
+        self._genre_masks = df[mask_column].to_numpy(dtype=np.uint64)
+
+        types = df[type_column].astype('category')
+        self._type_codes = types.cat.codes.to_numpy()
+        self._type_categories = {value: code for code, value in enumerate(types.cat.categories)}
+
+        # missing values sort last, so a range never reaches them
+        self._ranges = {}
+        for column in self.range_columns:
+            values = df[column].to_numpy(dtype=np.float64)
+            order = np.argsort(values, kind='stable')
+            self._ranges[column] = (order, values[order], int(np.count_nonzero(~np.isnan(values))))
+
+    # returns the distinct genres and types the filters can select
+    def options(self):
+        return {self.genre_column: list(self._genre_bits), self.type_column: list(self._type_categories)}
+
+    # returns a boolean mask of the rows matching every filter, or None when no filter is set
+    # filters -- dict holding any of: name_column -> text whose whitespace separated tokens must all appear in the name,
+    # genre_column -> list of genres the anime must all have, type_column -> type, and range column -> (low, high)
+    # inclusive bounds, either of which may be None
+    def mask(self, filters):
+        filters = AnimeSearchIndex.active(filters)
+        if not filters:
+            return None
+
+        mask = np.ones(self.n_rows, dtype=bool)
+        for column, value in filters.items():
+            if column == self.name_column:
+                mask &= self._name_mask(value)
+            elif column == self.genre_column:
+                mask &= self._genre_mask(value)
+            elif column == self.type_column:
+                mask &= self._type_codes == self._type_categories.get(value, -2)
+            elif column in self._ranges:
+                mask &= self._range_mask(column, *value)
+            else:
+                raise ValueError("cannot filter on column " + str(column))
+        return mask
+
+    # drops unset filters -- empty text, no genres and ranges without bounds
+    @staticmethod
+    def active(filters):
+        if not filters:
+            return {}
+        active = {}
+        for column, value in filters.items():
+            if isinstance(value, str):
+                value = value.strip()
+            elif isinstance(value, (list, tuple)):
+                value = tuple(value)
+                if all(bound is None for bound in value):
+                    value = None
+            if value:
+                active[column] = value
+        return active
+
+    # hashable form of the active filters, eg. for a result cache key
+    @staticmethod
+    def filter_key(filters):
+        return tuple(sorted(AnimeSearchIndex.active(filters).items()))
+
+    @staticmethod
+    def _index_names(names):
+        trigrams = defaultdict(list)
+        words, word_rows = [], []
+        n = AnimeSearchIndex.TRIGRAM
+        for row, name in enumerate(names):
+            for trigram in {name[i:i + n] for i in range(len(name) - n + 1)}:
+                trigrams[trigram].append(row)
+            for word in set(re.findall(r'\w+', name)):
+                words.append(word)
+                word_rows.append(row)
+
+        order = np.argsort(np.array(words, dtype=object), kind='stable')
+        trigrams = {trigram: np.array(rows, dtype=np.int32) for trigram, rows in trigrams.items()}
+        return trigrams, np.array(words, dtype=object)[order], np.array(word_rows, dtype=np.int32)[order]
+
+    # rows whose name contains every token -- the posting lists of a token's trigrams are intersected, smallest first,
+    # and the few remaining names are checked for the whole token
+    def _name_mask(self, text):
+        mask = np.ones(self.n_rows, dtype=bool)
+        for token in text.lower().split():
+            if len(token) < AnimeSearchIndex.TRIGRAM:
+                lo = np.searchsorted(self._words, token, side='left')
+                hi = np.searchsorted(self._words, token + '\U0010ffff', side='left')
+                rows = self._word_rows[lo:hi]
+            else:
+                postings = [self._trigrams.get(token[i:i + AnimeSearchIndex.TRIGRAM])
+                            for i in range(len(token) - AnimeSearchIndex.TRIGRAM + 1)]
+                if any(posting is None for posting in postings):
+                    return np.zeros(self.n_rows, dtype=bool)
+                postings.sort(key=len)
+                rows = postings[0]
+                for posting in postings[1:]:
+                    rows = np.intersect1d(rows, posting, assume_unique=True)
+                if len(token) > AnimeSearchIndex.TRIGRAM:
+                    rows = rows[np.fromiter((token in self._names[row] for row in rows), dtype=bool, count=len(rows))]
+
+            token_mask = np.zeros(self.n_rows, dtype=bool)
+            token_mask[rows] = True
+            mask &= token_mask
+        return mask
+
+    def _genre_mask(self, genres):
+        if any(genre not in self._genre_bits for genre in genres):
+            return np.zeros(self.n_rows, dtype=bool)
+        required = np.uint64(0)
+        for genre in genres:
+            required |= self._genre_bits[genre]
+        return (self._genre_masks & required) == required
+
+    def _range_mask(self, column, low, high):
+        order, values, n_valid = self._ranges[column]
+        start = 0 if low is None else np.searchsorted(values[:n_valid], low, side='left')
+        stop = n_valid if high is None else np.searchsorted(values[:n_valid], high, side='right')
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[order[start:stop]] = True
+        return mask
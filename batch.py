@@ -0,0 +1,167 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from model import Model
+
+
+# model loaded once per worker process by _init_worker -- the correlation matrices are memory-mapped from the data
+# store so every worker shares the same pages
+_worker_model = None
+
+
+def _init_worker(similarity_k):
+    global _worker_model
+    _worker_model = Model(similarity_k=similarity_k)
+    _worker_model.load_data()
+
+
+def _score_selection_jobs(jobs, sort_by, ascending, top_k):
+    return [BatchScorer.score_selection(_worker_model, job_id, anime_ids, sort_by, ascending, top_k)
+            for job_id, anime_ids in jobs]
+
+
+def _score_catalog_jobs(jobs):
+    return [BatchScorer.score_catalog(_worker_model, job_id, anime_ids) for job_id, anime_ids in jobs]
+
+
+class BatchScorer:
+
+    # jobs sent to a worker at a time
+    CHUNK_SIZE = 16
+
+    # scores many selections or catalogs without a view -- with workers=1 the given (or a newly loaded) model is used
+    # directly, otherwise each worker process loads its own model
+    def __init__(self, model=None, workers=1, similarity_k=None):
+        self.workers = workers
+        self.similarity_k = similarity_k
+        self.model = model
+        if self.model is None and workers == 1:
+            self.model = Model(similarity_k=similarity_k)
+            self.model.load_data()
+        self.jobs_done = 0
+        self.seconds = 0.0
+
+    # reads one job per line -- anime ids separated by commas or whitespace, blank lines and lines starting with # are skipped
+    @staticmethod
+    def read_jobs(path):
+        jobs = []
+        with open(path) as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    jobs.append((line_number, [int(anime_id) for anime_id in line.replace(',', ' ').split()]))
+        return jobs
+
+    # similarity rows for one seed selection, labelled with the job id and rank
+    @staticmethod
+    def score_selection(model, job_id, anime_ids, sort_by=Model.COMBINED_SCORE, ascending=False, top_k=100):
+        sim_df = model.create_sim_df(anime_ids, sort_by=sort_by, ascending=ascending, top_k=top_k)
+        sim_df.insert(0, 'rank', range(1, len(sim_df) + 1))
+        sim_df.insert(0, 'job', job_id)
+        return sim_df
+
+    # shared user counts for one candidate catalog -- anime ids in the original catalog are ignored
+    @staticmethod
+    def score_catalog(model, job_id, anime_ids):
+        model.reset_catalog()
+        model.add_animes_to_catalog([anime_id for anime_id in anime_ids if anime_id not in Model.ORIGINAL_CATALOG_ANIME_IDS])
+        shared_users = model.calc_shared_users()
+        catalog_df = model.create_catalog_df()
+        return pd.DataFrame([{
+            'job': job_id,
+            'new_titles': len(model.new_catalog_ids),
+            'mean_p_rating': catalog_df[Model.P_RATING].mean(),
+            'original': shared_users['original'],
+            'shared': shared_users['shared'],
+            'new': shared_users['new']
+        }])
+
+    # yields one dataframe per selection job in job order
+    def score_selections(self, jobs, sort_by=Model.COMBINED_SCORE, ascending=False, top_k=100):
+        run_local = lambda job: self.score_selection(self.model, job[0], job[1], sort_by, ascending, top_k)
+        return self._run(jobs, run_local, _score_selection_jobs, (sort_by, ascending, top_k))
+
+    # yields one dataframe per catalog job in job order
+    def score_catalogs(self, jobs):
+        run_local = lambda job: self.score_catalog(self.model, job[0], job[1])
+        return self._run(jobs, run_local, _score_catalog_jobs, ())
+
+    # runs jobs in this process or in chunks across a process pool, recording the throughput
+    def _run(self, jobs, run_local, run_chunk, args):
+        started = time.perf_counter()
+        if self.workers == 1:
+            for job in jobs:
+                yield run_local(job)
+                self.jobs_done += 1
+        else:
+            chunks = [jobs[i:i + BatchScorer.CHUNK_SIZE] for i in range(0, len(jobs), BatchScorer.CHUNK_SIZE)]
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.similarity_k,)) as pool:
+                futures = [pool.submit(run_chunk, chunk, *args) for chunk in chunks]
+                for future in futures:
+                    for result in future.result():
+                        yield result
+                        self.jobs_done += 1
+        self.seconds += time.perf_counter() - started
+
+    # jobs per second over every batch run so far
+    def throughput(self):
+        return self.jobs_done / self.seconds if self.seconds else 0.0
+
+
+class ResultWriter:
+
+    # streams dataframes to a csv or parquet file, chosen by the file extension -- parquet requires pyarrow
+    def __init__(self, path):
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() in ('.parquet', '.pq')
+        self._parquet_writer = None
+        self._wrote_csv = False
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow
+            import pyarrow.parquet
+
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='a' if self._wrote_csv else 'w', header=not self._wrote_csv, index=False)
+            self._wrote_csv = True
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scores seed selections or candidate catalogs without the dashboard.")
+    parser.add_argument('mode', choices=['selections', 'catalogs'])
+    parser.add_argument('jobs', help="file with one job per line, anime ids separated by commas or spaces")
+    parser.add_argument('output', help="result file, .csv or .parquet")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--top-k', type=int, default=100, help="similarity rows kept per selection")
+    parser.add_argument('--sort-by', default=Model.COMBINED_SCORE)
+    parser.add_argument('--ascending', action='store_true')
+    parser.add_argument('--similarity-k', type=int, default=None, help="use top-k sparse similarity matrices")
+    args = parser.parse_args()
+
+    jobs = BatchScorer.read_jobs(args.jobs)
+    scorer = BatchScorer(workers=args.workers, similarity_k=args.similarity_k)
+    writer = ResultWriter(args.output)
+    try:
+        if args.mode == 'selections':
+            results = scorer.score_selections(jobs, sort_by=args.sort_by, ascending=args.ascending, top_k=args.top_k)
+        else:
+            results = scorer.score_catalogs(jobs)
+        for result in results:
+            writer.write(result)
+    finally:
+        writer.close()
+
+    print("%d %s in %.2fs (%.1f per second)" % (scorer.jobs_done, args.mode, scorer.seconds, scorer.throughput()))
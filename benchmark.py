@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from data_store import DataStore
+from model import Model
+
+
+class SyntheticData:
+
+    # number of synthetic genres and their names -- anime get one to four genres with a skewed popularity
+    N_GENRES = 40
+    GENRES = ["Genre %02d" % i for i in range(N_GENRES)]
+    TYPES = ['TV', 'Movie', 'OVA', 'ONA', 'Special', 'Music']
+
+    # average number of ratings per user, close to the MyAnimeList dump
+    RATINGS_PER_USER = 90
+    # rating rows written to the csv file at a time
+    CHUNK_ROWS = 2 * 10 ** 6
+    # matrix rows written to the .npy file at a time
+    MATRIX_BLOCK_ROWS = 1024
+    # rank of the synthetic correlation matrices
+    FACTORS = 16
+
+    # generates an anime table, a rating table and correlation matrices in the layout Model.load_data reads from a
+    # directory holding Data/ -- the matrices are written straight into the binary data store since N x N csv files
+    # are too large at the sizes benchmarked
+    def __init__(self, n_anime, n_ratings, n_users=None, seed=0):
+        self.n_anime = n_anime
+        self.n_ratings = n_ratings
+        self.n_users = n_users or max(1, n_ratings // SyntheticData.RATINGS_PER_USER)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.anime_ids = None
+
+    # writes every file below root and returns the data store holding the matrices
+    # cache_tables -- also converts the csv tables into the data store, as done by running data_store.py
+    def write(self, root, cache_tables=True):
+        os.makedirs(os.path.join(root, os.path.dirname(Model.ANIME_PATH)), exist_ok=True)
+        data_store = DataStore(os.path.join(root, DataStore.CACHE_DIR))
+
+        self.anime_table().to_csv(os.path.join(root, Model.ANIME_PATH), index=False)
+        self.write_ratings(os.path.join(root, Model.RATING_PATH))
+        n_rows = int(self.anime_ids.max()) + 1
+        for csv_path in Model.MATRIX_SOURCES:
+            self.write_matrix(data_store, os.path.join(root, csv_path), n_rows)
+
+        if cache_tables:
+            for csv_path, dtype in Model.TABLE_SOURCES:
+                data_store.convert_table(os.path.join(root, csv_path), dtype=dtype)
+        return data_store
+
+    # anime ids are spread over a range with gaps like the real ids and always include the original catalog
+    def anime_table(self):
+        id_space = max(int(self.n_anime * 1.3), max(Model.ORIGINAL_CATALOG_ANIME_IDS) + 1)
+        original = np.array(Model.ORIGINAL_CATALOG_ANIME_IDS)
+        others = np.setdiff1d(np.arange(1, id_space), original)
+        picked = self.rng.choice(others, size=max(0, self.n_anime - len(original)), replace=False)
+        self.anime_ids = np.sort(np.concatenate([original, picked]))
+        n = len(self.anime_ids)
+
+        genre_weights = 1 / np.arange(1, SyntheticData.N_GENRES + 1)
+        genre_weights /= genre_weights.sum()
+        genre_counts = self.rng.integers(1, 5, n)
+        genres = [', '.join(sorted(self.rng.choice(SyntheticData.GENRES, count, replace=False, p=genre_weights)))
+                  for count in genre_counts]
+
+        return pd.DataFrame({
+            Model.ANIME_ID: self.anime_ids,
+            Model.NAME: ["Synthetic anime %d" % anime_id for anime_id in self.anime_ids],
+            Model.GENRE: genres,
+            Model.TYPE: self.rng.choice(SyntheticData.TYPES, n),
+            Model.EPISODES: self.rng.integers(1, 100, n),
+            Model.RATING: self.rng.uniform(2, 9.5, n).round(2),
+            Model.MEMBERS: self.rng.integers(10, 10 ** 6, n)
+        })
+
+    # ratings are written chunk by chunk so the full table is never held -- anime popularity follows a power law and
+    # ratings of -1 mark anime watched without a score, as in the MyAnimeList dump
+    def write_ratings(self, csv_path):
+        popularity = 1 / np.arange(1, len(self.anime_ids) + 1) ** 0.8
+        popularity = self.rng.permutation(popularity / popularity.sum())
+        written = 0
+        while written < self.n_ratings:
+            n = min(SyntheticData.CHUNK_ROWS, self.n_ratings - written)
+            chunk_df = pd.DataFrame({
+                Model.USER_ID: self.rng.integers(1, self.n_users + 1, n, dtype=np.int32),
+                Model.ANIME_ID: self.rng.choice(self.anime_ids, n, p=popularity).astype(np.int32),
+                Model.RATING: self.rng.integers(-1, 11, n, dtype=np.int8)
+            })
+            chunk_df.to_csv(csv_path, mode='a' if written else 'w', header=not written, index=False)
+            written += n
+
+    # a low rank correlation matrix over every id below n_rows, written block by block into an .npy file that is
+    # adopted by the data store
+    def write_matrix(self, data_store, csv_path, n_rows):
+        factors = self.rng.standard_normal((n_rows, SyntheticData.FACTORS))
+        factors /= np.linalg.norm(factors, axis=1, keepdims=True)
+
+        os.makedirs(data_store.cache_dir, exist_ok=True)
+        npy_path = os.path.join(data_store.cache_dir, os.path.basename(csv_path) + '.tmp.npy')
+        matrix = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float64, shape=(n_rows, n_rows))
+        for start in range(0, n_rows, SyntheticData.MATRIX_BLOCK_ROWS):
+            block = factors[start:start + SyntheticData.MATRIX_BLOCK_ROWS] @ factors.T
+            matrix[start:start + len(block)] = block
+        np.fill_diagonal(matrix, 1.0)
+        matrix.flush()
+        del matrix
+        data_store.adopt_matrix(csv_path, npy_path, [str(i) for i in range(n_rows)])
+
+
+class Benchmark:
+
+    # similarity rows requested per call, as shown by the dashboard's first page
+    SIM_TOP_K = 300
+    # new anime added to the catalog before the catalog paths are timed
+    CATALOG_ADDITIONS = 20
+
+    # times the model hot paths on the data below root -- every path is run repeat times untraced for its timings
+    # and once more under tracemalloc for its peak memory
+    def __init__(self, root, repeat=5, similarity_k=None, seed=0):
+        self.root = root
+        self.repeat = repeat
+        self.similarity_k = similarity_k
+        self.rng = np.random.default_rng(seed)
+        self.model = None
+        self.results = {}
+
+    # runs every path and returns the results keyed by path name
+    def run(self):
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            self.time_path('load_data', self._load_data, repeat=1)
+            anime_ids = self.model.meta_df[Model.ANIME_ID].to_numpy()
+            candidates = np.setdiff1d(anime_ids, Model.ORIGINAL_CATALOG_ANIME_IDS)
+
+            self.time_path('create_sim_df', lambda: self._create_sim_df(candidates))
+            self.time_path('create_sim_df_cached', lambda: self.model.create_sim_df(
+                Model.ORIGINAL_CATALOG_ANIME_IDS, sort_by=Model.COMBINED_SCORE, top_k=Benchmark.SIM_TOP_K))
+
+            self.model.add_animes_to_catalog(self.rng.choice(candidates, Benchmark.CATALOG_ADDITIONS, replace=False).tolist())
+            self.time_path('calc_shared_users', self.model.calc_shared_users)
+            self.time_path('create_catalog_df', self.model.create_catalog_df)
+            self.time_path('get_top_genre_views', lambda: self.model.get_top_genre_views(catalog=True))
+            self.time_path('update_tv_rows', self._update_tv_rows())
+        finally:
+            os.chdir(cwd)
+        return self.results
+
+    # records the timings and traced peak memory of one path -- a path that cannot run here is recorded as skipped
+    def time_path(self, name, run, repeat=None):
+        if isinstance(run, str):
+            self.results[name] = {'skipped': run}
+            return
+
+        seconds = []
+        for _ in range(self.repeat if repeat is None else repeat):
+            started = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            run()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.results[name] = {
+            'seconds': seconds,
+            'median_seconds': statistics.median(seconds),
+            'min_seconds': min(seconds),
+            'peak_bytes': peak_bytes
+        }
+
+    def _load_data(self):
+        self.model = Model(similarity_k=self.similarity_k)
+        self.model.load_data()
+
+    # scores a new random selection with an empty result cache, as after a new catalog selection in the dashboard
+    def _create_sim_df(self, candidates):
+        self.model.sim_cache.clear()
+        selection = self.rng.choice(candidates, int(self.rng.integers(1, 10)), replace=False).tolist()
+        return self.model.create_sim_df(selection, sort_by=Model.COMBINED_SCORE, top_k=Benchmark.SIM_TOP_K)
+
+    # returns a callable showing the similarity rows in a treeview alternately sorted two ways, or the reason the
+    # path is skipped when Tk has no display
+    def _update_tv_rows(self):
+        try:
+            import tkinter as tk
+            from view import View
+            from virtual_treeview import VirtualTreeview
+
+            root = tk.Tk()
+        except Exception as e:
+            return "Tk is not available: %s" % e
+
+        root.withdraw()
+        frames = [self.model.create_sim_df(sort_by=sort_by, top_k=Benchmark.SIM_TOP_K)
+                  for sort_by in (Model.COMBINED_SCORE, Model.P_RATING)]
+        tv = VirtualTreeview(root, columns=list(frames[0].columns), show='headings')
+        calls = [0]
+
+        def run():
+            View.update_tv_rows(tv, frames[calls[0] % len(frames)])
+            calls[0] += 1
+            root.update()
+
+        return run
+
+
+# compares the median timings and peak memory of a report with a baseline report -- ratios above threshold are
+# flagged as regressions
+def compare(report, baseline, threshold):
+    rows = []
+    for name, result in report['paths'].items():
+        base = baseline['paths'].get(name)
+        if 'skipped' in result or base is None or 'skipped' in base:
+            continue
+        time_ratio = result['median_seconds'] / base['median_seconds'] if base['median_seconds'] else float('inf')
+        memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else float('inf')
+        rows.append({
+            'path': name,
+            'time_ratio': time_ratio,
+            'memory_ratio': memory_ratio,
+            'regression': time_ratio > threshold or memory_ratio > threshold
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the model hot paths on synthetic data and writes a json report.")
+    parser.add_argument('--anime', type=int, default=1000, help="number of anime titles, eg. 1000 to 20000")
+    parser.add_argument('--ratings', type=int, default=10 ** 6, help="number of rating rows, eg. 1M to 50M")
+    parser.add_argument('--users', type=int, default=None, help="defaults to one user per %d ratings"
+                                                                % SyntheticData.RATINGS_PER_USER)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per path")
+    parser.add_argument('--similarity-k', type=int, default=None, help="use top-k sparse similarity matrices")
+    parser.add_argument('--data-dir', default=None,
+                        help="directory for the synthetic data, reused when it already holds data -- defaults to a "
+                             "temporary directory that is removed afterwards")
+    parser.add_argument('--csv-tables', action='store_true', help="parse the csv tables instead of the data store copies")
+    parser.add_argument('--output', default=None, help="json report file, printed when not given")
+    parser.add_argument('--baseline', default=None, help="earlier json report to compare against")
+    parser.add_argument('--threshold', type=float, default=1.2, help="ratio to the baseline flagged as a regression")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='anime_benchmark_')
+    try:
+        generate_seconds = 0.0
+        if not os.path.exists(os.path.join(data_dir, Model.ANIME_PATH)):
+            started = time.perf_counter()
+            SyntheticData(args.anime, args.ratings, n_users=args.users, seed=args.seed).write(
+                data_dir, cache_tables=not args.csv_tables)
+            generate_seconds = time.perf_counter() - started
+
+        benchmark = Benchmark(data_dir, repeat=args.repeat, similarity_k=args.similarity_k, seed=args.seed)
+        report = {
+            'config': {
+                'anime': args.anime,
+                'ratings': args.ratings,
+                'users': args.users,
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'similarity_k': args.similarity_k,
+                'csv_tables': args.csv_tables
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'cpus': os.cpu_count()
+            },
+            'generate_seconds': generate_seconds,
+            'paths': benchmark.run()
+        }
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for row in compare(report, baseline, args.threshold):
+            print("%-22s time x%.2f memory x%.2f%s" % (row['path'], row['time_ratio'], row['memory_ratio'],
+                                                      "  REGRESSION" if row['regression'] else ""))
@@ -0,0 +1,273 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_store import DataStore
+from model import Model
+from similarity import TopKSimilarity
+
+
+# sparse row-major observations shared by the worker processes -- set once per process by _init_worker
+_observations = {}
+
+
+class SparseRows:
+
+    # holds observations as (row, column, value) triples grouped by row, eg. users x anime ratings or
+    # features x anime indicators -- rows missing an observation for a column count as zero and repeated
+    # (row, column) observations are summed
+    def __init__(self, rows, columns, values, n_columns):
+        row_ids, dense_rows = np.unique(rows, return_inverse=True)
+        keys, inverse = np.unique(dense_rows.astype(np.int64) * n_columns + columns, return_inverse=True)
+
+        self.n_rows = len(row_ids)
+        self.n_columns = n_columns
+        self.columns = (keys % n_columns).astype(np.int32)
+        self.values = np.bincount(inverse, weights=values.astype(np.float64), minlength=len(keys))
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(keys // n_columns, minlength=self.n_rows))])
+
+    # returns the mean and standard deviation of every column over all rows
+    def column_stats(self):
+        sums = np.bincount(self.columns, weights=self.values, minlength=self.n_columns)
+        squares = np.bincount(self.columns, weights=self.values ** 2, minlength=self.n_columns)
+        mean = sums / self.n_rows
+        var = (squares - self.n_rows * mean ** 2) / (self.n_rows - 1)
+        return mean, np.sqrt(np.maximum(var, 0))
+
+    # returns the row of every stored value
+    def row_ids(self):
+        return np.repeat(np.arange(self.n_rows), np.diff(self.indptr))
+
+    # multiplies the (n_rows x n_columns) observations with a dense (n_columns x k) array, one output column at a time
+    def dot(self, dense, row_ids=None):
+        if row_ids is None:
+            row_ids = self.row_ids()
+        return np.column_stack([np.bincount(row_ids, weights=self.values * dense[self.columns, j], minlength=self.n_rows)
+                                for j in range(dense.shape[1])])
+
+    # multiplies the transposed observations with a dense (n_rows x k) array, one output column at a time
+    def tdot(self, dense, row_ids=None):
+        if row_ids is None:
+            row_ids = self.row_ids()
+        return np.column_stack([np.bincount(self.columns, weights=self.values * dense[row_ids, j],
+                                            minlength=self.n_columns) for j in range(dense.shape[1])])
+
+    # yields dense (rows x n_columns) blocks holding at most max_bytes each
+    def dense_chunks(self, max_bytes):
+        chunk_rows = max(1, int(max_bytes // (self.n_columns * 8)))
+        for start in range(0, self.n_rows, chunk_rows):
+            stop = min(start + chunk_rows, self.n_rows)
+            lo, hi = self.indptr[start], self.indptr[stop]
+            chunk = np.zeros((stop - start, self.n_columns))
+            local_rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+            chunk[local_rows, self.columns[lo:hi]] = self.values[lo:hi]
+            yield chunk
+
+
+def _init_worker(observations, chunk_bytes):
+    _observations['rows'] = observations
+    _observations['chunk_bytes'] = chunk_bytes
+    _observations['stats'] = observations.column_stats()
+
+
+# computes the pearson correlation between every column and the columns in [start, stop)
+def _correlation_block(start, stop):
+    observations = _observations['rows']
+    mean, std = _observations['stats']
+
+    gram = np.zeros((observations.n_columns, stop - start))
+    for chunk in observations.dense_chunks(_observations['chunk_bytes']):
+        gram += chunk.T @ chunk[:, start:stop]
+
+    n = observations.n_rows
+    cov = (gram - n * np.outer(mean, mean[start:stop])) / (n - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std[start:stop])
+    return start, np.nan_to_num(corr, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class SimilarityBuilder:
+
+    # default column block size and per-worker memory budget for dense observation chunks
+    BLOCK_SIZE = 512
+    CHUNK_BYTES = 256 * 2 ** 20
+
+    # randomized SVD settings -- extra directions sampled beyond the rank, and power iterations sharpening the range
+    # of slowly decaying spectra such as the user ratings
+    OVERSAMPLE = 10
+    POWER_ITERATIONS = 4
+
+    # top_k -- when set, the k most similar anime of every column are also stored as neighbour lists in the data
+    # store, or in a default DataStore when none is given, see DataStore.save_neighbours
+    def __init__(self, workers=None, block_size=None, chunk_bytes=None, data_store=None, top_k=None):
+        self.workers = workers or os.cpu_count()
+        self.block_size = block_size or SimilarityBuilder.BLOCK_SIZE
+        self.chunk_bytes = chunk_bytes or SimilarityBuilder.CHUNK_BYTES
+        self.data_store = data_store
+        self.top_k = top_k
+        self.timings = {}
+
+    # creates the users x anime ratings observations from clean_rating.csv -- only scored ratings (above 0) are
+    # observations, a rating of -1 marks an anime watched without a score and counts as no rating, as in RatingStream,
+    # so users without any scored rating are not rows
+    @staticmethod
+    def rating_observations(rating_df, n_anime):
+        scored_df = rating_df[rating_df[Model.RATING] > 0]
+        return SparseRows(scored_df[Model.USER_ID].to_numpy(), scored_df[Model.ANIME_ID].to_numpy(),
+                          scored_df[Model.RATING].to_numpy(), n_anime)
+
+    # creates the features x anime observations from the genres and type in clean_anime.csv
+    @staticmethod
+    def content_observations(anime_df, n_anime):
+        genres = anime_df[Model.GENRE].fillna('').str.split(', ').explode()
+        genres = genres[genres != '']
+        types = anime_df[Model.TYPE].dropna()
+
+        features = pd.concat([genres, 'type:' + types])
+        feature_ids = pd.factorize(features)[0]
+        anime_ids = anime_df[Model.ANIME_ID].to_numpy()[features.index.to_numpy()]
+        return SparseRows(feature_ids, anime_ids, np.ones(len(feature_ids)), n_anime)
+
+    # computes the full correlation matrix in column blocks across a process pool and writes it into an .npy file
+    def correlate(self, observations, npy_path):
+        n = observations.n_columns
+        matrix = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float64, shape=(n, n))
+        blocks = [(start, min(start + self.block_size, n)) for start in range(0, n, self.block_size)]
+
+        if self.workers == 1:
+            _init_worker(observations, self.chunk_bytes)
+            results = (_correlation_block(start, stop) for start, stop in blocks)
+            for start, corr in results:
+                matrix[:, start:start + corr.shape[1]] = corr
+        else:
+            with ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                     initargs=(observations, self.chunk_bytes)) as pool:
+                futures = [pool.submit(_correlation_block, start, stop) for start, stop in blocks]
+                for future in futures:
+                    start, corr = future.result()
+                    matrix[:, start:start + corr.shape[1]] = corr
+
+        matrix.flush()
+        return matrix
+
+    # returns (n_columns x rank) factors whose products approximate the pearson correlation between columns -- the
+    # columns are standardized as in _correlation_block, so the correlation matrix equals Z.T @ Z with
+    # Z = (observations - mean) / std / sqrt(n - 1), and a randomized truncated SVD Z ~ U S V.T gives the factors V S
+    # Z is never formed, its products are taken from the sparse observations and the mean correction
+    @staticmethod
+    def factorize(observations, rank, oversample=None, power_iterations=None, seed=0):
+        if oversample is None:
+            oversample = SimilarityBuilder.OVERSAMPLE
+        if power_iterations is None:
+            power_iterations = SimilarityBuilder.POWER_ITERATIONS
+        n = observations.n_rows
+        mean, std = observations.column_stats()
+        with np.errstate(divide='ignore'):
+            scale = np.where(std > 0, 1 / std, 0) / np.sqrt(n - 1)
+        row_ids = observations.row_ids()
+
+        def z_dot(dense):
+            dense = dense * scale[:, None]
+            return observations.dot(dense, row_ids) - mean @ dense
+
+        def z_tdot(dense):
+            return (observations.tdot(dense, row_ids) - np.outer(mean, dense.sum(axis=0))) * scale[:, None]
+
+        k = min(rank + oversample, observations.n_columns, n)
+        sample = np.random.default_rng(seed).standard_normal((observations.n_columns, k))
+        basis = np.linalg.qr(z_dot(sample))[0]
+        for _ in range(power_iterations):
+            basis = np.linalg.qr(z_dot(np.linalg.qr(z_tdot(basis))[0]))[0]
+
+        _, singular, vt = np.linalg.svd(z_tdot(basis).T, full_matrices=False)
+        rank = min(rank, len(singular))
+        return (vt[:rank].T * singular[:rank]).astype(np.float32)
+
+    # writes a matrix as a csv in the layout read by Model.load_data -- anime ids as the header, no index column
+    @staticmethod
+    def write_matrix_csv(matrix, csv_path, rows_per_chunk=1024):
+        columns = [str(anime_id) for anime_id in range(matrix.shape[1])]
+        for start in range(0, matrix.shape[0], rows_per_chunk):
+            chunk_df = pd.DataFrame(matrix[start:start + rows_per_chunk], columns=columns)
+            chunk_df.to_csv(csv_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    # builds one correlation matrix and writes it as a csv, the .npy copy is moved into the data store when one is
+    # given and deleted otherwise
+    def _build_matrix(self, name, observations, csv_path):
+        npy_path = os.path.splitext(csv_path)[0] + '.npy'
+        started = time.perf_counter()
+        matrix = self.correlate(observations, npy_path)
+        self.timings[name + '_correlate'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self.write_matrix_csv(matrix, csv_path)
+        self.timings[name + '_write_csv'] = time.perf_counter() - started
+
+        if self.top_k is not None:
+            started = time.perf_counter()
+            top_k = TopKSimilarity.from_dense(matrix, self.top_k)
+            (self.data_store or DataStore()).save_neighbours(csv_path, top_k.indices, top_k.values)
+            self.timings[name + '_neighbours'] = time.perf_counter() - started
+
+        del matrix
+        if self.data_store is not None:
+            self.data_store.adopt_matrix(csv_path, npy_path, [str(i) for i in range(observations.n_columns)])
+        else:
+            os.remove(npy_path)
+
+    # derives content_correlation.csv and rating_correlation.csv from the clean csv files -- the predicted ratings are
+    # computed by the model from the rating correlations, see predictor.py
+    def build(self, anime_path=Model.ANIME_PATH, rating_path=Model.RATING_PATH, content_corr_path=Model.CONTENT_CORR_PATH,
+              rating_corr_path=Model.RATING_CORR_PATH):
+        started = time.perf_counter()
+        anime_df = pd.read_csv(anime_path, dtype=Model.ANIME_DTYPES, low_memory=False)
+        rating_df = pd.read_csv(rating_path, dtype=Model.RATING_DTYPES, low_memory=False)
+        n_anime = int(max(anime_df[Model.ANIME_ID].max(), rating_df[Model.ANIME_ID].max())) + 1
+        self.timings['read_csv'] = time.perf_counter() - started
+
+        self._build_matrix('content', self.content_observations(anime_df, n_anime), content_corr_path)
+        self._build_matrix('rating', self.rating_observations(rating_df, n_anime), rating_corr_path)
+
+        return self.timings
+
+    # derives the low-rank factors of the content and rating correlations from the clean csv files, without the
+    # quadratic correlation pass -- see LowRankSimilarity
+    def build_factors(self, rank, anime_path=Model.ANIME_PATH, rating_path=Model.RATING_PATH,
+                      content_factors_path=Model.CONTENT_FACTORS_PATH, rating_factors_path=Model.RATING_FACTORS_PATH):
+        started = time.perf_counter()
+        anime_df = pd.read_csv(anime_path, dtype=Model.ANIME_DTYPES, low_memory=False)
+        rating_df = pd.read_csv(rating_path, dtype=Model.RATING_DTYPES, low_memory=False)
+        n_anime = int(max(anime_df[Model.ANIME_ID].max(), rating_df[Model.ANIME_ID].max())) + 1
+        self.timings['read_csv'] = time.perf_counter() - started
+
+        for name, observations, path in (('content', self.content_observations(anime_df, n_anime), content_factors_path),
+                                         ('rating', self.rating_observations(rating_df, n_anime), rating_factors_path)):
+            started = time.perf_counter()
+            np.save(path, self.factorize(observations, rank))
+            self.timings[name + '_factorize'] = time.perf_counter() - started
+
+        return self.timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the correlation matrices from the clean csv files.")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the cpu count")
+    parser.add_argument('--block-size', type=int, default=SimilarityBuilder.BLOCK_SIZE, help="matrix columns per task")
+    parser.add_argument('--chunk-mb', type=int, default=SimilarityBuilder.CHUNK_BYTES // 2 ** 20,
+                        help="memory budget per worker for dense observation chunks")
+    parser.add_argument('--cache', action='store_true', help="also store the matrices in the binary data store")
+    parser.add_argument('--top-k', type=int, default=None,
+                        help="also store the k most similar anime of every column, read by Model(similarity_k=k)")
+    parser.add_argument('--rank', type=int,
+                        help="build low-rank factors of this rank instead of the matrices, read by Model(low_rank=True)")
+    args = parser.parse_args()
+
+    builder = SimilarityBuilder(workers=args.workers, block_size=args.block_size, chunk_bytes=args.chunk_mb * 2 ** 20,
+                                data_store=DataStore() if args.cache else None, top_k=args.top_k)
+    timings = builder.build_factors(args.rank) if args.rank else builder.build()
+    for stage, seconds in timings.items():
+        print("%s: %.2fs" % (stage, seconds))
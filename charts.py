@@ -0,0 +1,171 @@
+import math
+
+import matplotlib
+
+matplotlib.use("TkAgg")
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+from tracing import traced
+
+
+class BlitChart:
+
+    # figure and canvas that are created once and updated in place -- updates are coalesced into one redraw per Tk
+    # idle cycle and, when only the animated artists changed, just those artists are redrawn over a cached background
+    def __init__(self, parent, figsize, dpi, facecolor=None, **grid_options):
+        self.figure = Figure(figsize=figsize, dpi=dpi, facecolor=facecolor)
+        self.ax = self.figure.add_subplot(111)
+        self.canvas = self._create_canvas(parent)
+        self.canvas.get_tk_widget().grid(**grid_options)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+        self._background = None
+        self._pending = None
+        self._scheduled = False
+        self._data_key = None
+
+    def _create_canvas(self, parent):
+        return FigureCanvasTkAgg(self.figure, parent)
+
+    # queues new chart data -- only the latest data queued before Tk is idle is drawn
+    def update(self, data):
+        self._pending = data
+        if not self._scheduled:
+            self._scheduled = True
+            self.canvas.get_tk_widget().after_idle(self._flush)
+
+    # draws the queued data, skipping the redraw when the data did not change
+    @traced('chart')
+    def _flush(self):
+        self._scheduled = False
+        data, self._pending = self._pending, None
+        data_key = self._key(data)
+        if data_key == self._data_key:
+            return
+        self._data_key = data_key
+
+        if self._apply(data) or self._background is None:
+            self.canvas.draw_idle()
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.canvas.blit(self.figure.bbox)
+
+    # caches everything but the animated artists after each full draw
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._animated_artists():
+            if artist.get_visible():
+                self.figure.draw_artist(artist)
+
+    # returns a hashable summary of the chart data used to skip redundant redraws
+    def _key(self, data):
+        raise NotImplementedError
+
+    # updates the artists for the data -- returns True when a full redraw is needed
+    def _apply(self, data):
+        raise NotImplementedError
+
+    # artists redrawn by blitting -- these are excluded from the cached background
+    def _animated_artists(self):
+        return []
+
+
+class PieChart(BlitChart):
+
+    # pie chart with one wedge per key, wedges with a count of zero are hidden
+    def __init__(self, parent, keys, colors, edge_color, text_color, figsize, dpi, **grid_options):
+        super().__init__(parent, figsize, dpi, facecolor=edge_color, **grid_options)
+        self.keys = keys
+        self.text_color = text_color
+
+        self.wedges, self.labels = self.ax.pie([1] * len(keys), labels=keys, colors=colors,
+                                               wedgeprops={'linewidth': 2, 'edgecolor': edge_color})
+        for wedge in self.wedges:
+            wedge.set_animated(True)
+        for label in self.labels:
+            label.set_animated(True)
+            label.set_color(text_color)
+
+    def _key(self, counts):
+        return tuple(counts.get(key, 0) for key in self.keys)
+
+    # sets each wedge's angles and moves its label to the middle of the wedge the same way matplotlib's pie does
+    def _apply(self, counts):
+        values = [counts.get(key, 0) for key in self.keys]
+        total = sum(values)
+        theta = 0.0
+        for key, value, wedge, label in zip(self.keys, values, self.wedges, self.labels):
+            visible = value != 0 and total > 0
+            wedge.set_visible(visible)
+            label.set_visible(visible)
+            if not visible:
+                continue
+
+            theta2 = theta + 360.0 * value / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta2)
+
+            angle = math.radians((theta + theta2) / 2)
+            x, y = 1.1 * math.cos(angle), 1.1 * math.sin(angle)
+            label.set_position((x, y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            label.set_text(key + "=" + str(value))
+            theta = theta2
+        return False
+
+    def _animated_artists(self):
+        return self.wedges + self.labels
+
+
+class BarChart(BlitChart):
+
+    # bar chart whose bar heights are updated in place -- the bars are rebuilt only when the number of bars changes
+    def __init__(self, parent, x_label, y_label, figsize, dpi, **grid_options):
+        super().__init__(parent, figsize, dpi, **grid_options)
+        self.ax.set_ylabel(y_label)
+        self.ax.set_xlabel(x_label)
+        self.ax.ticklabel_format(axis='y', style='plain')
+        self.bars = []
+        self.names = ()
+
+    def _key(self, data):
+        names, heights = data
+        return tuple(names), tuple(heights)
+
+    # a full redraw is needed when the bars are rebuilt, their names change, or they no longer fit the y axis
+    def _apply(self, data):
+        names, heights = list(data[0]), list(data[1])
+        full_redraw = False
+
+        if len(names) != len(self.bars):
+            for bar in self.bars:
+                bar.remove()
+            self.bars = list(self.ax.bar(range(len(names)), heights, color='C0'))
+            for bar in self.bars:
+                bar.set_animated(True)
+            self.ax.set_xticks(range(len(names)))
+            full_redraw = True
+
+        for bar, height in zip(self.bars, heights):
+            bar.set_height(height)
+
+        if tuple(names) != self.names:
+            self.ax.set_xticklabels(names)
+            self.names = tuple(names)
+            full_redraw = True
+
+        top = max(max(heights, default=0), 1)
+        if top > self.ax.get_ylim()[1] or top < self.ax.get_ylim()[1] * 0.5:
+            self.ax.set_ylim(0, top * 1.05)
+            full_redraw = True
+
+        return full_redraw
+
+    def _animated_artists(self):
+        return self.bars
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+
+# column holding each anime's genres as a multi-hot bitmask -- bit i is set when the anime has genre i
+GENRE_MASK = 'genre_mask'
+
+# bitmasks are stored as uint64 so at most this many distinct genres are supported
+MAX_GENRES = 64
+
+
+# returns the memory used by a dataframe including the contents of string columns
+def frame_nbytes(df):
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+# downcasts integer columns of a dataframe to the smallest integer type that holds their values
+def _downcast_numbers(df, columns):
+    for column in columns:
+        if column in df and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+
+
+# returns the sorted list of distinct genres in a comma joined genre column
+def genre_list(genre_s):
+    genres = genre_s.dropna().str.split(', ').explode()
+    return sorted(genre for genre in genres.unique() if genre != '')
+
+
+# encodes a comma joined genre column as uint64 bitmasks over the genres list
+def genre_masks(genre_s, genres):
+    if len(genres) > MAX_GENRES:
+        raise ValueError("genre bitmasks support at most %d genres, found %d" % (MAX_GENRES, len(genres)))
+
+    # encode each distinct genre combination once and map the rows through the combination codes
+    codes, combinations = pd.factorize(genre_s)
+    bits = {genre: np.uint64(1) << np.uint64(i) for i, genre in enumerate(genres)}
+    combination_masks = np.zeros(len(combinations) + 1, dtype=np.uint64)
+    for i, combination in enumerate(combinations):
+        for genre in combination.split(', '):
+            if genre in bits:
+                combination_masks[i] |= bits[genre]
+    return combination_masks[codes]
+
+
+# expands uint64 genre bitmasks into an (anime x genres) boolean matrix
+def genre_matrix(masks, n_genres):
+    shifts = np.arange(n_genres, dtype=np.uint64)
+    return ((np.asarray(masks, dtype=np.uint64)[:, None] >> shifts) & np.uint64(1)).astype(bool)
+
+
+# returns anime_df with 32-bit ids, downcast counts, categorical genre and type columns and a genre bitmask column,
+# along with the genre list the bitmasks refer to -- the genre strings are kept as categories for display, so each
+# distinct genre combination is stored once and every row holds an integer code
+def compact_anime_df(anime_df, id_column, genre_column, type_column, count_columns=()):
+    anime_df = anime_df.copy(deep=False)
+    anime_df[id_column] = anime_df[id_column].astype(np.int32)
+    _downcast_numbers(anime_df, count_columns)
+
+    genres = genre_list(anime_df[genre_column])
+    anime_df[GENRE_MASK] = genre_masks(anime_df[genre_column], genres)
+    anime_df[genre_column] = anime_df[genre_column].astype('category')
+    anime_df[type_column] = anime_df[type_column].astype('category')
+    return anime_df, genres
+
+
+# returns rating_df with 32-bit ids and 8-bit ratings -- columns already read with these types are not copied
+def compact_rating_df(rating_df, id_columns, rating_column):
+    rating_df = rating_df.copy(deep=False)
+    for column in id_columns:
+        rating_df[column] = rating_df[column].astype(np.int32)
+    rating_df[rating_column] = rating_df[rating_column].astype(np.int8)
+    return rating_df
+
+
+# reports the memory of each dataframe loaded by a model before and after compacting it
+if __name__ == '__main__':
+    from model import Model
+
+    # the csv files parsed with pandas' default types are the layout the model used before compacting
+    original = {
+        'anime_df': pd.read_csv(Model.ANIME_PATH, low_memory=False)
+    }
+
+    model = Model()
+    model.load_data()
+
+    print("%-16s %14s %14s" % ("frame", "before (MB)", "after (MB)"))
+    for name in original:
+        before, after = frame_nbytes(original[name]), frame_nbytes(getattr(model, name))
+        print("%-16s %14.2f %14.2f" % (name, before / 2 ** 20, after / 2 ** 20))
+
+    # the ratings are streamed into the user index instead of being kept as a dataframe
+    before = frame_nbytes(pd.read_csv(Model.RATING_PATH, low_memory=False))
+    print("%-16s %14.2f %14.2f" % ("rating_df", before / 2 ** 20, model.user_index.nbytes / 2 ** 20))
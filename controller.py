@@ -1,85 +1,147 @@
-from model import Model
+from model_constants import ModelConstants
 from view import View
+from worker import BackgroundWorker
+from tracing import TRACER, StartupTimer, traced
 import logging
 
 
 class Controller:
 
-    def __init__(self):
+    # number of similarity rows shown at first and added by each 'Load More' click
+    SIM_PAGE_SIZE = 300
+
+    # where a profile captured from the timings window is written, and the columns of the timing summary
+    PROFILE_PATH = 'Data/profile.pstats'
+    TIMINGS_COLUMNS = ['operation', 'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'mean_rows']
+
+    # model -- optional model to use instead of loading one locally, eg. a RemoteModel backed by a ScoringServer
+    # startup -- optional StartupTimer started by main.py, the startup phases are logged once the main frame is shown
+    # print_startup_report -- also prints the startup phases
+    def __init__(self, model=None, startup=None, print_startup_report=False):
         # setup the logging tool
         logging.basicConfig(filename='Data/app.log', level=logging.INFO, filemode='a', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
         try:
-            self.model = Model()
+            # the model is created on the worker by _warm_up unless one is given, so pandas is not imported before the
+            # login frame is shown
+            self.model = model
+            self.startup = startup if startup is not None else StartupTimer()
+            self.print_startup_report = print_startup_report
+            self._data_loaded = False
+            self._logging_in = False
+            self._warm_up_progress = ("Loading", 0.0)
 
             # declare class variables
             self.current_catalog_df = None
+            self.catalog_sort_index = None
             self.current_sim_df = None
             self.shared_users = None
             self.genre_views_df = None
+            self.filter_options = None
+            self.sim_filters = {}
 
             # initialize default sort settings for the catalog and similarity treeviews
-            self.current_catalog_sort = {"sort_by": Model.ANIME_ID, "ascending": True}
-            self.current_sim_sort = {"sort_by": Model.P_RATING, "ascending": False}
-            self.last_selection = Model.ORIGINAL_CATALOG_ANIME_IDS
+            self.current_catalog_sort = {"sort_by": ModelConstants.ANIME_ID, "ascending": True}
+            self.current_sim_sort = {"sort_by": ModelConstants.P_RATING, "ascending": False}
+            self.last_selection = ModelConstants.ORIGINAL_CATALOG_ANIME_IDS
+            self.sim_top_k = Controller.SIM_PAGE_SIZE
+
+            # create the view and the background worker that runs all model work off the Tk thread
+            with self.startup.phase("create window"):
+                self.view = View(self)
+                self.worker = BackgroundWorker(self.view)
 
-            # create the view, display the login form, and begin the main loop
-            self.view = View(self)
-            self.view.show_login_frame()
+            # display the login form, then import the heavy modules and load the data while the user logs in
+            with self.startup.phase("show login frame"):
+                self.view.show_login_frame()
+                self.view.update_idletasks()
+            self.worker.submit(self._warm_up, key='warm_up', on_progress=self._on_warm_up_progress)
             self.view.mainloop()
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
     # adds the anime selected in the similarity treeview to the catalog dataframe then updates the catalog treeview
+    @traced('handler')
     def on_add_button_clicked(self):
         try:
             selection = self.view.get_tv_selection(self.view.sim_tv)
-            self.model.add_animes_to_catalog(selection)
-            self._on_catalog_changed()
+            self._on_catalog_changed(lambda: self.model.add_animes_to_catalog(selection))
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
     # removes the anime selected in the catalog treeview from the catalog dataframe then updates the catalog treeview
+    @traced('handler')
     def on_remove_button_clicked(self):
         try:
             selection = self.view.get_tv_selection(self.view.catalog_tv)
-            self.model.remove_animes_from_catalog(selection)
-            self._on_catalog_changed()
+            self._on_catalog_changed(lambda: self.model.remove_animes_from_catalog(selection))
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
     # resets the catalog dataframe to the original anime and update the catalog treeview
+    @traced('handler')
     def on_reset_button_clicked(self):
         try:
-            self.model.reset_catalog()
-            self._on_catalog_changed()
+            self._on_catalog_changed(self.model.reset_catalog)
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
-    # creates the new catalog dataframe and updates the catalog treeview
-    def _on_catalog_changed(self):
+    # adds the number of anime chosen in the view that reach the most new users to the catalog
+    @traced('handler')
+    def on_optimize_button_clicked(self):
         try:
-            sorted_catalog_df = self.model.create_catalog_df(sort_by=self.current_catalog_sort['sort_by'], ascending=self.current_catalog_sort['ascending'])
-            self.view.update_tv_rows(self.view.catalog_tv, sorted_catalog_df)
-            self.view.create_user_pie_graph(self.model.calc_shared_users())
-
-            self.current_catalog_df = sorted_catalog_df
+            budget, weighted = self.view.get_optimize_options()
+            self._on_catalog_changed(lambda: self.model.optimize_catalog(budget, weighted=weighted))
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
+    # applies a catalog change on the worker, creates the new catalog dataframe and updates the catalog treeview
+    # -- catalog changes are never skipped since each one modifies the model
+    def _on_catalog_changed(self, change_catalog):
+        sort = dict(self.current_catalog_sort)
+
+        def task():
+            change_catalog()
+            sorted_catalog_df = self.model.create_catalog_df(sort_by=sort['sort_by'], ascending=sort['ascending'])
+            return sorted_catalog_df, self.model.calc_shared_users(), self.model.get_top_genre_views(catalog=True)
+
+        # the heading may have been clicked while the task ran, so the sort current now is applied to the new catalog
+        def on_done(result):
+            catalog_df, self.shared_users, self.genre_views_df = result
+            self._set_catalog_df(catalog_df)
+            sort = self.current_catalog_sort
+            self.current_catalog_df = self.catalog_sort_index.take(sort['sort_by'], sort['ascending']).reset_index(drop=True)
+            self.view.update_tv_rows(self.view.catalog_tv, self.current_catalog_df)
+            self.view.create_user_pie_graph(self.shared_users)
+            self.view.create_genre_bar_graph(self.genre_views_df)
+
+        self.worker.submit(task, on_done, name='catalog_change')
+
     # finds new similarity scores based on the selected anime in the catalog treeview then it updates the similarity treeview
+    @traced('handler')
     def on_sim_button_clicked(self):
         try:
             selection = self.view.get_tv_selection(self.view.catalog_tv)
             if len(selection) == 0:
                 selection = None
-            sorted_sim_df = self.model.create_sim_df(selection, sort_by=self.current_sim_sort["sort_by"], ascending=self.current_sim_sort["ascending"])
-            self.view.update_tv_rows(self.view.sim_tv, sorted_sim_df)
+            self.sim_top_k = Controller.SIM_PAGE_SIZE
             self.last_selection = selection
+            self._update_sim_rows()
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+
+    # shows the next page of similarity rows for the current selection and sort
+    @traced('handler')
+    def on_load_more_button_clicked(self):
+        try:
+            self.sim_top_k += Controller.SIM_PAGE_SIZE
+            self._update_sim_rows()
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
     # sorts the similarity dataframe based on the heading selected, then it updates the similarity treeview rows
+    # -- the best rows are picked again for the new sort since only the top rows are shown
+    @traced('handler')
     def on_sim_tv_heading_clicked(self, heading):
         try:
             ascending = True
@@ -88,14 +150,46 @@ class Controller:
                     ascending = False
                 else:
                     ascending = True
-            self.current_sim_df.sort_values([heading], ascending=ascending, inplace=True)
             self.current_sim_sort['sort_by'] = heading
             self.current_sim_sort['ascending'] = ascending
-            self.view.update_tv_rows(self.view.sim_tv, self.current_sim_df)
+            self._update_sim_rows()
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+
+    # narrows the similarity list to the anime matching the filter bar -- called on every keystroke, a newer request
+    # supersedes one that is still queued
+    @traced('handler')
+    def on_sim_filter_changed(self):
+        try:
+            self.sim_filters = self.view.get_sim_filters()
+            self.sim_top_k = Controller.SIM_PAGE_SIZE
+            self._update_sim_rows()
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
-    # sorts the catalog dataframe based on the heading selected, then it updates the catalog treeview rows
+    # scores the last selection on the worker and shows the top sim_top_k rows for the current sort in the similarity
+    # treeview -- a newer similarity request supersedes any that is still queued or running
+    def _update_sim_rows(self):
+        selection = self.last_selection
+        sort = dict(self.current_sim_sort)
+        top_k = self.sim_top_k
+        filters = dict(self.sim_filters)
+
+        def task():
+            sim_df = self.model.create_sim_df(selection, sort_by=sort["sort_by"], ascending=sort["ascending"], top_k=top_k,
+                                              filters=filters)
+            return sim_df, self.model.last_sim_row_count
+
+        def on_done(result):
+            self.current_sim_df, row_count = result
+            self.view.update_tv_rows(self.view.sim_tv, self.current_sim_df)
+            self.view.set_load_more_enabled(len(self.current_sim_df) < row_count)
+
+        self.worker.submit(task, on_done, key='sim')
+
+    # sorts the catalog dataframe based on the heading selected, then it updates the catalog treeview rows -- the catalog
+    # is not fetched again, its rows are reordered with the sort permutations kept until the catalog changes
+    @traced('handler')
     def on_catalog_tv_heading_clicked(self, heading):
         try:
             ascending = True
@@ -104,47 +198,136 @@ class Controller:
                     ascending = False
                 else:
                     ascending = True
-            sorted_catalog_df = self.model.create_catalog_df(sort_by=heading, ascending=ascending)
             self.current_catalog_sort['sort_by'] = heading
             self.current_catalog_sort['ascending'] = ascending
-            self.view.update_tv_rows(self.view.catalog_tv, sorted_catalog_df)
+            if self.catalog_sort_index is None:
+                return
+
+            self.current_catalog_df = self.catalog_sort_index.take(heading, ascending).reset_index(drop=True)
+            self.view.update_tv_rows(self.view.catalog_tv, self.current_catalog_df)
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+
+    # sets the current catalog dataframe and the sort index its heading clicks are answered from -- the original anime
+    # stay ahead of the new anime, as in Model.create_catalog_df
+    def _set_catalog_df(self, catalog_df):
+        from sort_index import SortIndex
+
+        is_new = ~catalog_df[ModelConstants.ANIME_ID].isin(ModelConstants.ORIGINAL_CATALOG_ANIME_IDS).to_numpy()
+        self.catalog_sort_index = SortIndex(catalog_df, groups=is_new)
+        self.current_catalog_df = catalog_df
+
+    # shows the rolling timing summary of every traced operation
+    @traced('handler')
+    def on_timings_button_clicked(self):
+        try:
+            import pandas as pd
+
+            rows = [dict(row, operation=row['category'] + ': ' + row['name']) for row in TRACER.summary()]
+            timings_df = pd.DataFrame(rows, columns=Controller.TIMINGS_COLUMNS).round(2)
+            self.view.show_timings(timings_df, TRACER.enabled)
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+
+    # starts or stops recording timings
+    def on_trace_toggled(self, enabled):
+        try:
+            if enabled:
+                TRACER.enable(log_path=TRACER.log_path)
+            else:
+                TRACER.disable()
+            self.on_timings_button_clicked()
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+
+    # profiles the background work of the next interaction with cProfile
+    @traced('handler')
+    def on_profile_button_clicked(self):
+        try:
+            if not TRACER.enabled:
+                TRACER.enable(log_path=TRACER.log_path)
+            TRACER.capture_profile(Controller.PROFILE_PATH)
+            self.view.show_timings_message("The next interaction will be profiled into " + Controller.PROFILE_PATH)
         except Exception as e:
             logging.error("Exception occurred", exc_info=True)
 
-    # validates the user login information and displays the main application view
+    # validates the user login information, then loads the application data on the worker while showing its progress
+    @traced('handler')
     def on_login_button_clicked(self):
         try:
             # check login info
             login_info = self.view.get_login_info()
-            if self.model.validate_login_info(login_info):
+            validate_login_info = ModelConstants.validate_login_info if self.model is None else self.model.validate_login_info
+            if validate_login_info(login_info):
                 # log the login
                 logging.info(login_info[0] + " has logged in.")
-                # load application data
-                self._load_main_frame_data()
-
-                # show main application GUI
-                self.view.destroy_login_frame()
-                self.view.show_main_frame(self.current_catalog_df, self.current_sim_df, self.shared_users, self.genre_views_df)
+                # load application data -- this runs after the warm up, whose progress is shown until then
+                self._logging_in = True
+                self.view.show_loading_progress(*self._warm_up_progress)
+                self.worker.submit(self._load_main_frame_data, self._on_main_frame_data_loaded, key='login',
+                                   on_error=self._on_main_frame_data_failed, on_progress=self.view.show_loading_progress)
             else:
                 self.view.show_incorrect_login_message()
         except Exception as e:
             logging.error("Exception occured", exc_info=True)
 
-    # loads all data for the main application
-    def _load_main_frame_data(self):
-        try:
-            self.model.load_data()
+    # shows the main application GUI once its data is loaded
+    def _on_main_frame_data_loaded(self, result):
+        with self.startup.phase("show main frame"):
+            self.view.destroy_login_frame()
+            self.view.show_main_frame(self.current_catalog_df, self.current_sim_df, self.shared_users, self.genre_views_df,
+                                      self.filter_options)
+            self.view.set_load_more_enabled(len(self.current_sim_df) < self.model.last_sim_row_count)
+            self.view.update_idletasks()
 
-            self.current_catalog_df = self.model.create_catalog_df(sort_by=Model.ANIME_ID, ascending=True)
-            self.current_sim_df = self.model.create_sim_df(Model.ORIGINAL_CATALOG_ANIME_IDS, sort_by=Model.COMBINED_SCORE,
-                                                           ascending=False)
+        logging.info("startup phases:\n" + self.startup.report())
+        if self.print_startup_report:
+            print(self.startup.report())
 
-            self.current_catalog_sort = {"sort_by": Model.ANIME_ID, "ascending": True}
-            self.current_sim_sort = {"sort_by": Model.COMBINED_SCORE, "ascending": False}
-            self.last_selection = Model.ORIGINAL_CATALOG_ANIME_IDS
+    # lets the user retry logging in if loading failed
+    def _on_main_frame_data_failed(self, error):
+        self._logging_in = False
+        self.view.show_loading_failed_message()
 
-            self.shared_users = self.model.calc_shared_users()
-            self.genre_views_df = self.model.get_top_genre_views()
-        except Exception as e:
-            logging.error("Exception occured", exc_info=True)
+    # imports the model, treeview and chart modules and loads the data -- runs on the worker as soon as the login frame
+    # is shown, and again from _load_main_frame_data if it failed. The model module is only imported when no model was
+    # passed in, so a thin client never loads it
+    def _warm_up(self, progress):
+        if self.model is None:
+            with self.startup.phase("import model"):
+                from model import Model
+        with self.startup.phase("import charts"):
+            import charts
+            import virtual_treeview
+
+        with self.startup.phase("load data"):
+            if self.model is None:
+                self.model = Model()
+            self.model.load_data(progress=progress)
+        self._data_loaded = True
+
+    # remembers the warm up progress and shows it once the user has logged in
+    def _on_warm_up_progress(self, message, fraction):
+        self._warm_up_progress = (message, fraction * 0.9)
+        if self._logging_in:
+            self.view.show_loading_progress(*self._warm_up_progress)
+
+    # loads all data for the main application -- runs on the worker, errors are logged by the worker
+    def _load_main_frame_data(self, progress):
+        if not self._data_loaded:
+            self._warm_up(progress=lambda message, fraction: progress(message, fraction * 0.9))
+
+        progress("Scoring similar anime", 0.9)
+        self._set_catalog_df(self.model.create_catalog_df(sort_by=ModelConstants.ANIME_ID, ascending=True))
+        self.sim_top_k = Controller.SIM_PAGE_SIZE
+        self.current_sim_df = self.model.create_sim_df(ModelConstants.ORIGINAL_CATALOG_ANIME_IDS, sort_by=ModelConstants.COMBINED_SCORE,
+                                                       ascending=False, top_k=self.sim_top_k)
+
+        self.current_catalog_sort = {"sort_by": ModelConstants.ANIME_ID, "ascending": True}
+        self.current_sim_sort = {"sort_by": ModelConstants.COMBINED_SCORE, "ascending": False}
+        self.last_selection = ModelConstants.ORIGINAL_CATALOG_ANIME_IDS
 
+        progress("Counting shared users", 0.95)
+        self.shared_users = self.model.calc_shared_users()
+        self.genre_views_df = self.model.get_top_genre_views(catalog=True)
+        self.filter_options = self.model.get_filter_options()
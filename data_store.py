@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class DataStore:
+
+    # location of the binary copies of the csv files
+    CACHE_DIR = "Data/cache"
+    MANIFEST_NAME = "manifest.json"
+
+    # cache entry kinds
+    TABLE = 'table'
+    MATRIX = 'matrix'
+    NEIGHBOURS = 'neighbours'
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = DataStore.CACHE_DIR
+        self.cache_dir = cache_dir
+
+    # converts a csv table into one .npy file per column -- string columns are stored as fixed width unicode arrays
+    # and a null mask is written next to any column that contains missing values
+    def convert_table(self, csv_path, dtype=None):
+        df = pd.read_csv(csv_path, dtype=dtype, low_memory=False)
+        entry_dir = self._entry_path(csv_path)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        columns = []
+        for i, column in enumerate(df.columns):
+            values = df[column]
+            has_nulls = bool(values.isna().any())
+            if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+                array = values.fillna('').astype(str).to_numpy(dtype=str)
+                kind = 'str'
+            else:
+                array = values.to_numpy()
+                kind = 'num'
+            np.save(os.path.join(entry_dir, str(i) + '.npy'), array)
+            if has_nulls and kind == 'str':
+                np.save(os.path.join(entry_dir, str(i) + '.na.npy'), values.isna().to_numpy())
+            columns.append({'name': column, 'kind': kind, 'has_nulls': has_nulls and kind == 'str'})
+
+        self._write_manifest_entry(csv_path, {'kind': DataStore.TABLE, 'columns': columns})
+
+    # converts a dense csv matrix into a single .npy file that can be memory-mapped
+    def convert_matrix(self, csv_path):
+        df = pd.read_csv(csv_path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(self._entry_path(csv_path) + '.npy', df.to_numpy(dtype=np.float64))
+        self._write_manifest_entry(csv_path, {'kind': DataStore.MATRIX, 'columns': df.columns.tolist()})
+
+    # moves an already written .npy matrix into the cache as the binary copy of a csv file -- the csv file does not
+    # need to exist, eg. for matrices too large to be written as csv
+    def adopt_matrix(self, csv_path, npy_path, columns):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.replace(npy_path, self._entry_path(csv_path) + '.npy')
+        self._write_manifest_entry(csv_path, {'kind': DataStore.MATRIX, 'columns': list(columns)})
+
+    # stores the neighbour lists of a csv matrix, see TopKSimilarity, as two .npy files -- the lists are kept most
+    # similar first, so load_neighbours also reads the lists of any smaller k from them
+    def save_neighbours(self, csv_path, indices, values):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(self._entry_path(csv_path) + '.neighbours.npy', indices)
+        np.save(self._entry_path(csv_path) + '.neighbour_values.npy', values)
+        self._write_manifest_entry(csv_path, {'kind': DataStore.NEIGHBOURS, 'k': int(indices.shape[1]),
+                                              'n_rows': int(indices.shape[0])}, key=self._neighbours_key(csv_path))
+
+    # reads the k most similar neighbours of every column of a csv matrix as read-only memory maps, returning
+    # (indices, values, n_rows), if lists of at least k neighbours are up to date -- otherwise returns None
+    def load_neighbours(self, csv_path, k):
+        entry = self._fresh_entry(csv_path, DataStore.NEIGHBOURS, key=self._neighbours_key(csv_path))
+        if entry is None or entry['k'] < min(k, entry['n_rows']):
+            return None
+        indices = np.load(self._entry_path(csv_path) + '.neighbours.npy', mmap_mode='r')
+        values = np.load(self._entry_path(csv_path) + '.neighbour_values.npy', mmap_mode='r')
+        return indices[:, :k], values[:, :k], entry['n_rows']
+
+    # returns the number of neighbours stored for a csv matrix, up to date or not, or None when none are stored
+    def neighbours_k(self, csv_path):
+        entry = self._read_manifest().get(self._neighbours_key(csv_path))
+        return None if entry is None else entry['k']
+
+    # reads a table from the cache if it is up to date, otherwise falls back to the csv file
+    def load_table(self, csv_path, dtype=None):
+        entry = self._fresh_entry(csv_path, DataStore.TABLE)
+        if entry is None:
+            return pd.read_csv(csv_path, dtype=dtype, low_memory=False)
+
+        entry_dir = self._entry_path(csv_path)
+        data = {}
+        for i, column in enumerate(entry['columns']):
+            array = np.load(os.path.join(entry_dir, str(i) + '.npy'))
+            if column['kind'] == 'str':
+                values = pd.Series(array, dtype=object)
+                if column['has_nulls']:
+                    values[np.load(os.path.join(entry_dir, str(i) + '.na.npy'))] = np.nan
+            else:
+                values = pd.Series(array)
+            data[column['name']] = values
+        return pd.DataFrame(data)
+
+    # reads some columns of a table in chunks of chunk_rows rows without holding the whole table -- cached columns are
+    # memory-mapped and sliced, otherwise the csv file is parsed chunk by chunk
+    def iter_table(self, csv_path, columns, chunk_rows, dtype=None):
+        entry = self._fresh_entry(csv_path, DataStore.TABLE)
+        if entry is None:
+            for chunk in pd.read_csv(csv_path, usecols=columns, dtype=dtype, chunksize=chunk_rows, low_memory=False):
+                yield chunk[columns]
+            return
+
+        entry_dir = self._entry_path(csv_path)
+        arrays = {}
+        for i, column in enumerate(entry['columns']):
+            if column['name'] in columns:
+                nulls = None
+                if column['has_nulls']:
+                    nulls = np.load(os.path.join(entry_dir, str(i) + '.na.npy'), mmap_mode='r')
+                arrays[column['name']] = (np.load(os.path.join(entry_dir, str(i) + '.npy'), mmap_mode='r'), column, nulls)
+
+        n_rows = len(arrays[columns[0]][0])
+        for start in range(0, n_rows, chunk_rows):
+            data = {}
+            for name in columns:
+                array, column, nulls = arrays[name]
+                values = np.array(array[start:start + chunk_rows])
+                if column['kind'] == 'str':
+                    values = pd.Series(values, dtype=object)
+                    if nulls is not None:
+                        values[np.array(nulls[start:start + chunk_rows])] = np.nan
+                else:
+                    values = pd.Series(values)
+                data[name] = values
+            yield pd.DataFrame(data)
+
+    # reads a matrix from the cache as a read-only memory map if it is up to date, otherwise falls back to the csv file
+    def load_matrix(self, csv_path):
+        entry = self._fresh_entry(csv_path, DataStore.MATRIX)
+        if entry is None:
+            return pd.read_csv(csv_path)
+
+        values = np.load(self._entry_path(csv_path) + '.npy', mmap_mode='r')
+        return pd.DataFrame(values, columns=entry['columns'], copy=False)
+
+    # checks whether the cache holds an up to date copy of a csv file
+    def is_fresh(self, csv_path):
+        return self._fresh_entry(csv_path) is not None
+
+    # returns the manifest entry for a csv file if its source has not changed since conversion
+    # -- a cache entry whose csv file no longer exists is still considered usable
+    # key -- manifest key of entries derived from the csv file, defaults to the csv file name
+    def _fresh_entry(self, csv_path, kind=None, key=None):
+        entry = self._read_manifest().get(key or os.path.basename(csv_path))
+        if entry is None or (kind is not None and entry['kind'] != kind):
+            return None
+        if os.path.exists(csv_path):
+            stat = os.stat(csv_path)
+            if stat.st_mtime_ns != entry['source_mtime_ns'] or stat.st_size != entry['source_size']:
+                return None
+        return entry
+
+    # manifest key of the neighbour lists of a csv matrix
+    @staticmethod
+    def _neighbours_key(csv_path):
+        return os.path.basename(csv_path) + ':' + DataStore.NEIGHBOURS
+
+    # returns the cache path for a csv file without its extension
+    def _entry_path(self, csv_path):
+        return os.path.join(self.cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.cache_dir, DataStore.MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # records a converted csv file in the manifest -- this is done last so a partial conversion is never used
+    # -- an entry adopted without its csv file is only used while no csv file exists at that path
+    def _write_manifest_entry(self, csv_path, entry, key=None):
+        stat = os.stat(csv_path) if os.path.exists(csv_path) else None
+        entry['source_mtime_ns'] = stat.st_mtime_ns if stat else None
+        entry['source_size'] = stat.st_size if stat else None
+
+        manifest = self._read_manifest()
+        manifest[key or os.path.basename(csv_path)] = entry
+        manifest_path = os.path.join(self.cache_dir, DataStore.MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+# one-time conversion of every csv file used by the application
+if __name__ == '__main__':
+    from model import Model
+    from similarity import TopKSimilarity
+
+    parser = argparse.ArgumentParser(description="Converts the csv files into the binary data store.")
+    parser.add_argument('--top-k', type=int, default=None,
+                        help="also store the k most similar anime of every matrix column, read by Model(similarity_k=k) "
+                             "for any k up to this")
+    args = parser.parse_args()
+
+    store = DataStore()
+    for path, dtype in Model.TABLE_SOURCES:
+        print("converting", path)
+        store.convert_table(path, dtype=dtype)
+    for path in Model.MATRIX_SOURCES:
+        print("converting", path)
+        store.convert_matrix(path)
+        if args.top_k is not None:
+            top_k = TopKSimilarity.from_dense(store.load_matrix(path), args.top_k)
+            store.save_neighbours(path, top_k.indices, top_k.values)
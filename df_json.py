@@ -0,0 +1,12 @@
+import pandas as pd
+
+
+# converts a dataframe into a json friendly dict -- missing values become null
+def df_to_json(df):
+    df = df.astype(object).where(df.notna(), None)
+    return {'columns': df.columns.tolist(), 'rows': df.values.tolist()}
+
+
+# converts the dict created by df_to_json back into a dataframe
+def json_to_df(data):
+    return pd.DataFrame(data['rows'], columns=data['columns'])
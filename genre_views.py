@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class GenreViews:
+
+    # counts the distinct users that rated at least one anime of each genre, over all anime and over the anime of a
+    # catalog -- the catalog counts keep, for every genre in the catalog, how many catalog anime of that genre each user
+    # rated, so adding or removing an anime only touches the users of that anime
+    # anime_ids, genre_masks -- each anime's id and multi-hot genre bitmask over genres, see compact.genre_masks
+    def __init__(self, user_index, anime_ids, genre_masks, genres):
+        self.user_index = user_index
+        self.genres = list(genres)
+
+        # anime that are not rated yet keep their masks for ratings added later, see add_ratings
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        known = anime_ids >= 0
+        n_anime = max(user_index.n_anime, int(anime_ids[known].max()) + 1 if known.any() else 0)
+        self.anime_masks = np.zeros(n_anime, dtype=np.uint64)
+        self.anime_masks[anime_ids[known]] = np.asarray(genre_masks, dtype=np.uint64)[known]
+
+        self._global_views = None
+        self._user_masks = None
+        self._catalog_ids = set()
+        self._coverage = {}
+        self._catalog_views = np.zeros(len(self.genres), dtype=np.int64)
+
+    # number of distinct users per genre over all rated anime
+    def global_views(self):
+        if self._global_views is None:
+            # each user's genres are the union of the genre masks of the anime they rated
+            index = self.user_index
+            row_anime = np.repeat(np.arange(index.n_anime), np.diff(index.indptr))
+            self._user_masks = np.zeros(index.n_users, dtype=np.uint64)
+            np.bitwise_or.at(self._user_masks, index.user_indices, self.anime_masks[row_anime])
+            self._global_views = self._bit_counts(self._user_masks)
+        return self._global_views
+
+    # number of distinct users per genre over the catalog anime -- the counts are updated from the anime added to or
+    # removed from the previous catalog
+    def catalog_views(self, catalog_ids):
+        catalog_ids = set(int(anime_id) for anime_id in catalog_ids)
+        for anime_id in self._catalog_ids - catalog_ids:
+            self._apply(anime_id, -1)
+        for anime_id in catalog_ids - self._catalog_ids:
+            self._apply(anime_id, 1)
+        self._catalog_ids = catalog_ids
+        return self._catalog_views.copy()
+
+    # counts the users of new rating rows that were added to the user index -- only the users of the new rows are
+    # touched, their genres grow by the genres of the anime they rated and the catalog coverage by the catalog anime
+    # anime_ids, user_indices -- the anime id and dense user index of every new row, see UserIndex.add_ratings
+    def add_ratings(self, anime_ids, user_indices):
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        known = anime_ids < len(self.anime_masks)
+        row_masks = np.where(known, self.anime_masks[np.where(known, anime_ids, 0)], np.uint64(0))
+
+        if self._global_views is not None:
+            self._user_masks = np.pad(self._user_masks, (0, self.user_index.n_users - len(self._user_masks)))
+            users, inverse = np.unique(user_indices, return_inverse=True)
+            added = np.zeros(len(users), dtype=np.uint64)
+            np.bitwise_or.at(added, inverse, row_masks)
+            old = self._user_masks[users]
+            self._global_views = self._global_views + self._bit_counts(added & ~old)
+            self._user_masks[users] = old | added
+
+        in_catalog = np.isin(anime_ids, list(self._catalog_ids))
+        for genre in range(len(self.genres)):
+            rows = in_catalog & ((row_masks >> np.uint64(genre)) & np.uint64(1)).astype(bool)
+            if not rows.any():
+                continue
+            coverage = self._genre_coverage(genre)
+            users = user_indices[rows]
+            self._catalog_views[genre] += int((coverage[np.unique(users)] == 0).sum())
+            np.add.at(coverage, users, 1)
+
+    # number of set bits per genre over bitmasks
+    def _bit_counts(self, masks):
+        return np.array([int(((masks >> np.uint64(i)) & np.uint64(1)).sum()) for i in range(len(self.genres))],
+                        dtype=np.int64)
+
+    # returns the per-user catalog coverage of a genre, sized to the users of the user index
+    def _genre_coverage(self, genre):
+        coverage = self._coverage.get(genre)
+        if coverage is None:
+            coverage = np.zeros(self.user_index.n_users, dtype=np.int32)
+        elif len(coverage) < self.user_index.n_users:
+            coverage = np.pad(coverage, (0, self.user_index.n_users - len(coverage)))
+        self._coverage[genre] = coverage
+        return coverage
+
+    # adds (sign 1) or removes (sign -1) one anime's users from the coverage of each of its genres
+    def _apply(self, anime_id, sign):
+        if not 0 <= anime_id < self.user_index.n_anime:
+            return
+        users = np.unique(self.user_index.users_of(anime_id))
+        mask = int(self.anime_masks[anime_id]) if anime_id < len(self.anime_masks) else 0
+        for genre in range(len(self.genres)):
+            if not mask >> genre & 1:
+                continue
+            coverage = self._genre_coverage(genre)
+            if sign > 0:
+                self._catalog_views[genre] += int((coverage[users] == 0).sum())
+                coverage[users] += 1
+            else:
+                coverage[users] -= 1
+                self._catalog_views[genre] -= int((coverage[users] == 0).sum())
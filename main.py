@@ -1,4 +1,26 @@
-from controller import Controller
+import argparse
+
+from tracing import TRACER, StartupTimer
+
+# started before the controller and view are imported so their import time is part of the startup report
+startup = StartupTimer()
+with startup.phase("import view"):
+    from controller import Controller
 
 if __name__ == '__main__':
-    c = Controller()
+    parser = argparse.ArgumentParser(description="Aniflix dashboard")
+    parser.add_argument('--server', help="url of a running scoring server (server.py) to use instead of loading the data")
+    parser.add_argument('--trace', action='store_true', help="record operation timings, shown by the Timings button")
+    parser.add_argument('--trace-log', help="also append every timed operation to this json lines file")
+    parser.add_argument('--startup-report', action='store_true',
+                        help="print how long each startup phase took once the dashboard is shown")
+    args = parser.parse_args()
+
+    if args.trace or args.trace_log:
+        TRACER.enable(log_path=args.trace_log)
+
+    model = None
+    if args.server:
+        from remote_model import RemoteModel
+        model = RemoteModel(args.server)
+    c = Controller(model=model, startup=startup, print_startup_report=args.startup_report)
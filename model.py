@@ -1,93 +1,361 @@
+import logging
+import os
+from collections import Counter
+
 import pandas as pd
 import numpy as np
 
-
-class Model:
-
-    # constant for the test user login info
-    TEST_USERNAME = 'admin'
-    TEST_PASSWORD = '123'
-
-    # column name constants
-    ANIME_ID = 'anime_id'
-    NAME = 'name'
-    GENRE = 'genre'
-    TYPE = 'type'
-    RATING = 'rating'
-    A_RATING = 'a_rating'
-    P_RATING = 'p_rating'
-    USER_ID = 'user_id'
-    C_SCORE = 'c_score'
-    R_SCORE = 'r_score'
-    COMBINED_SCORE = 'combined_score'
-    EPISODES = 'episodes'
-    MEMBERS = 'members'
-    VIEW_COUNT = 'view_count'
-
-    # dataframe datatype constants
-    ANIME_DTYPES = {ANIME_ID: int, NAME: str, GENRE: str, TYPE: str, RATING: float}
-    RATING_DTYPES = {ANIME_ID: int, USER_ID: int, RATING: int}
-    P_RATING_DTYPES = {ANIME_ID: int, P_RATING: float}
-    GENRE_DTYPES = {GENRE: str, VIEW_COUNT: int}
+from data_store import DataStore
+from model_constants import ModelConstants
+from similarity import LowRankSimilarity, TopKSimilarity, sum_columns
+from rating_stream import RatingStream
+from result_cache import ResultCache
+from sort_index import SortIndex
+from optimizer import CatalogOptimizer
+from compact import compact_anime_df, GENRE_MASK
+from genre_views import GenreViews
+from anime_search import AnimeSearchIndex
+from predictor import RatingPredictor
+from rating_delta import IncrementalCorrelation, update_rating_stats
+from tracing import TRACER, traced
+
+
+class Model(ModelConstants):
+
+    # dataframe datatype constants -- ids are 32-bit and user ratings 8-bit, genre and type become categories after
+    # loading, see compact.py
+    ANIME_DTYPES = {ModelConstants.ANIME_ID: np.int32, ModelConstants.NAME: str, ModelConstants.GENRE: str,
+                    ModelConstants.TYPE: str, ModelConstants.RATING: float}
+    RATING_DTYPES = {ModelConstants.ANIME_ID: np.int32, ModelConstants.USER_ID: np.int32, ModelConstants.RATING: np.int8}
 
     # csv path constants
     ANIME_PATH = "Data/clean_anime.csv"
     RATING_PATH = "Data/clean_rating.csv"
     CONTENT_CORR_PATH = "Data/content_correlation.csv"
     RATING_CORR_PATH = "Data/rating_correlation.csv"
-    P_RATING_PATH = "Data/predicted_ratings.csv"
-    GENRE_VIEWS_PATH = "Data/genre_views.csv"
 
-    # catalog info constants
-    ORIGINAL_CATALOG_ANIME_IDS = [127, 135, 191, 246, 345, 759, 809, 817, 2376]
-    ANIFLIX_A_RATINGS = [8.34, 8.30, 8.14, 5.05, 4.91, 2.7, 2.47, 7.87, 5.42]
+    # low-rank similarity factor paths -- written by build_similarity.py --rank
+    CONTENT_FACTORS_PATH = "Data/content_factors.npy"
+    RATING_FACTORS_PATH = "Data/rating_factors.npy"
+
+    # append-only file of ratings added since the matrices were built -- written by rating_delta.py and replayed by
+    # load_data, see ingest_ratings
+    RATING_DELTA_PATH = "Data/rating_deltas.csv"
+
+    # csv files read by load_data -- also used when converting the csv files into the binary data store
+    TABLE_SOURCES = [
+        (ANIME_PATH, ANIME_DTYPES),
+        (RATING_PATH, RATING_DTYPES)
+    ]
+    MATRIX_SOURCES = [CONTENT_CORR_PATH, RATING_CORR_PATH]
 
     # similarity score weights -- used when computing the combined similarity score
     C_SCORE_WEIGHT = 0.22
     R_SCORE_WEIGHT = 0.78
 
-    def __init__(self):
+    # whether calc_shared_users counts distinct users or rating rows
+    SHARED_USERS_DISTINCT = True
+
+    # limits of the similarity result cache
+    SIM_CACHE_ENTRIES = 32
+    SIM_CACHE_BYTES = 64 * 2 ** 20
+
+    # number of incremental score updates allowed before the running scores are recomputed from scratch
+    MAX_INCREMENTAL_SCORE_UPDATES = 50
+
+    # similarity_k -- when set, the correlation matrices are replaced by lists of each anime's k most similar anime
+    # rating_chunk_bytes -- memory budget of one chunk of ratings while they are streamed into the user index
+    # low_rank -- when True, the correlation matrices are replaced by the low-rank factors at CONTENT_FACTORS_PATH and
+    # RATING_FACTORS_PATH, so the dense matrices are never read
+    def __init__(self, data_store=None, similarity_k=None, rating_chunk_bytes=None, low_rank=False):
+        if data_store is None:
+            data_store = DataStore()
+        if low_rank and similarity_k is not None:
+            raise ValueError("similarity_k cannot be used with low-rank similarity factors")
+        self.data_store = data_store
+        self.similarity_k = similarity_k
+        self.low_rank = low_rank
+        self.rating_chunk_bytes = rating_chunk_bytes
+
         # declare class variables
         self.anime_df = None
-        self.rating_df = None
+        self.genres = None
+        self.user_index = None
+        self.rating_stats_df = None
+        self.rating_load_report = None
+        self.last_ingest_report = None
+        self.replayed_rating_df = None
         self.content_corr_df = None
         self.rating_corr_df = None
-        self.p_rating_df = None
-        self.genre_views_df = None
+        self.rating_predictor = None
+        self.genre_views = None
+        self.search_index = None
+        self.meta_df = None
+        self.meta_positions = None
+        self._has_p_rating = None
 
         # initialize Aniflix catalog average rating dataframe
         self.a_rating_df = pd.DataFrame({Model.ANIME_ID: Model.ORIGINAL_CATALOG_ANIME_IDS, Model.A_RATING: Model.ANIFLIX_A_RATINGS})
         self.new_catalog_ids = []
+        self.last_sim_row_count = 0
+
+        # cache of similarity results keyed by selection, catalog and sort -- see sim_cache.stats() for hit/miss counts
+        self.sim_cache = ResultCache(Model.SIM_CACHE_ENTRIES, Model.SIM_CACHE_BYTES)
+
+        # running similarity scores for the last selection and the metadata rows they are reported for
+        self._reset_sim_state()
+
+    # clears the running similarity scores, the joined similarity data and the cached results -- needed whenever the
+    # loaded data changes
+    def _reset_sim_state(self):
+        self.sim_cache.clear()
+        self._score_selection = Counter()
+        self._c_scores = None
+        self._r_scores = None
+        self._score_updates = 0
+        self._score_version = 0
+        self._sim_base_rows = None
+        self._sim_sort_index = None
+        self._sim_sort_version = None
+
+    # reads all data needed for the application -- the binary data store is used when it holds an up to date copy of
+    # a csv file, otherwise the csv file is parsed
+    # progress -- optional callable receiving a message and the fraction of loading completed after each step
+    @traced('load')
+    def load_data(self, progress=None):
+        if progress is None:
+            progress = Model._ignore_progress
+
+        progress("Loading anime", 0.0)
+        anime_df = self.data_store.load_table(Model.ANIME_PATH, dtype=Model.ANIME_DTYPES)
+        self.anime_df, self.genres = compact_anime_df(anime_df, Model.ANIME_ID, Model.GENRE, Model.TYPE,
+                                                      count_columns=[Model.EPISODES, Model.MEMBERS])
+        # the ratings are only needed as the user index and per-anime aggregates, so they are streamed in chunks
+        progress("Loading ratings", 0.1)
+        rating_stream = RatingStream(self.data_store, Model.RATING_PATH, Model.RATING_DTYPES, Model.ANIME_ID,
+                                     Model.USER_ID, Model.RATING, chunk_bytes=self.rating_chunk_bytes)
+        self.user_index, self.rating_stats_df = rating_stream.build(
+            progress=lambda message, fraction: progress(message, 0.1 + 0.3 * fraction))
+        self.rating_load_report = rating_stream.report()
+        progress("Loading content similarity", 0.4)
+        self.content_corr_df = self._load_similarity(Model.CONTENT_CORR_PATH, Model.CONTENT_FACTORS_PATH)
+        progress("Loading rating similarity", 0.6)
+        replay = os.path.exists(Model.RATING_DELTA_PATH)
+        if replay and self.low_rank:
+            logging.warning("ratings in %s are not added to low-rank similarity factors, fold them into the data with "
+                            "rating_delta.py --compact to include them", Model.RATING_DELTA_PATH)
+            replay = False
+        if replay and self.similarity_k is not None:
+            # the neighbour lists are built once the new ratings are added to the dense matrix
+            self.rating_corr_df = self.data_store.load_matrix(Model.RATING_CORR_PATH)
+        else:
+            self.rating_corr_df = self._load_similarity(Model.RATING_CORR_PATH, Model.RATING_FACTORS_PATH)
+
+        # ratings added since the matrices were built are replayed before anything is derived from the ratings
+        self.replayed_rating_df = None
+        if replay:
+            progress("Adding new ratings", 0.7)
+            self._replay_ratings()
+            if self.similarity_k is not None:
+                progress("Building nearest neighbours", 0.8)
+                self.rating_corr_df = TopKSimilarity.from_dense(self.rating_corr_df, self.similarity_k)
+
+        # the predicted ratings are computed from the rating similarity and the Aniflix ratings, see set_a_ratings
+        progress("Predicting ratings", 0.9)
+        self.rating_predictor = RatingPredictor(self.rating_corr_df)
+        self.rating_predictor.update(dict(zip(self.a_rating_df[Model.ANIME_ID].tolist(),
+                                              self.a_rating_df[Model.A_RATING].tolist())))
+        self._build_metadata()
+        # viewers per genre are counted from the user index, see get_top_genre_views
+        self.genre_views = GenreViews(self.user_index, self.meta_df[Model.ANIME_ID].to_numpy(),
+                                      self.meta_df[GENRE_MASK].to_numpy(), self.genres)
+        # the similarity list is filtered through indexes over meta_df, see create_sim_df
+        self.search_index = AnimeSearchIndex(self.meta_df, Model.NAME, Model.GENRE, GENRE_MASK, self.genres, Model.TYPE,
+                                             [Model.EPISODES, Model.MEMBERS])
+
+        self._reset_sim_state()
+        progress("Data loaded", 1.0)
 
-    # reads all CSVs needed for the application
-    def load_data(self):
-        self.anime_df = pd.read_csv(Model.ANIME_PATH, dtype=Model.ANIME_DTYPES, low_memory=False)
-        self.rating_df = pd.read_csv(Model.RATING_PATH, dtype=Model.RATING_DTYPES, low_memory=False)
-        self.content_corr_df = pd.read_csv(Model.CONTENT_CORR_PATH, header=0)
-        self.rating_corr_df = pd.read_csv(Model.RATING_CORR_PATH)
-        self.p_rating_df = pd.read_csv(Model.P_RATING_PATH, dtype=Model.P_RATING_DTYPES)
-        self.genre_views_df = pd.read_csv(Model.GENRE_VIEWS_PATH, dtype=Model.GENRE_DTYPES)
-
-    # gets the most viewed genres as a dataframe
-    def get_top_genre_views(self, head=5):
-        genre_views_df = self.genre_views_df.sort_values([Model.VIEW_COUNT], ascending=False)
-        return genre_views_df.head(head)
-
-    # checks login info against TEST_USERNAME and TEST_PASSWORD
     @staticmethod
-    def validate_login_info(login_info):
-        if login_info[0] == Model.TEST_USERNAME and login_info[1] == Model.TEST_PASSWORD:
-            return True
+    def _ignore_progress(message, fraction):
+        pass
+
+    # adds the ratings at RATING_DELTA_PATH while loading and keeps the accepted rows as replayed_rating_df, see
+    # compact in rating_delta.py -- when the rating correlation cannot follow them, eg. it was not built by
+    # build_similarity.py, the data is kept as loaded and a warning is logged
+    def _replay_ratings(self):
+        try:
+            delta_df = pd.read_csv(Model.RATING_DELTA_PATH, dtype=Model.RATING_DTYPES)
+            accepted, user_indices = self._add_ratings(delta_df)
+            self.replayed_rating_df = delta_df[accepted].reset_index(drop=True)
+        except ValueError as e:
+            logging.warning("ratings in %s were not added: %s", Model.RATING_DELTA_PATH, e)
+
+    # reads one similarity matrix in the configured form -- the low-rank factors, the neighbour lists persisted in the
+    # data store (see DataStore.save_neighbours) or, when there are none, neighbour lists built from the dense matrix,
+    # or the dense matrix itself
+    def _load_similarity(self, csv_path, factors_path):
+        if self.low_rank:
+            return LowRankSimilarity.load(factors_path)
+        if self.similarity_k is None:
+            return self.data_store.load_matrix(csv_path)
+        neighbours = self.data_store.load_neighbours(csv_path, self.similarity_k)
+        if neighbours is not None:
+            return TopKSimilarity(*neighbours)
+        return TopKSimilarity.from_dense(self.data_store.load_matrix(csv_path), self.similarity_k)
+
+    # joins the anime data with the predicted and Aniflix average ratings once into meta_df, one row per anime sorted
+    # by anime_id -- meta_positions maps an anime_id (a correlation matrix column) to its meta_df row, or -1, so the
+    # catalog and similarity views are assembled by indexing meta_df instead of merging
+    @traced('merge')
+    def _build_metadata(self):
+        meta_df = self.anime_df.drop_duplicates([Model.ANIME_ID]).sort_values([Model.ANIME_ID]).reset_index(drop=True)
+        anime_ids = meta_df[Model.ANIME_ID].to_numpy()
+
+        positions = np.full(int(anime_ids.max()) + 1 if len(anime_ids) else 0, -1, dtype=np.intp)
+        positions[anime_ids] = np.arange(len(anime_ids))
+
+        self.meta_df = meta_df
+        self.meta_positions = positions
+        # only anime with a row in the rating similarity matrix can be predicted
+        self._has_p_rating = (anime_ids >= 0) & (anime_ids < self.rating_predictor.n_rows)
+        self._update_meta_ratings()
+
+    # copies the current predicted and Aniflix average ratings into meta_df
+    def _update_meta_ratings(self):
+        anime_ids = self.meta_df[Model.ANIME_ID].to_numpy()
+        p_ratings = np.full(len(anime_ids), np.nan)
+        p_ratings[self._has_p_rating] = self.rating_predictor.predict()[anime_ids[self._has_p_rating]]
+        self.meta_df[Model.P_RATING] = p_ratings
+        a_rating_s = self.a_rating_df.set_index(Model.ANIME_ID)[Model.A_RATING]
+        self.meta_df[Model.A_RATING] = a_rating_s.reindex(anime_ids).to_numpy()
+
+    # sets the Aniflix average rating of some anime, eg. catalog additions once they have been rated on Aniflix, and
+    # refreshes the predicted ratings -- a rating of None removes it
+    @traced('score')
+    def set_a_ratings(self, a_ratings):
+        a_rating_s = self.a_rating_df.set_index(Model.ANIME_ID)[Model.A_RATING]
+        for anime_id, a_rating in a_ratings.items():
+            if a_rating is None:
+                a_rating_s = a_rating_s.drop(anime_id, errors='ignore')
+            else:
+                a_rating_s[anime_id] = a_rating
+        self.a_rating_df = a_rating_s.rename_axis(Model.ANIME_ID).reset_index()
+
+        if self.rating_predictor is not None:
+            self.rating_predictor.update(a_ratings)
+            self._refresh_p_ratings()
+
+    # copies the current predicted ratings into meta_df and drops the similarity results and sort order built on them
+    def _refresh_p_ratings(self):
+        self._update_meta_ratings()
+        self.sim_cache.clear()
+        if self._sim_sort_index is not None:
+            p_ratings = self.meta_df[Model.P_RATING].to_numpy()[self._sim_base_rows]
+            self._sim_sort_index.update({Model.P_RATING: p_ratings})
+
+    # adds new rating rows to the loaded data without rebuilding it -- the user index, the rating aggregates, the
+    # rating correlation, the genre view counts and the predicted ratings are updated from the rows of the users and
+    # anime involved only. rows of anime outside the rating correlation matrix, rows repeating a (user, anime) pair of
+    # the same batch and rows of pairs that are already rated are skipped
+    # returns the accepted rows, see last_ingest_report for the counts of each
+    @traced('load')
+    def ingest_ratings(self, delta_df):
+        accepted, user_indices = self._add_ratings(delta_df)
+        self.genre_views.add_ratings(delta_df[Model.ANIME_ID].to_numpy(dtype=np.int64)[accepted], user_indices)
+        self.rating_predictor.rating_corr = self.rating_corr_df
+        self.rating_predictor.refresh()
+        self._refresh_p_ratings()
+
+        # the running rating scores are summed again from the changed correlations on the next call
+        self._c_scores = None
+        self._r_scores = None
+        self._score_selection = Counter()
+        return delta_df[accepted]
+
+    # adds new rating rows to the user index, the rating correlation and the rating aggregates, see ingest_ratings --
+    # nothing is changed when the rating correlation cannot follow them
+    # returns a mask of the accepted rows and the dense user index of every accepted row
+    def _add_ratings(self, delta_df):
+        if isinstance(self.rating_corr_df, pd.DataFrame):
+            self.rating_corr_df = IncrementalCorrelation.from_user_index(self.rating_corr_df, self.user_index)
+        elif not isinstance(self.rating_corr_df, IncrementalCorrelation):
+            raise ValueError("ratings can only be ingested with the dense rating correlation matrix")
+
+        index = self.user_index
+        n_users = index.n_users
+        anime_ids = delta_df[Model.ANIME_ID].to_numpy(dtype=np.int64)
+        user_ids = delta_df[Model.USER_ID].to_numpy()
+        ratings = delta_df[Model.RATING].to_numpy()
+
+        # the rows of the known users are read once, to skip pairs they already rated and to update the correlation
+        known = (anime_ids >= 0) & (anime_ids < self.rating_corr_df.n_rows)
+        first = ~delta_df.duplicated([Model.ANIME_ID, Model.USER_ID]).to_numpy()
+        positions = index.user_positions(user_ids)
+        old_users, old_anime, old_ratings = index.rows_of_users(np.unique(positions[known & (positions >= 0)]))
+        rated = np.isin(positions * self.rating_corr_df.n_rows + anime_ids,
+                        old_users.astype(np.int64) * self.rating_corr_df.n_rows + old_anime) & (positions >= 0)
+        accepted = known & first & ~rated
+
+        user_indices = index.add_ratings(anime_ids[accepted], user_ids[accepted], ratings[accepted])
+        changed = np.unique(user_indices)
+        old_rows = Model._group_rows(old_users, old_anime, old_ratings, changed)
+        new_rows = Model._group_rows(*index.rows_of_users(changed), changed)
+        self.rating_corr_df.apply(old_rows, new_rows)
+        self.rating_stats_df = update_rating_stats(self.rating_stats_df, index, anime_ids[accepted], Model.ANIME_ID)
+
+        self.last_ingest_report = {
+            'accepted': int(accepted.sum()),
+            'unknown_anime': int((~known).sum()),
+            'repeated': int((known & ~first).sum()),
+            'already_rated': int((known & first & rated).sum()),
+            'changed_users': len(changed),
+            'new_users': index.n_users - n_users
+        }
+        return accepted, user_indices
+
+    # groups (user, anime, rating) entries into a dict of user -> (anime ids, ratings) for the given users
+    @staticmethod
+    def _group_rows(users, anime_ids, ratings, keep_users):
+        selected = np.isin(users, keep_users)
+        users, anime_ids, ratings = users[selected], anime_ids[selected], ratings[selected]
+        order = np.argsort(users, kind='stable')
+        group_users, starts = np.unique(users[order], return_index=True)
+        return {int(user): (anime_ids[rows], ratings[rows])
+                for user, rows in zip(group_users, np.split(order, starts[1:]))}
+
+    # returns the meta_df rows of the given anime ids in the same order, leaving out ids without a row
+    def _meta_rows(self, anime_ids):
+        anime_ids = np.asarray(anime_ids, dtype=np.intp)
+        anime_ids = anime_ids[(anime_ids >= 0) & (anime_ids < len(self.meta_positions))]
+        rows = self.meta_positions[anime_ids]
+        return rows[rows >= 0]
+
+    # gets the most viewed genres as a dataframe -- view_count is the number of distinct users that rated an anime of
+    # the genre, counted over the current catalog (original and new anime) when catalog is True, otherwise over all anime
+    @traced('score')
+    def get_top_genre_views(self, head=5, catalog=False):
+        if catalog:
+            view_counts = self.genre_views.catalog_views(Model.ORIGINAL_CATALOG_ANIME_IDS + self.new_catalog_ids)
         else:
-            return False
+            view_counts = self.genre_views.global_views()
+        genre_views_df = pd.DataFrame({Model.GENRE: self.genres, Model.VIEW_COUNT: view_counts})
+        genre_views_df = genre_views_df.sort_values([Model.VIEW_COUNT], ascending=False, kind='stable')
+        return genre_views_df.head(head).reset_index(drop=True)
+
+    # returns the genres and types the similarity list can be filtered on
+    def get_filter_options(self):
+        return self.search_index.options()
 
     # adds a new id the to new_catalog_ids list
+    @traced('catalog')
     def add_animes_to_catalog(self, anime_ids):
         for anime_id in anime_ids:
             if anime_id not in self.new_catalog_ids:
                 self.new_catalog_ids.append(anime_id)
 
     # removes an id from the new_catalog_ids list -- does not allow removal of original catalog anime ids
+    @traced('catalog')
     def remove_animes_from_catalog(self, anime_ids):
         for anime_id in anime_ids:
             if anime_id in Model.ORIGINAL_CATALOG_ANIME_IDS:
@@ -99,52 +367,99 @@ class Model:
                     print("Failed to remove anime_id=", anime_id, " from catalog")
 
     # empties the new_catalog_ids list
+    @traced('catalog')
     def reset_catalog(self):
         self.new_catalog_ids = []
 
-    # creates a dict showing the number of MyAnimeList members that view the original anime, new anime, or both
-    def calc_shared_users(self):
-        users_df = self.rating_df[[Model.ANIME_ID, Model.USER_ID]]
-        current_users_df = users_df.loc[users_df[Model.ANIME_ID].isin(self.ORIGINAL_CATALOG_ANIME_IDS)]
-        current_users_df = current_users_df[Model.USER_ID]
-
-        new_users_df = users_df.loc[users_df[Model.ANIME_ID].isin(self.new_catalog_ids)]
-        new_users_df = new_users_df[Model.USER_ID]
+    # adds up to budget anime to the catalog, greedily picking the anime that reach the most MyAnimeList users not
+    # already reached by the catalog -- when weighted, each anime's new users are scaled by the mean of its min-max
+    # normalized combined similarity score (to the current catalog) and predicted rating
+    # returns the (anime_id, new_users) picks in the order they were chosen
+    @traced('score')
+    def optimize_catalog(self, budget, weighted=False, candidate_ids=None):
+        catalog_ids = Model.ORIGINAL_CATALOG_ANIME_IDS + self.new_catalog_ids
+        sim_df = self.create_sim_df(catalog_ids, sort_by=Model.COMBINED_SCORE)
+        if candidate_ids is None:
+            candidate_ids = sim_df[Model.ANIME_ID].tolist()
+
+        weights = None
+        if weighted:
+            weight_s = (Model._normalize(sim_df[Model.COMBINED_SCORE]) + Model._normalize(sim_df[Model.P_RATING])) / 2
+            weights = dict(zip(sim_df[Model.ANIME_ID].tolist(), weight_s.fillna(0).tolist()))
+
+        picks = CatalogOptimizer(self.user_index).select(budget, catalog_ids, candidate_ids, weights=weights)
+        self.add_animes_to_catalog([anime_id for anime_id, new_users in picks])
+        return picks
+
+    # scales a series to the range [0, 1]
+    @staticmethod
+    def _normalize(values):
+        spread = values.max() - values.min()
+        if not spread > 0:
+            return values * 0 + 1
+        return (values - values.min()) / spread
 
-        shared_users = current_users_df.loc[current_users_df.isin(new_users_df)]
-        current_users = current_users_df.loc[~current_users_df.isin(new_users_df)]
-        new_users = new_users_df.loc[~new_users_df.isin(current_users_df)]
+    # creates a dict showing the number of MyAnimeList members that view the original anime, new anime, or both
+    # distinct -- counts each user once when True, counts rating rows when False, defaults to SHARED_USERS_DISTINCT
+    @traced('score')
+    def calc_shared_users(self, distinct=None):
+        if distinct is None:
+            distinct = Model.SHARED_USERS_DISTINCT
 
-        return {'original': current_users.size, 'shared': shared_users.size, 'new': new_users.size}
+        original, shared, new = self.user_index.split_audience(Model.ORIGINAL_CATALOG_ANIME_IDS, self.new_catalog_ids,
+                                                               distinct=distinct)
+        return {'original': original, 'shared': shared, 'new': new}
 
     # creates the similarity dataframe -- this dataframe combines all of the information available on anime that can be added to catalog
     # this includes rating similarity scores, content similarity scores, calculates combined similarity scores, and shows predicted ratings
-    def create_sim_df(self, anime_ids=None, sort_by=None, ascending=False):
+    # top_k -- when set, only the best top_k rows for the sort column are returned, see last_sim_row_count for the number available
+    # filters -- optional dict narrowing the rows by name, genre, type, episodes or members, see AnimeSearchIndex.mask
+    @traced('score')
+    def create_sim_df(self, anime_ids=None, sort_by=None, ascending=False, top_k=None, filters=None):
         if sort_by is None:
             sort_by = Model.C_SCORE
         if anime_ids is None:
             anime_ids = Model.ORIGINAL_CATALOG_ANIME_IDS
 
+        # reuse the result of an earlier call with the same selection, catalog, sort and filters
+        exclude_ids = Model.ORIGINAL_CATALOG_ANIME_IDS + self.new_catalog_ids
+        cache_key = (tuple(sorted(Counter(anime_ids).items())), frozenset(exclude_ids), sort_by, ascending, top_k,
+                     AnimeSearchIndex.filter_key(filters))
+        cached = self.sim_cache.get(cache_key)
+        if cached is not None:
+            sim_df, self.last_sim_row_count = cached
+            return sim_df.copy()
+
+        sim_df = self._compute_sim_df(anime_ids, exclude_ids, sort_by, ascending, top_k, filters)
+        self.sim_cache.put(cache_key, (sim_df, self.last_sim_row_count), int(sim_df.memory_usage(deep=True).sum()))
+        return sim_df.copy()
+
+    # scores a selection and assembles the similarity dataframe without consulting the cache
+    def _compute_sim_df(self, anime_ids, exclude_ids, sort_by, ascending, top_k, filters=None):
         # find content similarity and rating similarity scores, then calculate the combined similarity score
-        c_score_s = self.content_corr_df.iloc[:, anime_ids].sum(axis=1)
-        r_score_s = self.rating_corr_df.iloc[:, anime_ids].sum(axis=1)
-        combined_score_s = c_score_s * Model.C_SCORE_WEIGHT + r_score_s * Model.R_SCORE_WEIGHT
-
-        # merge sim scores and anime_df data
-        score_df = pd.DataFrame(
-            {Model.C_SCORE: c_score_s, Model.R_SCORE: r_score_s, Model.COMBINED_SCORE: combined_score_s})
-        score_df.index.name = Model.ANIME_ID
-        score_df.reset_index(inplace=True)
-
-        print(score_df)
-
-        temp_df = pd.merge(score_df, self.p_rating_df, on=Model.ANIME_ID)
-        sim_df = pd.merge(temp_df, self.anime_df, on=Model.ANIME_ID)
-
-        sim_df.sort_values([sort_by], ascending=ascending, inplace=True)
-
-        # remove anime that are already in the catalog
-        sim_df = sim_df.loc[~sim_df[Model.ANIME_ID].isin(Model.ORIGINAL_CATALOG_ANIME_IDS + self.new_catalog_ids)]
+        c_scores, r_scores = self._update_scores(anime_ids)
+        rows = self._get_sim_base_rows(len(c_scores))
+        sort_index = self._get_sim_sort_index(rows, c_scores, r_scores)
+
+        # remove anime that are already in the catalog or do not match the filters
+        keep = self.search_index.mask(filters)
+        if keep is None:
+            keep = np.ones(len(self.meta_df), dtype=bool)
+        keep[self._meta_rows(exclude_ids)] = False
+
+        # the sort permutation of the scorable rows is reused until the column changes, so only the excluded rows are
+        # dropped from it before the best top_k rows are taken
+        with TRACER.span('Model.create_sim_df.sort', 'sort') as span:
+            order = sort_index.order(sort_by, ascending)
+            order = order[keep[rows[order]]]
+            self.last_sim_row_count = len(order)
+            if top_k is not None:
+                order = order[:top_k]
+            span.rows = len(order)
+
+        with TRACER.span('Model.create_sim_df.assemble', 'merge') as span:
+            sim_df = sort_index.df.iloc[order].copy()
+            span.rows = len(sim_df)
 
         # round scores and ratings
         sim_df[Model.C_SCORE] = sim_df[Model.C_SCORE].round(2)
@@ -166,26 +481,81 @@ class Model:
             Model.P_RATING
         ]]
 
-    # creates the catalog df using the ORIGINAL_CATALOG_ANIME_IDS and new_catalog_anime_ids lists
+    # brings the running content and rating scores up to date with a selection -- only the columns added to or removed
+    # from the previous selection are summed unless most of the selection changed, and _score_version counts the changes
+    @traced('score')
+    def _update_scores(self, anime_ids):
+        selection = Counter(anime_ids)
+        added = list((selection - self._score_selection).elements())
+        removed = list((self._score_selection - selection).elements())
+
+        if (self._c_scores is None or len(added) + len(removed) >= len(anime_ids)
+                or self._score_updates >= Model.MAX_INCREMENTAL_SCORE_UPDATES):
+            self._c_scores = np.array(sum_columns(self.content_corr_df, list(anime_ids)), dtype=np.float64)
+            self._r_scores = np.array(sum_columns(self.rating_corr_df, list(anime_ids)), dtype=np.float64)
+            self._score_updates = 0
+            self._score_version += 1
+        elif added or removed:
+            for ids, sign in ((added, 1), (removed, -1)):
+                if ids:
+                    self._c_scores += sign * sum_columns(self.content_corr_df, ids).to_numpy(dtype=np.float64)
+                    self._r_scores += sign * sum_columns(self.rating_corr_df, ids).to_numpy(dtype=np.float64)
+            self._score_updates += 1
+            self._score_version += 1
+
+        self._score_selection = selection
+        return self._c_scores, self._r_scores
+
+    # finds the meta_df rows that can be scored once -- anime with a predicted rating and a row in the similarity matrices
+    def _get_sim_base_rows(self, n_matrix_rows):
+        if self._sim_base_rows is None:
+            meta_ids = self.meta_df[Model.ANIME_ID].to_numpy()
+            self._sim_base_rows = np.flatnonzero(self._has_p_rating & (meta_ids >= 0) & (meta_ids < n_matrix_rows))
+        return self._sim_base_rows
+
+    # returns the sort index over the scorable meta_df rows, with the score columns of the current running scores --
+    # the permutations of the metadata columns are kept for as long as the data is loaded and those of the score
+    # columns until the scores change
+    def _get_sim_sort_index(self, rows, c_scores, r_scores):
+        if self._sim_sort_index is None:
+            self._sim_sort_index = SortIndex(self.meta_df.iloc[rows].reset_index(drop=True))
+            self._sim_sort_version = None
+
+        if self._sim_sort_version != self._score_version:
+            meta_ids = self.meta_df[Model.ANIME_ID].to_numpy()[rows]
+            c_score, r_score = c_scores[meta_ids], r_scores[meta_ids]
+            self._sim_sort_index.update({
+                Model.C_SCORE: c_score,
+                Model.R_SCORE: r_score,
+                Model.COMBINED_SCORE: c_score * Model.C_SCORE_WEIGHT + r_score * Model.R_SCORE_WEIGHT
+            })
+            self._sim_sort_version = self._score_version
+        return self._sim_sort_index
+
+    # creates the catalog df using the ORIGINAL_CATALOG_ANIME_IDS and new_catalog_anime_ids lists -- the original anime
+    # show their Aniflix average rating and the new anime, which need a predicted rating, show their predicted rating
+    @traced('merge')
     def create_catalog_df(self, sort_by=None, ascending=False, separate=True):
         if sort_by is None:
             sort_by = Model.ANIME_ID
             ascending = True
 
-        original_catalog_df = self._create_original_catalog_df()
-        new_catalog_df = self._create_new_catalog_df()
-        catalog_df = None
+        original_rows = self._meta_rows(Model.ORIGINAL_CATALOG_ANIME_IDS)
+        new_rows = np.sort(self._meta_rows(self.new_catalog_ids))
+        new_rows = new_rows[self._has_p_rating[new_rows]]
+        is_new = np.concatenate([np.zeros(len(original_rows), dtype=bool), np.ones(len(new_rows), dtype=bool)])
 
-        # sort the original and new anime separately
-        if separate:
-            original_catalog_df.sort_values([sort_by], ascending=ascending, inplace=True)
-            new_catalog_df.sort_values([sort_by], ascending=ascending, inplace=True)
+        catalog_df = self.meta_df.iloc[np.concatenate([original_rows, new_rows])].reset_index(drop=True)
+        catalog_df[Model.P_RATING] = catalog_df[Model.P_RATING].round(2).where(is_new)
+        catalog_df[Model.A_RATING] = catalog_df[Model.A_RATING].where(~is_new)
 
-            catalog_df = pd.concat([original_catalog_df, new_catalog_df], ignore_index=True)
-        # sort the original and new anime together
-        else:
-            catalog_df = pd.concat([original_catalog_df, new_catalog_df], ignore_index=True)
-            catalog_df.sort_values([sort_by], ascending=ascending, inplace=True)
+        with TRACER.span('Model.create_catalog_df.sort', 'sort') as span:
+            catalog_df = catalog_df.sort_values([sort_by], ascending=ascending, kind='stable')
+            # keep the original anime ahead of the new anime, each sorted separately
+            if separate:
+                catalog_df = catalog_df.iloc[np.argsort(is_new[catalog_df.index.to_numpy()], kind='stable')]
+            catalog_df = catalog_df.reset_index(drop=True)
+            span.rows = len(catalog_df)
 
         return catalog_df[[
             Model.ANIME_ID,
@@ -196,20 +566,3 @@ class Model:
             Model.P_RATING,
             Model.A_RATING
         ]]
-
-    # create dataframe using the ORIGINAL_CATALOG_ANIME_IDS list
-    def _create_original_catalog_df(self):
-        original_catalog_df = pd.merge(self.a_rating_df, self.anime_df, on=Model.ANIME_ID)
-        original_catalog_df = original_catalog_df.reindex(columns=original_catalog_df.columns.tolist() + [Model.P_RATING])
-
-        return original_catalog_df
-
-    # create dataframe using the new_catalog_anime_ids list
-    def _create_new_catalog_df(self):
-        new_catalog_df = self.anime_df.loc[(self.anime_df[Model.ANIME_ID].isin(self.new_catalog_ids))]
-        new_catalog_df = pd.merge(new_catalog_df, self.p_rating_df, on=Model.ANIME_ID)
-        new_catalog_df = new_catalog_df.reindex(columns=new_catalog_df.columns.tolist() + [Model.A_RATING])
-
-        new_catalog_df[Model.P_RATING] = new_catalog_df[Model.P_RATING].round(2)
-
-        return new_catalog_df
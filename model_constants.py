@@ -0,0 +1,36 @@
+class ModelConstants:
+
+    # column names, catalog ids and login info shared by the model, view and controller -- kept apart from model.py so
+    # the login screen can be shown before pandas and numpy are imported
+
+    # constant for the test user login info
+    TEST_USERNAME = 'admin'
+    TEST_PASSWORD = '123'
+
+    # column name constants
+    ANIME_ID = 'anime_id'
+    NAME = 'name'
+    GENRE = 'genre'
+    TYPE = 'type'
+    RATING = 'rating'
+    A_RATING = 'a_rating'
+    P_RATING = 'p_rating'
+    USER_ID = 'user_id'
+    C_SCORE = 'c_score'
+    R_SCORE = 'r_score'
+    COMBINED_SCORE = 'combined_score'
+    EPISODES = 'episodes'
+    MEMBERS = 'members'
+    VIEW_COUNT = 'view_count'
+
+    # catalog info constants
+    ORIGINAL_CATALOG_ANIME_IDS = [127, 135, 191, 246, 345, 759, 809, 817, 2376]
+    ANIFLIX_A_RATINGS = [8.34, 8.30, 8.14, 5.05, 4.91, 2.7, 2.47, 7.87, 5.42]
+
+    # checks login info against TEST_USERNAME and TEST_PASSWORD
+    @staticmethod
+    def validate_login_info(login_info):
+        if login_info[0] == ModelConstants.TEST_USERNAME and login_info[1] == ModelConstants.TEST_PASSWORD:
+            return True
+        else:
+            return False
@@ -0,0 +1,51 @@
+import heapq
+
+import numpy as np
+
+
+class CatalogOptimizer:
+
+    # picks catalog additions that reach the most users not already covered by the catalog -- the number of new users
+    # is submodular, so lazy greedy evaluation only re-scores the candidates whose stale upper bound is still the best
+    def __init__(self, user_index):
+        self.user_index = user_index
+
+    # returns up to budget (anime_id, new_users) picks in the order they were chosen
+    # covered_ids -- anime whose users already count as reached, eg. the current catalog
+    # weights -- optional dict of anime_id -> weight multiplying each candidate's number of new users
+    def select(self, budget, covered_ids, candidate_ids, weights=None):
+        covered = self.user_index.users_mask(covered_ids)
+        covered_set = set(covered_ids)
+
+        # every candidate starts with its total audience as an upper bound of its gain
+        heap = []
+        for anime_id in candidate_ids:
+            if anime_id in covered_set:
+                continue
+            weight = 1.0 if weights is None else weights.get(anime_id, 0.0)
+            bound = weight * self._new_users(anime_id, covered)
+            if bound > 0:
+                heap.append((-bound, anime_id, weight))
+        heapq.heapify(heap)
+
+        picks = []
+        while heap and len(picks) < budget:
+            negative_bound, anime_id, weight = heapq.heappop(heap)
+            new_users = self._new_users(anime_id, covered)
+            gain = weight * new_users
+
+            # the candidate is the best pick if its fresh gain still beats every other stale upper bound
+            if not heap or gain >= -heap[0][0]:
+                if gain <= 0:
+                    break
+                picks.append((anime_id, new_users))
+                covered[self.user_index.users_of(anime_id)] = True
+            elif gain > 0:
+                heapq.heappush(heap, (-gain, anime_id, weight))
+
+        return picks
+
+    # number of distinct users of an anime that are not covered yet
+    def _new_users(self, anime_id, covered):
+        users = self.user_index.users_of(anime_id)
+        return len(np.unique(users[~covered[users]]))
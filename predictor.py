@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from similarity import TopKSimilarity
+
+
+class RatingPredictor:
+
+    # number of rating updates allowed before the running sums are recomputed from scratch
+    MAX_INCREMENTAL_UPDATES = 50
+
+    # predicts the Aniflix rating of every anime as the rating-correlation weighted mean of the known Aniflix ratings
+    # -- only positively correlated rated anime contribute and anime with none fall back to the mean known rating
+    # the weighted rating sum and the weight total of every anime are kept, so changing a few known ratings only
+    # gathers the matrix columns of those anime
+    # rating_corr -- dense correlation DataFrame, TopKSimilarity or a matrix with a columns method, eg.
+    # LowRankSimilarity, whose row and column positions are anime ids
+    def __init__(self, rating_corr):
+        self.rating_corr = rating_corr
+        self.n_rows = rating_corr.shape[0] if isinstance(rating_corr, pd.DataFrame) else rating_corr.n_rows
+        self.ratings = {}
+        self._weighted = np.zeros(self.n_rows)
+        self._totals = np.zeros(self.n_rows)
+        self._updates = 0
+
+    # sets the known Aniflix rating of some anime, a rating of None forgets it -- anime outside the matrix are ignored
+    def update(self, ratings):
+        changed = {int(anime_id): rating for anime_id, rating in ratings.items()
+                   if 0 <= anime_id < self.n_rows and self.ratings.get(int(anime_id)) != rating}
+        if not changed:
+            return
+
+        old = {anime_id: self.ratings[anime_id] for anime_id in changed if anime_id in self.ratings}
+        for anime_id, rating in changed.items():
+            if rating is None:
+                self.ratings.pop(anime_id, None)
+            else:
+                self.ratings[anime_id] = float(rating)
+
+        if len(changed) >= len(self.ratings) or self._updates >= RatingPredictor.MAX_INCREMENTAL_UPDATES:
+            self._weighted, self._totals = self._weighted_sums(self.ratings)
+            self._updates = 0
+        else:
+            new = {anime_id: self.ratings[anime_id] for anime_id in changed if anime_id in self.ratings}
+            for part, sign in ((old, -1), (new, 1)):
+                if part:
+                    weighted, totals = self._weighted_sums(part)
+                    self._weighted += sign * weighted
+                    self._totals += sign * totals
+            self._updates += 1
+
+    # recomputes the running sums from scratch, eg. after the correlation matrix changed
+    def refresh(self):
+        self._weighted, self._totals = self._weighted_sums(self.ratings)
+        self._updates = 0
+
+    # returns the predicted rating of every anime id below n_rows
+    def predict(self):
+        if not self.ratings:
+            return np.full(self.n_rows, np.nan)
+        fallback = np.mean(list(self.ratings.values()))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self._totals > 0, self._weighted / self._totals, fallback)
+
+    # sums the positive correlations with the given anime, and the same correlations weighted by the anime's ratings
+    def _weighted_sums(self, ratings):
+        anime_ids = np.fromiter(ratings.keys(), dtype=np.intp, count=len(ratings))
+        values = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+        if len(anime_ids) == 0:
+            return np.zeros(self.n_rows), np.zeros(self.n_rows)
+
+        if isinstance(self.rating_corr, pd.DataFrame):
+            weights = np.maximum(np.nan_to_num(self.rating_corr.iloc[:, anime_ids].to_numpy(dtype=np.float64)), 0)
+            return weights @ values, weights.sum(axis=1)
+
+        if isinstance(self.rating_corr, TopKSimilarity):
+            # only the neighbour lists of the rated anime are read, other correlations count as zero
+            rows = self.rating_corr.indices[anime_ids].ravel()
+            weights = np.maximum(self.rating_corr.values[anime_ids].astype(np.float64), 0)
+            return (np.bincount(rows, weights=(weights * values[:, None]).ravel(), minlength=self.n_rows),
+                    np.bincount(rows, weights=weights.ravel(), minlength=self.n_rows))
+
+        weights = np.maximum(self.rating_corr.columns(anime_ids), 0)
+        return weights @ values, weights.sum(axis=1)
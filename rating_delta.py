@@ -0,0 +1,366 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class IncrementalCorrelation:
+
+    # number of columns recomputed from the ratings to check the loaded matrix, and the largest difference accepted
+    CHECK_COLUMNS = 3
+    CHECK_TOLERANCE = 1e-6
+
+    # pearson correlation between the rating columns of anime, as computed by build_similarity.py, that follows new
+    # ratings exactly -- the loaded matrix is kept together with the sufficient statistics behind it: the rating sum
+    # and sum of squares of every anime, the number of users, and the rows before and after of every user whose ratings
+    # changed since. a column is computed on demand as (G - s s[j] / n) / (d d[j]) with d = sqrt(q - s ** 2 / n),
+    # where the gram matrix G is the loaded matrix scaled back by the loaded statistics plus the changed users' rows
+    # only scored ratings (above 0) count and the users are those with at least one, see
+    # SimilarityBuilder.rating_observations
+    # matrix -- dense (n x n) correlation DataFrame or ndarray, sums and squares -- per anime rating sum and sum of
+    # squares over the n_users users the matrix was built from
+    def __init__(self, matrix, sums, squares, n_users):
+        if isinstance(matrix, pd.DataFrame):
+            matrix = matrix.to_numpy(copy=False)
+        self.matrix = matrix
+        self.n_rows = matrix.shape[0]
+
+        self._base_sums = np.asarray(sums, dtype=np.float64)
+        self._base_n = n_users
+        self._base_scale = IncrementalCorrelation._deviations(sums, squares, n_users)
+        self.sums = self._base_sums.copy()
+        self.squares = np.asarray(squares, dtype=np.float64).copy()
+        self.n_users = n_users
+        self._scale_cache = self._base_scale
+
+        # changed users' scored rows as (anime ids, ratings) before their first change and now
+        self._old_rows = {}
+        self._new_rows = {}
+        self._entries = None
+
+    # builds the statistics from a user index holding ratings, see UserIndex.ratings -- repeated ratings of a user for
+    # the same anime are summed before squaring, as SparseRows does. raises ValueError when the matrix is not the
+    # correlation of those ratings, see check
+    @classmethod
+    def from_user_index(cls, matrix, user_index):
+        n = matrix.shape[0]
+        row_anime = np.repeat(np.arange(user_index.n_anime, dtype=np.int64), np.diff(user_index.indptr))
+        scored = user_index.ratings > 0
+        users = user_index.user_indices[scored]
+        pairs, inverse = np.unique(row_anime[scored] * user_index.n_users + users, return_inverse=True)
+        pair_sums = np.bincount(inverse, weights=user_index.ratings[scored], minlength=len(pairs))
+        pair_anime = pairs // user_index.n_users
+        correlation = cls(matrix, np.bincount(pair_anime, weights=pair_sums, minlength=n)[:n],
+                          np.bincount(pair_anime, weights=pair_sums ** 2, minlength=n)[:n], len(np.unique(users)))
+        correlation.check(user_index)
+        return correlation
+
+    # recomputes a few columns from the scored ratings in the user index and raises ValueError when the loaded matrix
+    # differs -- the statistics only describe a matrix that build_similarity.py computed from the same ratings, a
+    # matrix made by other means or from other ratings would be corrupted by the updates
+    def check(self, user_index, n_columns=None):
+        if n_columns is None:
+            n_columns = IncrementalCorrelation.CHECK_COLUMNS
+        varying = np.flatnonzero(self._base_scale > 0)
+        if len(varying) == 0:
+            return
+        column_ids = varying[np.linspace(0, len(varying) - 1, min(n_columns, len(varying))).astype(np.intp)]
+        expected = np.column_stack([self._exact_column(user_index, column_id) for column_id in column_ids])
+        error = float(np.abs(self._base_columns(column_ids) - expected).max())
+        if error > IncrementalCorrelation.CHECK_TOLERANCE:
+            raise ValueError("the rating correlation matrix differs from the correlation of the loaded ratings by "
+                             "%.3g, rebuild it with build_similarity.py before adding ratings" % error)
+
+    # the correlation of one anime with every anime, computed from the rows of the users that scored it
+    def _exact_column(self, user_index, column_id):
+        users, ratings = user_index.users_of(column_id), user_index.ratings_of(column_id)
+        users, inverse = np.unique(users[ratings > 0], return_inverse=True)
+        column_values = np.bincount(inverse, weights=ratings[ratings > 0], minlength=len(users))
+
+        row_users, row_anime, row_ratings = user_index.rows_of_users(users)
+        scored = (row_ratings > 0) & (row_anime < self.n_rows)
+        weights = row_ratings[scored] * column_values[np.searchsorted(users, row_users[scored])]
+        gram = np.bincount(row_anime[scored], weights=weights, minlength=self.n_rows)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = ((gram - self._base_sums * self._base_sums[column_id] / self._base_n) /
+                    (self._base_scale * self._base_scale[column_id]))
+        return np.nan_to_num(corr, nan=0.0, posinf=0.0, neginf=0.0)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + 3 * self._base_sums.nbytes
+
+    # adds the rows of changed users -- old_rows and new_rows map a dense user index to its (anime ids, ratings) before
+    # and after the new ratings, users gaining their first scored rating are counted as new users
+    def apply(self, old_rows, new_rows):
+        old_rows = {user: IncrementalCorrelation._scored(*row) for user, row in old_rows.items()}
+        new_rows = {user: IncrementalCorrelation._scored(*row) for user, row in new_rows.items()}
+        for rows, sign in ((old_rows, -1), (new_rows, 1)):
+            for anime_ids, ratings in rows.values():
+                row_anime, inverse = np.unique(anime_ids, return_inverse=True)
+                row_sums = np.bincount(inverse, weights=ratings, minlength=len(row_anime))
+                self.sums[row_anime] += sign * row_sums
+                self.squares[row_anime] += sign * row_sums ** 2
+                self.n_users += sign * (len(anime_ids) > 0)
+        # a user changed for the first time keeps the row the matrix was built from, empty for users added since
+        for user in new_rows:
+            self._old_rows.setdefault(user, old_rows.get(user, (np.zeros(0, dtype=np.intp), np.zeros(0))))
+        self._new_rows.update(new_rows)
+        self._scale_cache = None
+        self._entries = None
+
+    # returns the selected columns as an (n_rows x len(column_ids)) array
+    def columns(self, column_ids):
+        column_ids, inverse = np.unique(np.asarray(column_ids, dtype=np.intp), return_inverse=True)
+        base = self._base_columns(column_ids)
+        gram = (base * self._base_scale[:, None] * self._base_scale[column_ids] +
+                np.outer(self._base_sums, self._base_sums[column_ids]) / self._base_n)
+        if self._new_rows:
+            gram += self._gram_change(column_ids)
+
+        scale = self._current_deviations()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = (gram - np.outer(self.sums, self.sums[column_ids]) / self.n_users) / np.outer(scale, scale[column_ids])
+        return np.nan_to_num(corr, nan=0.0, posinf=0.0, neginf=0.0)[:, inverse]
+
+    def sum_columns(self, column_ids):
+        return self.columns(column_ids).sum(axis=1)
+
+    # the selected columns of the loaded matrix, read as rows since the matrix is symmetric unless it is stored
+    # column-major, eg. a DataFrame parsed from csv
+    def _base_columns(self, column_ids):
+        if self.matrix.flags.f_contiguous and not self.matrix.flags.c_contiguous:
+            block = self.matrix[:, column_ids]
+        else:
+            block = self.matrix[column_ids].T
+        return np.nan_to_num(np.asarray(block, dtype=np.float64), nan=0.0)
+
+    # the scored entries of a row
+    @staticmethod
+    def _scored(anime_ids, ratings):
+        scored = ratings > 0
+        return anime_ids[scored], ratings[scored]
+
+    # the square root of each anime's sum of squared deviations, (n - 1) times its variance
+    @staticmethod
+    def _deviations(sums, squares, n_users):
+        sums = np.asarray(sums, dtype=np.float64)
+        return np.sqrt(np.maximum(np.asarray(squares, dtype=np.float64) - sums ** 2 / n_users, 0))
+
+    def _current_deviations(self):
+        if self._scale_cache is None:
+            self._scale_cache = IncrementalCorrelation._deviations(self.sums, self.squares, self.n_users)
+        return self._scale_cache
+
+    # the change of the selected gram matrix columns -- the new rows of the changed users added and their old rows
+    # taken away, each row being one user's (anime, rating) entries
+    def _gram_change(self, column_ids):
+        if self._entries is None:
+            rows = list(self._old_rows.values()) + list(self._new_rows.values())
+            signs = np.concatenate([np.full(len(self._old_rows), -1.0), np.ones(len(self._new_rows))])
+            entry_rows = np.repeat(np.arange(len(rows)), [len(anime_ids) for anime_ids, ratings in rows])
+            self._entries = (entry_rows, np.concatenate([anime_ids for anime_ids, ratings in rows]).astype(np.intp),
+                             np.concatenate([ratings for anime_ids, ratings in rows]).astype(np.float64),
+                             signs[entry_rows], len(rows))
+        entry_rows, entry_anime, entry_values, entry_signs, n_rows = self._entries
+
+        # the selected columns of every changed row, then each row's entries weighted by them
+        lookup = np.full(self.n_rows, -1, dtype=np.intp)
+        lookup[column_ids] = np.arange(len(column_ids))
+        selected = lookup[entry_anime] >= 0
+        dense = np.zeros((n_rows, len(column_ids)))
+        np.add.at(dense, (entry_rows[selected], lookup[entry_anime[selected]]), entry_values[selected])
+
+        weights = entry_signs * entry_values
+        return np.column_stack([np.bincount(entry_anime, weights=weights * dense[entry_rows, j], minlength=self.n_rows)
+                                for j in range(len(column_ids))])
+
+
+# recomputes the rating count and mean user rating of the given anime from the ratings in the user index, as
+# RatingStream.build computes them, and returns the updated stats dataframe
+def update_rating_stats(stats_df, user_index, anime_ids, anime_column):
+    anime_ids = np.unique(np.asarray(anime_ids, dtype=np.int64))
+    counts = np.zeros(len(anime_ids), dtype=np.int64)
+    means = np.full(len(anime_ids), np.nan)
+    for i, anime_id in enumerate(anime_ids.tolist()):
+        ratings = user_index.ratings_of(anime_id)
+        counts[i] = len(ratings)
+        scored = ratings[ratings > 0]
+        if len(scored):
+            means[i] = scored.astype(np.float64).sum() / len(scored)
+
+    stats_df = stats_df.set_index(anime_column)
+    updated_df = pd.DataFrame({'rating_count': counts, 'mean_user_rating': means},
+                              index=pd.Index(anime_ids.astype(np.int32), name=anime_column))
+    stats_df = pd.concat([stats_df.drop(anime_ids, errors='ignore'), updated_df]).sort_index()
+    return stats_df.reset_index()
+
+
+# compares a model that ingested the rating deltas with the same data derived from scratch -- the user index, rating
+# aggregates, rating correlations, genre view counts and predicted ratings of both are compared
+# returns the largest differences, all zero up to rounding when the incremental path is exact
+def verify(model, delta_df, chunk_columns=256):
+    from build_similarity import SimilarityBuilder
+    from compact import GENRE_MASK
+    from genre_views import GenreViews
+    from model import Model
+    from predictor import RatingPredictor
+    from user_index import UserIndex
+
+    rating_df = pd.concat([model.data_store.load_table(Model.RATING_PATH, dtype=Model.RATING_DTYPES), delta_df],
+                          ignore_index=True)
+    full_index = UserIndex.from_ratings(rating_df[Model.ANIME_ID].to_numpy(), rating_df[Model.USER_ID].to_numpy(),
+                                        rating_df[Model.RATING].to_numpy())
+    index = model.user_index
+
+    # entries compared by user id since users first seen in a delta are numbered after the loaded users
+    n_anime = max(index.n_anime, full_index.n_anime)
+    same_index = (np.array_equal(np.pad(index.indptr, (0, n_anime - index.n_anime), mode='edge'),
+                                 np.pad(full_index.indptr, (0, n_anime - full_index.n_anime), mode='edge')) and
+                  np.array_equal(index.user_ids[index.user_indices], full_index.user_ids[full_index.user_indices]) and
+                  np.array_equal(index.ratings, full_index.ratings))
+
+    stats_df = update_rating_stats(model.rating_stats_df.iloc[:0], full_index,
+                                   np.flatnonzero(np.diff(full_index.indptr)), Model.ANIME_ID)
+    model_stats_df = model.rating_stats_df
+    same_stats = (np.array_equal(stats_df[Model.ANIME_ID].to_numpy(), model_stats_df[Model.ANIME_ID].to_numpy()) and
+                  np.array_equal(stats_df['rating_count'].to_numpy(), model_stats_df['rating_count'].to_numpy()) and
+                  np.allclose(stats_df['mean_user_rating'].to_numpy(), model_stats_df['mean_user_rating'].to_numpy(),
+                              equal_nan=True))
+
+    n = model.rating_corr_df.n_rows
+    observations = SimilarityBuilder.rating_observations(rating_df, n)
+    npy_path = os.path.join(os.path.dirname(Model.RATING_PATH), 'rating_correlation.verify.npy')
+    try:
+        full_corr = SimilarityBuilder(workers=1).correlate(observations, npy_path)
+        corr_error = 0.0
+        for start in range(0, n, chunk_columns):
+            column_ids = np.arange(start, min(start + chunk_columns, n))
+            corr_error = max(corr_error, float(np.abs(model.rating_corr_df.columns(column_ids) -
+                                                      full_corr[:, column_ids]).max()))
+
+        predictor = RatingPredictor(pd.DataFrame(full_corr, copy=False))
+        predictor.update(model.rating_predictor.ratings)
+        p_rating_error = float(np.nanmax(np.abs(predictor.predict() - model.rating_predictor.predict())))
+        del full_corr, predictor
+    finally:
+        os.remove(npy_path)
+
+    genre_views = GenreViews(full_index, model.meta_df[Model.ANIME_ID].to_numpy(),
+                             model.meta_df[GENRE_MASK].to_numpy(), model.genres)
+    catalog_ids = Model.ORIGINAL_CATALOG_ANIME_IDS + model.new_catalog_ids
+    return {
+        'same_user_index': bool(same_index),
+        'same_rating_stats': bool(same_stats),
+        'max_correlation_error': corr_error,
+        'max_p_rating_error': p_rating_error,
+        'same_global_views': bool(np.array_equal(genre_views.global_views(), model.genre_views.global_views())),
+        'same_catalog_views': bool(np.array_equal(genre_views.catalog_views(catalog_ids),
+                                                  model.genre_views.catalog_views(catalog_ids)))
+    }
+
+
+# folds the ratings a model added since its matrices were built into the stored data, so later loads read the stored
+# matrix, the memory-mapped neighbour lists and the factors again instead of replaying the delta file -- the rating
+# correlation is written from the model's columns, which equal what build_similarity.py computes from all ratings,
+# the stored neighbour lists and rating factors are rebuilt, then the rows are appended to clean_rating.csv and the
+# delta file is removed
+# model -- a model holding the dense rating correlation, delta_df -- every row it added, ie. replayed_rating_df and
+# the rows returned by ingest_ratings since
+def compact(model, delta_df, chunk_columns=256):
+    from build_similarity import SimilarityBuilder
+    from model import Model
+    from similarity import TopKSimilarity
+
+    # the delta file is either replayed by load_data or written after it, by ingest_ratings
+    if os.path.exists(Model.RATING_DELTA_PATH) and model.replayed_rating_df is None and model.last_ingest_report is None:
+        raise ValueError("the ratings in %s were not added to the model" % Model.RATING_DELTA_PATH)
+    # a dense model holds an IncrementalCorrelation once it added ratings -- not checked with isinstance, since this
+    # module is also run as __main__
+    if len(delta_df) and (model.similarity_k is not None or model.low_rank or
+                          isinstance(model.rating_corr_df, pd.DataFrame)):
+        raise ValueError("ratings can only be compacted from a model holding the dense rating correlation")
+    data_store = model.data_store
+
+    if len(delta_df):
+        correlation = model.rating_corr_df
+        n = correlation.n_rows
+        npy_path = os.path.splitext(Model.RATING_CORR_PATH)[0] + '.npy'
+        matrix = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.float64, shape=(n, n))
+        # the matrix is symmetric, so each block of columns is written as rows
+        for start in range(0, n, chunk_columns):
+            column_ids = np.arange(start, min(start + chunk_columns, n))
+            matrix[column_ids] = correlation.columns(column_ids).T
+        matrix.flush()
+        if os.path.exists(Model.RATING_CORR_PATH):
+            SimilarityBuilder.write_matrix_csv(matrix, Model.RATING_CORR_PATH)
+        k = data_store.neighbours_k(Model.RATING_CORR_PATH)
+        if k is not None:
+            top_k = TopKSimilarity.from_dense(matrix, k)
+            data_store.save_neighbours(Model.RATING_CORR_PATH, top_k.indices, top_k.values)
+        del matrix
+        data_store.adopt_matrix(Model.RATING_CORR_PATH, npy_path, [str(i) for i in range(n)])
+
+        stored = data_store.is_fresh(Model.RATING_PATH)
+        rating_df = pd.concat([data_store.load_table(Model.RATING_PATH, dtype=Model.RATING_DTYPES), delta_df],
+                              ignore_index=True)
+        if os.path.exists(Model.RATING_FACTORS_PATH):
+            rank = np.load(Model.RATING_FACTORS_PATH).shape[1]
+            np.save(Model.RATING_FACTORS_PATH,
+                    SimilarityBuilder.factorize(SimilarityBuilder.rating_observations(rating_df, n), rank))
+        if os.path.exists(Model.RATING_PATH):
+            columns = pd.read_csv(Model.RATING_PATH, nrows=0).columns
+            delta_df.reindex(columns=columns).to_csv(Model.RATING_PATH, mode='a', header=False, index=False)
+        else:
+            rating_df.to_csv(Model.RATING_PATH, index=False)
+        if stored:
+            data_store.convert_table(Model.RATING_PATH, dtype=Model.RATING_DTYPES)
+
+    if os.path.exists(Model.RATING_DELTA_PATH):
+        os.remove(Model.RATING_DELTA_PATH)
+
+
+# adds new ratings to the append-only delta file replayed by Model.load_data, so the correlation matrices do not need
+# to be rebuilt -- only the rows the model accepts are appended. --compact folds the delta file into the stored data
+if __name__ == '__main__':
+    import time
+
+    from model import Model
+
+    parser = argparse.ArgumentParser(description="Ingests new ratings without rebuilding the derived data.")
+    parser.add_argument('ratings', nargs='?', help="csv file of new anime_id, user_id, rating rows")
+    parser.add_argument('--verify', action='store_true', help="compare the result with a rebuild from scratch")
+    parser.add_argument('--compact', action='store_true',
+                        help="write the rating correlation, neighbour lists and factors with the new ratings added and "
+                             "clear the delta file")
+    args = parser.parse_args()
+    if args.ratings is None and not args.compact:
+        parser.error("give a ratings file, --compact or both")
+
+    model = Model()
+    model.load_data()
+    added_dfs = [] if model.replayed_rating_df is None else [model.replayed_rating_df]
+
+    if args.ratings is not None:
+        new_df = pd.read_csv(args.ratings, dtype=Model.RATING_DTYPES)
+        started = time.perf_counter()
+        accepted_df = model.ingest_ratings(new_df)
+        seconds = time.perf_counter() - started
+        accepted_df.to_csv(Model.RATING_DELTA_PATH, mode='a', index=False,
+                           header=not os.path.exists(Model.RATING_DELTA_PATH))
+        added_dfs.append(accepted_df)
+        print("ingested %d of %d rows in %.3fs, %s" % (len(accepted_df), len(new_df), seconds, model.last_ingest_report))
+
+        if args.verify:
+            all_delta_df = pd.read_csv(Model.RATING_DELTA_PATH, dtype=Model.RATING_DTYPES)
+            for check, value in verify(model, all_delta_df).items():
+                print("%-22s %s" % (check, value))
+
+    if args.compact:
+        if not added_dfs:
+            added_dfs.append(pd.DataFrame(columns=list(Model.RATING_DTYPES)))
+        delta_df = pd.concat(added_dfs, ignore_index=True)
+        started = time.perf_counter()
+        compact(model, delta_df)
+        print("compacted %d rows in %.3fs" % (len(delta_df), time.perf_counter() - started))
@@ -0,0 +1,159 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from compact import compact_rating_df
+from user_index import UserIndex
+
+
+class RatingStream:
+
+    # default memory budget for one chunk of rating rows
+    CHUNK_BYTES = 64 * 2 ** 20
+
+    # builds the anime -> user index and per-anime rating aggregates from the ratings table in two passes over fixed
+    # size chunks, so the full ratings table is never held in memory -- the first pass counts ratings per anime and
+    # collects the distinct users, the second scatters each chunk's user indices into the preallocated index
+    # chunk_bytes -- memory budget of one chunk of parsed rating columns, defaults to CHUNK_BYTES
+    def __init__(self, data_store, csv_path, dtype, anime_column, user_column, rating_column, chunk_bytes=None):
+        self.data_store = data_store
+        self.csv_path = csv_path
+        self.dtype = dtype
+        self.anime_column = anime_column
+        self.user_column = user_column
+        self.rating_column = rating_column
+        self.columns = [anime_column, user_column, rating_column]
+        self.chunk_bytes = RatingStream.CHUNK_BYTES if chunk_bytes is None else chunk_bytes
+
+        row_bytes = sum(np.dtype(dtype[column]).itemsize for column in self.columns)
+        self.chunk_rows = max(1, self.chunk_bytes // row_bytes)
+
+        # filled in by build
+        self.n_rows = 0
+        self.n_chunks = 0
+        self.peak_bytes = 0
+        self.index_bytes = 0
+
+    # reads the rating columns one compacted chunk at a time
+    def _chunks(self):
+        for chunk in self.data_store.iter_table(self.csv_path, self.columns, self.chunk_rows, dtype=self.dtype):
+            yield compact_rating_df(chunk, [self.anime_column, self.user_column], self.rating_column)
+
+    # records the memory held while a chunk is processed -- the resident arrays plus the chunk itself and the
+    # temporaries of about one index per row made from it
+    def _track(self, resident, chunk):
+        chunk_bytes = int(chunk.memory_usage(index=False).sum()) + len(chunk) * np.dtype(np.intp).itemsize
+        self.peak_bytes = max(self.peak_bytes, sum(array.nbytes for array in resident) + chunk_bytes)
+
+    # returns the UserIndex of the ratings, holding each entry's rating, and a dataframe of each rated anime's rating
+    # count and mean user rating
+    # progress -- optional callable receiving a message and the fraction of the two passes completed
+    def build(self, progress=None):
+        self.n_rows, self.n_chunks, self.peak_bytes = 0, 0, 0
+
+        # first pass -- ratings per anime, scored ratings (above 0) per anime and their sum, and the distinct users
+        counts = np.zeros(0, dtype=np.int64)
+        scored_counts = np.zeros(0, dtype=np.int64)
+        rating_sums = np.zeros(0, dtype=np.float64)
+        user_ids = np.zeros(0, dtype=np.int32)
+        for chunk in self._chunks():
+            anime_ids = chunk[self.anime_column].to_numpy()
+            ratings = chunk[self.rating_column].to_numpy()
+            n_anime = max(len(counts), int(anime_ids.max()) + 1 if len(anime_ids) else 0)
+            counts, scored_counts, rating_sums = (np.pad(array, (0, n_anime - len(array)))
+                                                  for array in (counts, scored_counts, rating_sums))
+
+            scored = ratings > 0
+            counts += np.bincount(anime_ids, minlength=n_anime)
+            scored_counts += np.bincount(anime_ids[scored], minlength=n_anime)
+            rating_sums += np.bincount(anime_ids[scored], weights=ratings[scored], minlength=n_anime)
+            user_ids = np.union1d(user_ids, chunk[self.user_column].to_numpy())
+
+            self.n_rows += len(chunk)
+            self.n_chunks += 1
+            self._track([counts, scored_counts, rating_sums, user_ids], chunk)
+            if progress is not None:
+                progress("Counting ratings (%d rows)" % self.n_rows, 0.0)
+
+        # second pass -- each chunk's rows are placed after the rows of earlier chunks for the same anime, so every
+        # anime's users stay in file order exactly as UserIndex.from_ratings orders them
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        user_indices = np.empty(int(indptr[-1]), dtype=np.int32)
+        ratings = np.empty(int(indptr[-1]), dtype=np.int8)
+        cursor = indptr[:-1].copy()
+        n_rows = 0
+        for chunk in self._chunks():
+            anime_ids = chunk[self.anime_column].to_numpy()
+            if len(anime_ids) and int(anime_ids.max()) >= len(counts):
+                raise ValueError(self.csv_path + " changed while it was being read")
+
+            order = np.argsort(anime_ids, kind='stable')
+            sorted_ids = anime_ids[order]
+            chunk_counts = np.bincount(sorted_ids, minlength=len(counts))
+            chunk_starts = np.concatenate([[0], np.cumsum(chunk_counts)[:-1]])
+            ranks = np.arange(len(sorted_ids)) - chunk_starts[sorted_ids]
+            user_indices[cursor[sorted_ids] + ranks] = np.searchsorted(user_ids, chunk[self.user_column].to_numpy()[order])
+            ratings[cursor[sorted_ids] + ranks] = chunk[self.rating_column].to_numpy()[order]
+            cursor += chunk_counts
+
+            n_rows += len(chunk)
+            self._track([counts, scored_counts, rating_sums, user_ids, indptr, user_indices, ratings, cursor], chunk)
+            if progress is not None:
+                progress("Indexing users (%d of %d rows)" % (n_rows, self.n_rows), 0.5 + 0.5 * n_rows / max(1, self.n_rows))
+
+        if n_rows != self.n_rows:
+            raise ValueError(self.csv_path + " changed while it was being read")
+
+        user_index = UserIndex(indptr, user_indices, user_ids, ratings)
+        self.index_bytes = user_index.nbytes
+
+        rated = np.flatnonzero(counts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_ratings = rating_sums[rated] / scored_counts[rated]
+        stats_df = pd.DataFrame({
+            self.anime_column: rated.astype(np.int32),
+            'rating_count': counts[rated],
+            'mean_user_rating': np.where(scored_counts[rated] > 0, mean_ratings, np.nan)
+        })
+        return user_index, stats_df
+
+    # summary of the last build
+    def report(self):
+        return {
+            'rows': self.n_rows,
+            'chunks': self.n_chunks,
+            'chunk_rows': self.chunk_rows,
+            'peak_bytes': self.peak_bytes,
+            'index_bytes': self.index_bytes
+        }
+
+
+# streams the ratings into a user index and reports the memory used
+if __name__ == '__main__':
+    import time
+    import tracemalloc
+
+    from data_store import DataStore
+    from model import Model
+
+    parser = argparse.ArgumentParser(description="Builds the user index from the ratings in chunks and reports memory use.")
+    parser.add_argument('--chunk-mb', type=float, default=RatingStream.CHUNK_BYTES / 2 ** 20,
+                        help="memory budget of one chunk of ratings")
+    args = parser.parse_args()
+
+    stream = RatingStream(DataStore(), Model.RATING_PATH, Model.RATING_DTYPES, Model.ANIME_ID, Model.USER_ID,
+                          Model.RATING, chunk_bytes=int(args.chunk_mb * 2 ** 20))
+    tracemalloc.start()
+    start = time.perf_counter()
+    stream.build()
+    seconds = time.perf_counter() - start
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    report = stream.report()
+    print("rows             %d in %d chunks of %d" % (report['rows'], report['chunks'], report['chunk_rows']))
+    print("user index       %.2f MB" % (report['index_bytes'] / 2 ** 20))
+    print("estimated peak   %.2f MB" % (report['peak_bytes'] / 2 ** 20))
+    print("traced peak      %.2f MB" % (traced_peak / 2 ** 20))
+    print("seconds          %.2f" % seconds)
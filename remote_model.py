@@ -0,0 +1,82 @@
+import json
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from model_constants import ModelConstants
+
+
+class RemoteModel:
+
+    # thin client with the Model methods used by the Controller -- queries are answered by a ScoringServer while the
+    # catalog being edited is kept locally and sent with every query
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.new_catalog_ids = []
+        self.last_sim_row_count = 0
+
+    def _get(self, path, **params):
+        params = {name: value for name, value in params.items() if value is not None}
+        with urlopen(self.url + path + '?' + urlencode(params)) as response:
+            return json.loads(response.read().decode())
+
+    # decodes a dataframe sent by the server -- pandas is only imported with the first decoded response, so the login
+    # frame is still shown before it is loaded in thin client mode, and the model and server modules are never imported
+    @staticmethod
+    def _to_df(data):
+        from df_json import json_to_df
+        return json_to_df(data)
+
+    def _catalog_param(self):
+        return ','.join(str(anime_id) for anime_id in self.new_catalog_ids)
+
+    # checks that the server is reachable -- the data is already loaded by the server
+    def load_data(self, progress=None):
+        if progress is not None:
+            progress("Connecting to " + self.url, 0.0)
+        self._get('/health')
+        if progress is not None:
+            progress("Connected", 1.0)
+
+    @staticmethod
+    def validate_login_info(login_info):
+        return ModelConstants.validate_login_info(login_info)
+
+    def add_animes_to_catalog(self, anime_ids):
+        for anime_id in anime_ids:
+            if anime_id not in self.new_catalog_ids:
+                self.new_catalog_ids.append(anime_id)
+
+    def remove_animes_from_catalog(self, anime_ids):
+        for anime_id in anime_ids:
+            if anime_id in self.new_catalog_ids:
+                self.new_catalog_ids.remove(anime_id)
+
+    def reset_catalog(self):
+        self.new_catalog_ids = []
+
+    def optimize_catalog(self, budget, weighted=False):
+        picks = self._get('/optimize', catalog=self._catalog_param(), budget=budget, weighted=int(weighted))['picks']
+        self.add_animes_to_catalog([anime_id for anime_id, new_users in picks])
+        return [tuple(pick) for pick in picks]
+
+    def get_top_genre_views(self, head=5, catalog=False):
+        return self._to_df(self._get('/genre_views', catalog=self._catalog_param(), head=head,
+                                     catalog_only=int(catalog)))
+
+    def calc_shared_users(self, distinct=None):
+        return self._get('/shared_users', catalog=self._catalog_param(),
+                         distinct=None if distinct is None else int(distinct))
+
+    def get_filter_options(self):
+        return self._get('/filter_options')
+
+    def create_sim_df(self, anime_ids=None, sort_by=None, ascending=False, top_k=None, filters=None):
+        ids = None if anime_ids is None else ','.join(str(anime_id) for anime_id in anime_ids)
+        result = self._get('/sim', ids=ids, catalog=self._catalog_param(), sort_by=sort_by, ascending=int(ascending),
+                           top_k=top_k, filters=json.dumps(filters) if filters else None)
+        self.last_sim_row_count = result['row_count']
+        return self._to_df(result)
+
+    def create_catalog_df(self, sort_by=None, ascending=False):
+        return self._to_df(self._get('/catalog', catalog=self._catalog_param(), sort_by=sort_by,
+                                     ascending=int(ascending)))
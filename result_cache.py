@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class ResultCache:
+
+    # least recently used cache bounded by both a number of entries and a total size in bytes
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    # returns the cached value for a key, or None on a miss
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    # stores a value, evicting the least recently used entries until both limits are met -- values larger than
+    # max_bytes are not cached
+    def put(self, key, value, nbytes):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if nbytes > self.max_bytes or self.max_entries <= 0:
+            return
+
+        self._entries[key] = (value, nbytes)
+        self._bytes += nbytes
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._bytes -= self._entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    # hit/miss counters and current size, used to size the cache
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes
+        }
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from df_json import df_to_json
+from model import Model
+
+
+# parses a comma separated list of anime ids from a query parameter
+def parse_ids(params, name):
+    values = params.get(name, [''])[0]
+    return [int(anime_id) for anime_id in values.split(',') if anime_id != '']
+
+
+class ScoringServer:
+
+    # default address -- the server only listens on localhost
+    HOST = '127.0.0.1'
+    PORT = 8765
+
+    # serves similarity, catalog and shared user queries from one warm model as json over http
+    # -- model calls run one at a time on a single thread so the model's scoring caches are reused across requests,
+    # and concurrent identical queries share one computation
+    def __init__(self, model, host=None, port=None):
+        self.model = model
+        self.host = host or ScoringServer.HOST
+        self.port = ScoringServer.PORT if port is None else port
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = {}
+        self.coalesced = 0
+        self.server = None
+
+        self.routes = {
+            '/health': self._health,
+            '/sim': self._sim,
+            '/catalog': self._catalog,
+            '/shared_users': self._shared_users,
+            '/genre_views': self._genre_views,
+            '/filter_options': self._filter_options,
+            '/optimize': self._optimize,
+            '/stats': self._stats
+        }
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    # reads one GET request, answers it and closes the connection
+    async def _handle_connection(self, reader, writer):
+        status, body = 200, None
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            url = urlsplit(request_line[1] if len(request_line) > 1 else '')
+            handler = self.routes.get(url.path)
+            if request_line[:1] != ['GET'] or handler is None:
+                status, body = 404, {'error': 'not found'}
+            else:
+                body = await self._query(url.path, parse_qs(url.query), handler)
+        except (ValueError, KeyError) as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            logging.error("Exception occurred", exc_info=True)
+            status, body = 500, {'error': str(e)}
+
+        payload = json.dumps(body).encode()
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n'
+                     % (status, b'OK' if status == 200 else b'Error', len(payload)))
+        writer.write(payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # runs a query on the model thread, joining an identical query that is already running
+    async def _query(self, path, params, handler):
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, handler, params)
+        self.in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    # sets the model's catalog from the request -- every query carries the catalog it is asked about
+    def _set_catalog(self, params):
+        self.model.reset_catalog()
+        self.model.add_animes_to_catalog(parse_ids(params, 'catalog'))
+
+    def _health(self, params):
+        return {'status': 'ok'}
+
+    def _sim(self, params):
+        self._set_catalog(params)
+        anime_ids = parse_ids(params, 'ids') or None
+        top_k = int(params['top_k'][0]) if 'top_k' in params else None
+        filters = json.loads(params['filters'][0]) if 'filters' in params else None
+        sim_df = self.model.create_sim_df(anime_ids, sort_by=params.get('sort_by', [None])[0],
+                                          ascending=params.get('ascending', ['0'])[0] == '1', top_k=top_k,
+                                          filters=filters)
+        result = df_to_json(sim_df)
+        result['row_count'] = self.model.last_sim_row_count
+        return result
+
+    def _catalog(self, params):
+        self._set_catalog(params)
+        return df_to_json(self.model.create_catalog_df(sort_by=params.get('sort_by', [None])[0],
+                                                       ascending=params.get('ascending', ['0'])[0] == '1'))
+
+    def _shared_users(self, params):
+        self._set_catalog(params)
+        distinct = params['distinct'][0] == '1' if 'distinct' in params else None
+        return self.model.calc_shared_users(distinct=distinct)
+
+    def _optimize(self, params):
+        self._set_catalog(params)
+        picks = self.model.optimize_catalog(int(params['budget'][0]), weighted=params.get('weighted', ['0'])[0] == '1')
+        return {'picks': [[int(anime_id), int(new_users)] for anime_id, new_users in picks]}
+
+    def _genre_views(self, params):
+        self._set_catalog(params)
+        return df_to_json(self.model.get_top_genre_views(head=int(params.get('head', ['5'])[0]),
+                                                         catalog=params.get('catalog_only', ['0'])[0] == '1'))
+
+    def _filter_options(self, params):
+        return self.model.get_filter_options()
+
+    def _stats(self, params):
+        return {'sim_cache': self.model.sim_cache.stats(), 'coalesced': self.coalesced}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serves dashboard queries from one warm model on localhost.")
+    parser.add_argument('--port', type=int, default=ScoringServer.PORT)
+    parser.add_argument('--similarity-k', type=int, default=None, help="use top-k sparse similarity matrices")
+    args = parser.parse_args()
+
+    model = Model(similarity_k=args.similarity_k)
+    model.load_data()
+    print("serving on http://%s:%d" % (ScoringServer.HOST, args.port))
+    asyncio.run(ScoringServer(model, port=args.port).serve_forever())
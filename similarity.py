@@ -0,0 +1,186 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+class TopKSimilarity:
+
+    # number of matrix columns processed at once when building from a dense matrix
+    CHUNK_SIZE = 1024
+
+    # stores the k largest entries of every column of a similarity matrix as an (n_columns x k) neighbour list, most
+    # similar first -- the lists are persisted by DataStore.save_neighbours, so Model(similarity_k=...) reads them as
+    # memory maps without opening the dense matrix
+    def __init__(self, indices, values, n_rows):
+        self.indices = indices
+        self.values = values
+        self.n_rows = n_rows
+        self.k = indices.shape[1]
+
+    # builds the neighbour lists from a symmetric dense matrix (a DataFrame or ndarray), or a matrix with a columns
+    # method such as IncrementalCorrelation, one block of columns at a time -- column j equals row j, so a block of
+    # columns is read as a block of rows unless the array is stored column-major, eg. a DataFrame parsed from csv
+    @classmethod
+    def from_dense(cls, matrix, k, chunk_size=None):
+        if chunk_size is None:
+            chunk_size = TopKSimilarity.CHUNK_SIZE
+        if isinstance(matrix, pd.DataFrame):
+            matrix = matrix.to_numpy(copy=False)
+        n_rows = matrix.n_rows if hasattr(matrix, 'columns') else matrix.shape[0]
+        k = min(k, n_rows)
+
+        indices = np.empty((n_rows, k), dtype=np.int32)
+        values = np.empty((n_rows, k), dtype=np.float32)
+        for start in range(0, n_rows, chunk_size):
+            block = np.nan_to_num(TopKSimilarity._column_block(matrix, start, min(start + chunk_size, n_rows)), nan=0.0)
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_values = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_values, axis=1, kind='stable')
+            indices[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+            values[start:start + len(block)] = np.take_along_axis(top_values, order, axis=1)
+
+        return cls(indices, values, n_rows)
+
+    # returns the columns [start, stop) of a symmetric matrix as a (stop - start x n_rows) float64 array
+    @staticmethod
+    def _column_block(matrix, start, stop):
+        if hasattr(matrix, 'columns'):
+            return matrix.columns(np.arange(start, stop)).T
+        if matrix.flags.f_contiguous and not matrix.flags.c_contiguous:
+            return np.asarray(matrix[:, start:stop], dtype=np.float64).T
+        return np.asarray(matrix[start:stop], dtype=np.float64)
+
+    # sums the selected columns -- entries outside each column's neighbour list count as zero
+    def sum_columns(self, column_ids):
+        column_ids = np.asarray(column_ids, dtype=np.intp)
+        return np.bincount(self.indices[column_ids].ravel(), weights=self.values[column_ids].ravel(),
+                           minlength=self.n_rows)
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes + self.values.nbytes
+
+
+class LowRankSimilarity:
+
+    # approximates a symmetric similarity matrix as factors @ factors.T -- only the (n x d) factors are stored, eg. the
+    # embeddings from a truncated SVD of the standardized observations, see SimilarityBuilder.factorize
+    def __init__(self, factors):
+        self.factors = factors
+        self.n_rows, self.rank = factors.shape
+
+    # reads factors written by np.save as a read-only memory map
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode='r'))
+
+    # sums the selected columns as one matrix-vector product against the summed factors of the columns
+    def sum_columns(self, column_ids):
+        column_ids = np.asarray(column_ids, dtype=np.intp)
+        return self.factors @ np.asarray(self.factors[column_ids], dtype=np.float64).sum(axis=0)
+
+    # returns the selected columns as an (n_rows x len(column_ids)) array
+    def columns(self, column_ids):
+        column_ids = np.asarray(column_ids, dtype=np.intp)
+        return self.factors @ np.asarray(self.factors[column_ids], dtype=np.float64).T
+
+    @property
+    def nbytes(self):
+        return self.factors.nbytes
+
+
+# sums the selected columns of a dense DataFrame or a TopKSimilarity or LowRankSimilarity matrix as a Series indexed by
+# row position
+def sum_columns(matrix, column_ids):
+    if isinstance(matrix, pd.DataFrame):
+        return matrix.iloc[:, column_ids].sum(axis=1)
+    return pd.Series(matrix.sum_columns(column_ids))
+
+
+# returns the memory used by a dense DataFrame or a TopKSimilarity or LowRankSimilarity matrix
+def matrix_nbytes(matrix):
+    if isinstance(matrix, pd.DataFrame):
+        return int(matrix.memory_usage(index=False).sum())
+    return matrix.nbytes
+
+
+# compares the top results of two score vectors -- overlap is the fraction of the exact top results found in the
+# approximate top results, and max_rank_shift is the largest change in position among the shared results
+def ranking_drift(exact_scores, approx_scores, top, exclude=()):
+    exact_scores = np.asarray(exact_scores, dtype=np.float64).copy()
+    approx_scores = np.asarray(approx_scores, dtype=np.float64).copy()
+    exact_scores[list(exclude)] = -np.inf
+    approx_scores[list(exclude)] = -np.inf
+
+    exact_top = np.argsort(-exact_scores, kind='stable')[:top]
+    approx_top = np.argsort(-approx_scores, kind='stable')[:top]
+    approx_rank = {anime_id: rank for rank, anime_id in enumerate(approx_top)}
+    shifts = [abs(rank - approx_rank[anime_id]) for rank, anime_id in enumerate(exact_top) if anime_id in approx_rank]
+
+    return {
+        'overlap': len(shifts) / len(exact_top),
+        'identical_order': bool(np.array_equal(exact_top, approx_top)),
+        'max_rank_shift': max(shifts) if shifts else None
+    }
+
+
+# reports the memory saved and the ranking drift of the combined score for each k
+def report(model, ks, top, selections):
+    dense_bytes = matrix_nbytes(model.content_corr_df) + matrix_nbytes(model.rating_corr_df)
+    print("dense matrices: %.1f MB" % (dense_bytes / 2 ** 20))
+
+    for k in ks:
+        content_topk = TopKSimilarity.from_dense(model.content_corr_df, k)
+        rating_topk = TopKSimilarity.from_dense(model.rating_corr_df, k)
+        sparse_bytes = content_topk.nbytes + rating_topk.nbytes
+        print("k=%d: %.1f MB (%.1f%% of dense)" % (k, sparse_bytes / 2 ** 20, 100 * sparse_bytes / dense_bytes))
+
+        for selection in selections:
+            exact = (sum_columns(model.content_corr_df, selection) * model.C_SCORE_WEIGHT +
+                     sum_columns(model.rating_corr_df, selection) * model.R_SCORE_WEIGHT)
+            approx = (content_topk.sum_columns(selection) * model.C_SCORE_WEIGHT +
+                      rating_topk.sum_columns(selection) * model.R_SCORE_WEIGHT)
+            drift = ranking_drift(exact, approx, top, exclude=model.ORIGINAL_CATALOG_ANIME_IDS + list(selection))
+            print("    selection=%s overlap@%d=%.3f identical_order=%s max_rank_shift=%s"
+                  % (selection, top, drift['overlap'], drift['identical_order'], drift['max_rank_shift']))
+
+
+# reports the memory saved, the ranking drift and the score error of the combined score with low-rank factors in place
+# of the dense matrices -- score_correlation is the pearson correlation of the exact and approximate combined scores
+def report_low_rank(model, content_low_rank, rating_low_rank, top, selections):
+    dense_bytes = matrix_nbytes(model.content_corr_df) + matrix_nbytes(model.rating_corr_df)
+    low_rank_bytes = content_low_rank.nbytes + rating_low_rank.nbytes
+    print("low rank d=%d/%d: %.1f MB (%.1f%% of dense)" % (content_low_rank.rank, rating_low_rank.rank,
+                                                           low_rank_bytes / 2 ** 20, 100 * low_rank_bytes / dense_bytes))
+
+    for selection in selections:
+        exact = (sum_columns(model.content_corr_df, selection) * model.C_SCORE_WEIGHT +
+                 sum_columns(model.rating_corr_df, selection) * model.R_SCORE_WEIGHT).to_numpy(dtype=np.float64)
+        approx = (content_low_rank.sum_columns(selection) * model.C_SCORE_WEIGHT +
+                  rating_low_rank.sum_columns(selection) * model.R_SCORE_WEIGHT)
+        drift = ranking_drift(exact, approx, top, exclude=model.ORIGINAL_CATALOG_ANIME_IDS + list(selection))
+        print("    selection=%s overlap@%d=%.3f identical_order=%s max_rank_shift=%s score_correlation=%.4f "
+              "max_abs_error=%.4f" % (selection, top, drift['overlap'], drift['identical_order'], drift['max_rank_shift'],
+                                      np.corrcoef(exact, approx)[0, 1], np.abs(exact - approx).max()))
+
+
+if __name__ == '__main__':
+    from model import Model
+
+    parser = argparse.ArgumentParser(description="Reports memory use and ranking drift of top-k similarity matrices.")
+    parser.add_argument('--k', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--top', type=int, default=100, help="number of top results compared")
+    parser.add_argument('--selection', type=int, nargs='+', action='append',
+                        help="anime ids scored together -- may be repeated, defaults to the original catalog")
+    parser.add_argument('--low-rank', action='store_true',
+                        help="also compare the low-rank factors written by build_similarity.py --rank")
+    args = parser.parse_args()
+
+    model = Model()
+    model.load_data()
+    selections = args.selection or [Model.ORIGINAL_CATALOG_ANIME_IDS]
+    report(model, args.k, args.top, selections)
+    if args.low_rank:
+        report_low_rank(model, LowRankSimilarity.load(Model.CONTENT_FACTORS_PATH),
+                        LowRankSimilarity.load(Model.RATING_FACTORS_PATH), args.top, selections)
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class SortIndex:
+
+    # keeps the ascending argsort permutation of each column of a dataframe once it has been sorted by it -- the
+    # descending order reverses the permutation, so toggling the direction never sorts again
+    # rows with a missing value come last in either direction, in row order
+    # groups -- optional group number of every row, rows are kept in group order and sorted within each group, eg.
+    # the original catalog anime ahead of the new anime
+    def __init__(self, df, groups=None):
+        self.df = df
+        self.groups = None if groups is None else np.asarray(groups)
+        self._permutations = {}
+
+    # returns the row positions of the dataframe sorted by column
+    def order(self, column, ascending=True):
+        permutation = self._permutations.get(column)
+        if permutation is None:
+            permutation = self._permutations[column] = self._ascending(column)
+        segments, missing = permutation
+        if ascending:
+            return np.concatenate([np.concatenate([segment, rows]) for segment, rows in zip(segments, missing)])
+        return np.concatenate([np.concatenate([segment[::-1], rows]) for segment, rows in zip(segments, missing)])
+
+    # returns the dataframe sorted by column
+    def take(self, column, ascending=True):
+        return self.df.iloc[self.order(column, ascending)]
+
+    # replaces the values of some columns and forgets their permutations, the other permutations stay valid
+    def update(self, columns):
+        for column, values in columns.items():
+            self.df[column] = values
+            self._permutations.pop(column, None)
+
+    # forgets the permutations of the given columns, or of every column
+    def invalidate(self, columns=None):
+        if columns is None:
+            self._permutations.clear()
+        for column in columns or ():
+            self._permutations.pop(column, None)
+
+    # sorts the rows with a value by column within each group, and lists the rows without one -- one entry per group
+    def _ascending(self, column):
+        values = self.df[column].reset_index(drop=True)
+        valid = values.notna().to_numpy()
+        ordered = values[valid].sort_values(kind='stable').index.to_numpy()
+        missing = np.flatnonzero(~valid)
+        if self.groups is None:
+            return [ordered], [missing]
+        group_ids = np.unique(self.groups)
+        return self._split(ordered, group_ids), self._split(missing, group_ids)
+
+    # splits row positions by group, keeping their order within each group
+    def _split(self, rows, group_ids):
+        rows = rows[np.argsort(self.groups[rows], kind='stable')]
+        return np.split(rows, np.searchsorted(self.groups[rows], group_ids[:-1], side='right'))
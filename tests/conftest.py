@@ -0,0 +1,61 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import SyntheticData
+from build_similarity import SimilarityBuilder
+from data_store import DataStore
+from model import Model
+
+# size of the synthetic data the model is checked on -- the anime ids span at least the original catalog ids
+N_ANIME = 300
+N_RATINGS = 30000
+N_USERS = 1500
+FACTORS_RANK = 16
+
+
+# writes the synthetic data once per session -- the correlation matrices are rebuilt from the ratings by
+# build_similarity.py, as the ratings ingest path requires, together with their top-k lists and low-rank factors
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('data'))
+    SyntheticData(N_ANIME, N_RATINGS, n_users=N_USERS, seed=0).write(root)
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        builder = SimilarityBuilder(workers=1, data_store=DataStore(), top_k=50)
+        builder.build()
+        builder.build_factors(FACTORS_RANK)
+    finally:
+        os.chdir(cwd)
+    return root
+
+
+# runs the test from the data directory with rating deltas written to a file of its own
+@pytest.fixture
+def in_data_dir(data_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(data_dir)
+    monkeypatch.setattr(Model, 'RATING_DELTA_PATH', str(tmp_path / 'rating_deltas.csv'))
+    return data_dir
+
+
+# runs the test from a copy of the data directory, for tests that rewrite the stored data -- modification times are
+# kept, so the data store entries stay up to date
+@pytest.fixture
+def own_data_dir(data_dir, tmp_path, monkeypatch):
+    root = str(tmp_path / 'data')
+    shutil.copytree(data_dir, root)
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(Model, 'RATING_DELTA_PATH', os.path.join(root, Model.RATING_DELTA_PATH))
+    return root
+
+
+@pytest.fixture
+def model(in_data_dir):
+    model = Model()
+    model.load_data()
+    return model
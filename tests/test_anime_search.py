@@ -0,0 +1,94 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from anime_search import AnimeSearchIndex
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Romance']
+TYPES = ['TV', 'Movie', 'OVA']
+SYLLABLES = ['ka', 'Ri', 'to', 'na', 'mi', 'ko', '-', ' ', ' ']
+
+
+def random_anime_df(rng, n_rows):
+    names = [None if rng.random() < 0.05 else
+             ''.join(rng.choice(SYLLABLES, rng.integers(1, 8))) for _ in range(n_rows)]
+    genre_masks = rng.integers(0, 2 ** len(GENRES), n_rows)
+    episodes = rng.integers(1, 50, n_rows).astype(float)
+    episodes[rng.random(n_rows) < 0.1] = np.nan
+    return pd.DataFrame({
+        'name': names,
+        'genre': [', '.join(genre for i, genre in enumerate(GENRES) if mask >> i & 1) for mask in genre_masks],
+        'genre_mask': genre_masks.astype(np.uint64),
+        'type': [None if rng.random() < 0.05 else rng.choice(TYPES) for _ in range(n_rows)],
+        'episodes': episodes,
+        'members': rng.integers(0, 1000, n_rows)
+    })
+
+
+# the rows matching the filters, checked one row at a time -- name tokens shorter than a trigram must start a word of
+# the name, longer tokens must appear anywhere in it
+def mask_reference(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, value in filters.items():
+        if column == 'name':
+            def matches(name):
+                name = name.lower() if isinstance(name, str) else ''
+                words = re.findall(r'\w+', name)
+                return all(any(word.startswith(token) for word in words) if len(token) < AnimeSearchIndex.TRIGRAM
+                           else token in name for token in value.lower().split())
+            mask &= df['name'].map(matches)
+        elif column == 'genre':
+            mask &= df['genre'].map(lambda genres: set(value) <= set(genres.split(', ')))
+        elif column == 'type':
+            mask &= df['type'] == value
+        else:
+            low, high = value
+            mask &= df[column].notna()
+            if low is not None:
+                mask &= df[column] >= low
+            if high is not None:
+                mask &= df[column] <= high
+    return mask.to_numpy()
+
+
+def random_filters(rng):
+    filters = {}
+    if rng.random() < 0.7:
+        tokens = [''.join(rng.choice(SYLLABLES[:6], rng.integers(1, 3)))[:rng.integers(1, 5)]
+                  for _ in range(rng.integers(1, 3))]
+        filters['name'] = ' '.join(token.upper() if rng.random() < 0.2 else token for token in tokens)
+    if rng.random() < 0.3:
+        filters['genre'] = list(rng.choice(GENRES + ['Horror'], rng.integers(1, 3), replace=False))
+    if rng.random() < 0.3:
+        filters['type'] = rng.choice(TYPES + ['Special'])
+    for column, top in (('episodes', 50), ('members', 1000)):
+        if rng.random() < 0.3:
+            bounds = sorted(rng.integers(0, top, 2).tolist())
+            filters[column] = (None if rng.random() < 0.3 else bounds[0], None if rng.random() < 0.3 else bounds[1])
+    return filters
+
+
+def test_mask_matches_row_by_row_filtering():
+    rng = np.random.default_rng(0)
+    df = random_anime_df(rng, 400)
+    index = AnimeSearchIndex(df, 'name', 'genre', 'genre_mask', GENRES, 'type', ['episodes', 'members'])
+    checked = 0
+    for _ in range(300):
+        filters = AnimeSearchIndex.active(random_filters(rng))
+        if not filters:
+            assert index.mask(filters) is None
+            continue
+        np.testing.assert_array_equal(index.mask(filters), mask_reference(df, filters), err_msg=str(filters))
+        checked += 1
+    assert checked > 200
+
+
+def test_short_tokens_match_word_prefixes_only():
+    df = random_anime_df(np.random.default_rng(1), 3)
+    df['name'] = ['Naruto', 'Kanon', 'Toradora!']
+    index = AnimeSearchIndex(df, 'name', 'genre', 'genre_mask', GENRES, 'type', ['episodes', 'members'])
+    assert index.mask({'name': 'na'}).tolist() == [True, False, False]
+    assert index.mask({'name': 'ora'}).tolist() == [False, False, True]
+    assert index.mask({'name': 'ra'}).tolist() == [False, False, False]
+    assert index.mask({'name': 'ka to'}).tolist() == [False, False, False]
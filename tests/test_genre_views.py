@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from genre_views import GenreViews
+from user_index import UserIndex
+
+GENRES = ['Action', 'Comedy', 'Drama', 'Romance', 'Sci-Fi']
+
+
+# distinct users per genre over the rating rows of the given anime, or of all anime
+def views_reference(rating_df, masks, anime_ids=None):
+    if anime_ids is not None:
+        rating_df = rating_df[rating_df['anime_id'].isin(anime_ids)]
+    row_masks = masks[rating_df['anime_id'].to_numpy()]
+    return np.array([rating_df['user_id'][(row_masks >> genre) & 1 == 1].nunique() for genre in range(len(GENRES))])
+
+
+def test_views_match_distinct_users_per_genre():
+    rng = np.random.default_rng(0)
+    masks = rng.integers(0, 2 ** len(GENRES), 50)
+    rating_df = pd.DataFrame({'anime_id': rng.integers(0, 45, 2000), 'user_id': rng.integers(0, 300, 2000)})
+    index = UserIndex.from_ratings(rating_df['anime_id'], rating_df['user_id'])
+    # anime 45 to 49 have no ratings yet
+    views = GenreViews(index, np.arange(50), masks.astype(np.uint64), GENRES)
+
+    catalogs = [[0, 1, 2], [0, 2, 3, 4, 46], [3, 4], [5, 6, 7, 8, 46, 47]]
+    for catalog in catalogs[:2]:
+        np.testing.assert_array_equal(views.catalog_views(catalog), views_reference(rating_df, masks, catalog))
+    np.testing.assert_array_equal(views.global_views(), views_reference(rating_df, masks))
+
+    # only new (user, anime) pairs are added, as Model.ingest_ratings skips repeated and already rated pairs
+    added_df = pd.DataFrame({'anime_id': rng.integers(0, 50, 300), 'user_id': rng.integers(200, 400, 300)})
+    added_df = added_df.drop_duplicates()
+    added_df = added_df.merge(rating_df, how='left', indicator=True).query("_merge == 'left_only'")[['anime_id', 'user_id']]
+    user_indices = index.add_ratings(added_df['anime_id'].to_numpy(), added_df['user_id'].to_numpy())
+    views.add_ratings(added_df['anime_id'].to_numpy(), user_indices)
+    all_df = pd.concat([rating_df, added_df], ignore_index=True)
+
+    np.testing.assert_array_equal(views.global_views(), views_reference(all_df, masks))
+    for catalog in catalogs[1:]:
+        np.testing.assert_array_equal(views.catalog_views(catalog), views_reference(all_df, masks, catalog))
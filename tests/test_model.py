@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import Model
+from similarity import sum_columns
+
+SIM_COLUMNS = [Model.ANIME_ID, Model.NAME, Model.GENRE, Model.TYPE, Model.EPISODES, Model.MEMBERS, Model.RATING,
+               Model.C_SCORE, Model.R_SCORE, Model.COMBINED_SCORE, Model.P_RATING]
+ROUNDED_COLUMNS = [Model.C_SCORE, Model.R_SCORE, Model.COMBINED_SCORE, Model.P_RATING]
+
+
+# the similarity list as the original implementation assembled it -- the summed dense matrix columns merged with the
+# predicted ratings and the anime table, then sorted and filtered
+def merged_sim_df(model, anime_ids, sort_by, ascending):
+    c_score_s = model.content_corr_df.iloc[:, anime_ids].sum(axis=1)
+    r_score_s = model.rating_corr_df.iloc[:, anime_ids].sum(axis=1)
+    score_df = pd.DataFrame({Model.C_SCORE: c_score_s, Model.R_SCORE: r_score_s,
+                             Model.COMBINED_SCORE: c_score_s * Model.C_SCORE_WEIGHT + r_score_s * Model.R_SCORE_WEIGHT})
+    score_df.index.name = Model.ANIME_ID
+    score_df = score_df.reset_index()
+
+    p_rating_df = pd.DataFrame({Model.ANIME_ID: np.arange(model.rating_predictor.n_rows),
+                                Model.P_RATING: model.rating_predictor.predict()})
+    sim_df = pd.merge(pd.merge(score_df, p_rating_df, on=Model.ANIME_ID), model.anime_df, on=Model.ANIME_ID)
+    sim_df = sim_df.sort_values([sort_by], ascending=ascending, kind='stable')
+    sim_df = sim_df.loc[~sim_df[Model.ANIME_ID].isin(Model.ORIGINAL_CATALOG_ANIME_IDS + model.new_catalog_ids)]
+    for column in ROUNDED_COLUMNS:
+        sim_df[column] = sim_df[column].round(2)
+    return sim_df[SIM_COLUMNS]
+
+
+def test_incremental_scores_match_full_recompute(model):
+    anime_ids = np.setdiff1d(model.meta_df[Model.ANIME_ID].to_numpy(), Model.ORIGINAL_CATALOG_ANIME_IDS)[:3].tolist()
+    selections = [
+        Model.ORIGINAL_CATALOG_ANIME_IDS,
+        Model.ORIGINAL_CATALOG_ANIME_IDS + anime_ids[:1],
+        Model.ORIGINAL_CATALOG_ANIME_IDS[1:] + anime_ids[:2],
+        Model.ORIGINAL_CATALOG_ANIME_IDS[1:] + anime_ids + anime_ids[:1],
+        Model.ORIGINAL_CATALOG_ANIME_IDS[2:] + anime_ids
+    ]
+
+    incremental_updates = 0
+    for selection in selections:
+        c_scores, r_scores = model._update_scores(selection)
+        incremental_updates = max(incremental_updates, model._score_updates)
+        np.testing.assert_allclose(c_scores, sum_columns(model.content_corr_df, selection), atol=1e-9)
+        np.testing.assert_allclose(r_scores, sum_columns(model.rating_corr_df, selection), atol=1e-9)
+    assert incremental_updates > 0
+
+    sim_df = model.create_sim_df(selections[-1], sort_by=Model.COMBINED_SCORE)
+    model._reset_sim_state()
+    expected_df = model.create_sim_df(selections[-1], sort_by=Model.COMBINED_SCORE)
+    np.testing.assert_allclose(sim_df[Model.COMBINED_SCORE].to_numpy(), expected_df[Model.COMBINED_SCORE].to_numpy(),
+                               atol=0.011)
+
+
+@pytest.mark.parametrize('sort_by', [Model.COMBINED_SCORE, Model.NAME, Model.P_RATING])
+@pytest.mark.parametrize('ascending', [False, True])
+def test_top_k_is_the_head_of_the_full_list(model, sort_by, ascending):
+    selection = Model.ORIGINAL_CATALOG_ANIME_IDS[:4]
+    full_df = model.create_sim_df(selection, sort_by=sort_by, ascending=ascending)
+    model.sim_cache.clear()
+    top_df = model.create_sim_df(selection, sort_by=sort_by, ascending=ascending, top_k=25)
+    np.testing.assert_array_equal(top_df[sort_by].to_numpy(), full_df[sort_by].to_numpy()[:25])
+    assert len(top_df) == 25 and model.last_sim_row_count == len(full_df)
+
+
+# the sort column must come in the same order, the rows are compared by anime id since tied rows may come in either
+@pytest.mark.parametrize('sort_by', [Model.COMBINED_SCORE, Model.NAME, Model.P_RATING])
+@pytest.mark.parametrize('ascending', [False, True])
+def test_create_sim_df_matches_merge(model, sort_by, ascending):
+    model.add_animes_to_catalog(model.meta_df[Model.ANIME_ID].iloc[:3].tolist())
+    selection = Model.ORIGINAL_CATALOG_ANIME_IDS[:4]
+    sim_df = model.create_sim_df(selection, sort_by=sort_by, ascending=ascending)
+    expected_df = merged_sim_df(model, selection, sort_by, ascending)
+
+    np.testing.assert_array_equal(sim_df[sort_by].to_numpy(), expected_df[sort_by].to_numpy())
+    pd.testing.assert_frame_equal(sim_df.sort_values(Model.ANIME_ID).reset_index(drop=True),
+                                  expected_df.sort_values(Model.ANIME_ID).reset_index(drop=True), check_dtype=False,
+                                  check_categorical=False)
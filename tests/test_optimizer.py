@@ -0,0 +1,58 @@
+import numpy as np
+
+from optimizer import CatalogOptimizer
+from user_index import UserIndex
+
+
+def random_index(rng):
+    anime_ids = rng.integers(0, 60, 4000)
+    # a few popular anime, so audiences overlap
+    anime_ids[:1500] = rng.integers(0, 6, 1500)
+    return UserIndex.from_ratings(anime_ids, rng.integers(0, 800, 4000))
+
+
+# users of the anime not reached by the covered anime
+def new_users(index, anime_id, covered_ids):
+    covered = set()
+    for covered_id in covered_ids:
+        covered.update(index.users_of(covered_id).tolist())
+    return len(set(index.users_of(anime_id).tolist()) - covered)
+
+
+def test_weighted_picks_match_brute_force_greedy():
+    rng = np.random.default_rng(0)
+    index = random_index(rng)
+    covered_ids = [0, 1]
+    candidate_ids = list(range(2, 60))
+    weights = {anime_id: rng.uniform(0.5, 1.5) for anime_id in candidate_ids}
+
+    expected, chosen = [], list(covered_ids)
+    for _ in range(10):
+        gains = {anime_id: weights[anime_id] * new_users(index, anime_id, chosen)
+                 for anime_id in candidate_ids if anime_id not in chosen}
+        best = max(gains, key=gains.get)
+        expected.append((best, new_users(index, best, chosen)))
+        chosen.append(best)
+
+    assert CatalogOptimizer(index).select(10, covered_ids, candidate_ids, weights=weights) == expected
+
+
+# counts tie often, so each pick is checked to reach the most new users given the picks before it
+def test_every_pick_reaches_the_most_new_users():
+    rng = np.random.default_rng(1)
+    index = random_index(rng)
+    candidate_ids = list(range(60))
+    picks = CatalogOptimizer(index).select(15, [0], candidate_ids)
+
+    chosen = [0]
+    for anime_id, count in picks:
+        assert count == new_users(index, anime_id, chosen)
+        assert count == max(new_users(index, candidate_id, chosen) for candidate_id in candidate_ids
+                            if candidate_id not in chosen)
+        chosen.append(anime_id)
+    assert len(picks) == 15
+
+
+def test_stops_when_no_candidate_reaches_new_users():
+    index = UserIndex.from_ratings(np.array([0, 1, 1, 2]), np.array([5, 5, 6, 6]))
+    assert CatalogOptimizer(index).select(5, [0], [1, 2]) == [(1, 1)]
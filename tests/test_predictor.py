@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from predictor import RatingPredictor
+from similarity import TopKSimilarity
+
+
+# the weighted mean of the known ratings over the positive correlations, or the mean known rating without any
+def predict_reference(matrix, ratings):
+    anime_ids = list(ratings)
+    values = np.array([ratings[anime_id] for anime_id in anime_ids])
+    weights = np.maximum(matrix[:, anime_ids], 0)
+    totals = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(totals > 0, weights @ values / totals, values.mean())
+
+
+def random_matrix(rng, n):
+    matrix = rng.uniform(-1, 1, (n, n))
+    matrix = (matrix + matrix.T) / 2
+    # a row without positive correlations falls back to the mean rating
+    matrix[0] = matrix[:, 0] = -0.5
+    return matrix
+
+
+def test_incremental_updates_match_the_weighted_mean():
+    rng = np.random.default_rng(0)
+    matrix = random_matrix(rng, 80)
+    predictor = RatingPredictor(pd.DataFrame(matrix))
+    ratings = {}
+    for _ in range(30):
+        change = {int(anime_id): float(rng.uniform(1, 10)) for anime_id in rng.choice(80, 3, replace=False)}
+        if ratings and rng.random() < 0.3:
+            change[next(iter(ratings))] = None
+        predictor.update(change)
+        ratings.update(change)
+        ratings = {anime_id: rating for anime_id, rating in ratings.items() if rating is not None}
+        np.testing.assert_allclose(predictor.predict(), predict_reference(matrix, ratings), atol=1e-9)
+
+
+def test_top_k_counts_only_the_neighbour_lists():
+    rng = np.random.default_rng(1)
+    matrix = random_matrix(rng, 80)
+    top_k = TopKSimilarity.from_dense(matrix, 10)
+    sparse = np.zeros_like(matrix)
+    for column in range(80):
+        sparse[top_k.indices[column], column] = top_k.values[column]
+
+    ratings = {int(anime_id): float(rng.uniform(1, 10)) for anime_id in rng.choice(80, 12, replace=False)}
+    predictor = RatingPredictor(top_k)
+    predictor.update(ratings)
+    np.testing.assert_allclose(predictor.predict(), predict_reference(sparse, ratings), atol=1e-6)
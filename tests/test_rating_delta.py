@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from model import Model
+from rating_delta import IncrementalCorrelation, compact, verify
+from similarity import TopKSimilarity
+
+
+# rating rows for the loaded anime -- new and known users, unscored ratings, a pair repeated within the batch, a pair
+# that is already rated and an anime outside the matrices
+def rating_batch(model, n_rows, seed):
+    rng = np.random.default_rng(seed)
+    batch_df = pd.DataFrame({
+        Model.ANIME_ID: rng.choice(model.meta_df[Model.ANIME_ID].to_numpy(), n_rows),
+        Model.USER_ID: rng.integers(1, int(model.user_index.user_ids.max() * 1.2), n_rows),
+        Model.RATING: rng.integers(-1, 11, n_rows)
+    })
+    rated_anime_id = int(np.flatnonzero(np.diff(model.user_index.indptr))[0])
+    rated_user_id = int(model.user_index.user_ids[model.user_index.users_of(rated_anime_id)[0]])
+    extra_df = pd.DataFrame({Model.ANIME_ID: [rated_anime_id, model.rating_predictor.n_rows + 10],
+                             Model.USER_ID: [rated_user_id, 1], Model.RATING: [7, 7]})
+    batch_df = pd.concat([batch_df, batch_df.iloc[:1], extra_df], ignore_index=True)
+    return batch_df.astype(Model.RATING_DTYPES)
+
+
+def test_ingest_ratings_matches_rebuild(model):
+    delta_dfs = []
+    for seed in range(2):
+        delta_dfs.append(model.ingest_ratings(rating_batch(model, 600, seed)))
+        report = model.last_ingest_report
+        assert report['accepted'] == len(delta_dfs[-1]) > 0
+        assert report['repeated'] >= 1 and report['already_rated'] >= 1 and report['unknown_anime'] >= 1
+    assert model.user_index.n_users > len(np.unique(
+        model.data_store.load_table(Model.RATING_PATH, dtype=Model.RATING_DTYPES)[Model.USER_ID]))
+
+    result = verify(model, pd.concat(delta_dfs, ignore_index=True))
+    assert result['same_user_index'] and result['same_rating_stats']
+    assert result['same_global_views'] and result['same_catalog_views']
+    assert result['max_correlation_error'] < 1e-9
+    assert result['max_p_rating_error'] < 1e-9
+
+
+def test_ingest_refuses_a_matrix_not_built_from_the_ratings(model):
+    model.rating_corr_df = model.rating_corr_df * 0.5
+    n_users = model.user_index.n_users
+    with pytest.raises(ValueError):
+        model.ingest_ratings(rating_batch(model, 100, 0))
+    assert model.user_index.n_users == n_users
+    assert isinstance(model.rating_corr_df, pd.DataFrame)
+
+
+def test_rating_deltas_are_replayed_by_every_backend(model):
+    model.ingest_ratings(rating_batch(model, 600, 0)).to_csv(Model.RATING_DELTA_PATH, index=False)
+
+    dense = Model()
+    dense.load_data()
+    assert dense.last_ingest_report['accepted'] == model.last_ingest_report['accepted']
+    np.testing.assert_allclose(dense.meta_df[Model.P_RATING].to_numpy(), model.meta_df[Model.P_RATING].to_numpy())
+
+    top_k = Model(similarity_k=20)
+    top_k.load_data()
+    expected = TopKSimilarity.from_dense(dense.rating_corr_df, 20)
+    np.testing.assert_allclose(top_k.rating_corr_df.values, expected.values, atol=1e-6)
+
+    low_rank = Model(low_rank=True)
+    low_rank.load_data()
+    assert low_rank.last_ingest_report is None
+
+
+def test_compaction_folds_deltas_into_the_stored_data(own_data_dir):
+    model = Model()
+    model.load_data()
+    model.ingest_ratings(rating_batch(model, 600, 0)).to_csv(Model.RATING_DELTA_PATH, index=False)
+    model = Model()
+    model.load_data()
+    added_df = model.ingest_ratings(rating_batch(model, 300, 1))
+    factors = np.load(Model.RATING_FACTORS_PATH)
+
+    compact(model, pd.concat([model.replayed_rating_df, added_df], ignore_index=True))
+    assert not os.path.exists(Model.RATING_DELTA_PATH)
+    assert not np.array_equal(np.load(Model.RATING_FACTORS_PATH), factors)
+
+    # the stored matrix is the correlation of the stored ratings, and later ratings can be ingested on top of it
+    dense = Model()
+    dense.load_data()
+    assert dense.replayed_rating_df is None and model.data_store.is_fresh(Model.RATING_PATH)
+    n = model.rating_corr_df.n_rows
+    np.testing.assert_allclose(dense.rating_corr_df.to_numpy(), model.rating_corr_df.columns(np.arange(n)), atol=1e-9)
+    IncrementalCorrelation.from_user_index(dense.rating_corr_df, dense.user_index)
+    np.testing.assert_allclose(dense.meta_df[Model.P_RATING].to_numpy(), model.meta_df[Model.P_RATING].to_numpy())
+
+    top_k = Model(similarity_k=20)
+    top_k.load_data()
+    assert isinstance(top_k.rating_corr_df.indices, np.memmap)
+    np.testing.assert_allclose(top_k.rating_corr_df.values,
+                               TopKSimilarity.from_dense(dense.rating_corr_df, 20).values, atol=1e-9)
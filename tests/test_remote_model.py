@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from df_json import df_to_json, json_to_df
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_json_round_trip_keeps_missing_values():
+    df = pd.DataFrame({'name': ['a', None], 'rating': [7.5, float('nan')]})
+    decoded_df = json_to_df(df_to_json(df))
+    assert decoded_df['name'].iloc[0] == 'a' and pd.isna(decoded_df['name'].iloc[1])
+    assert decoded_df['rating'].iloc[0] == 7.5 and pd.isna(decoded_df['rating'].iloc[1])
+
+
+# the thin client decodes responses without importing the model or the server -- checked in a fresh interpreter
+def test_thin_client_does_not_import_the_model():
+    code = ("import sys, remote_model; remote_model.RemoteModel._to_df({'columns': ['a'], 'rows': [[1]]}); "
+            "print(','.join(name for name in ('model', 'server', 'similarity', 'data_store') if name in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ''
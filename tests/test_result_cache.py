@@ -0,0 +1,35 @@
+from result_cache import ResultCache
+
+
+def test_least_recently_used_entries_are_evicted_under_the_byte_budget():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    for key in 'abcd':
+        cache.put(key, key.upper(), 30)
+    assert cache.get('a') is None and cache.stats()['bytes'] == 90
+
+    assert cache.get('b') == 'B'
+    cache.put('e', 'E', 50)
+    assert [key for key in 'bcde' if cache.get(key) is not None] == ['b', 'e']
+    assert cache.stats()['bytes'] == 80 and cache.evictions == 3
+
+
+def test_replacing_an_entry_releases_its_bytes():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    cache.put('a', 1, 60)
+    cache.put('a', 2, 30)
+    cache.put('b', 3, 60)
+    assert cache.get('a') == 2 and cache.stats()['bytes'] == 90 and cache.evictions == 0
+
+
+def test_values_over_the_budget_are_not_cached():
+    cache = ResultCache(max_entries=10, max_bytes=100)
+    cache.put('a', 1, 40)
+    cache.put('b', 2, 101)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.stats()['bytes'] == 40
+
+
+def test_entry_limit():
+    cache = ResultCache(max_entries=2, max_bytes=100)
+    for key in 'abc':
+        cache.put(key, key, 1)
+    assert cache.get('a') is None and cache.stats()['entries'] == 2
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from model import Model
+from similarity import TopKSimilarity
+
+
+# the k largest entries of every column, most similar first
+def column_top_values(matrix, k):
+    return -np.sort(-np.asarray(matrix, dtype=np.float64), axis=0)[:k].T
+
+
+def test_from_dense_reads_every_layout():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((60, 60))
+    matrix = matrix + matrix.T
+    expected = column_top_values(matrix, 5)
+    for layout in (matrix, np.asfortranarray(matrix), pd.DataFrame(matrix), pd.DataFrame(np.asfortranarray(matrix))):
+        top_k = TopKSimilarity.from_dense(layout, 5, chunk_size=7)
+        np.testing.assert_allclose(top_k.values, expected, rtol=1e-6)
+        np.testing.assert_allclose(np.take_along_axis(matrix.T, top_k.indices.astype(np.intp), axis=1), expected)
+
+
+def test_persisted_neighbours_match_dense(model):
+    top_k = Model(similarity_k=20)
+    top_k.load_data()
+    assert isinstance(top_k.rating_corr_df.indices, np.memmap)
+    for matrix, neighbours in ((model.content_corr_df, top_k.content_corr_df),
+                               (model.rating_corr_df, top_k.rating_corr_df)):
+        np.testing.assert_allclose(neighbours.values, column_top_values(matrix, 20), atol=1e-6)
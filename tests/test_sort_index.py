@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sort_index import SortIndex
+
+
+# the rows of each group in group order -- the rows with a value sorted by it, the descending order being the
+# ascending one reversed, then the rows without one in row order
+def order_reference(values, groups, ascending):
+    order = []
+    for group in sorted(set(groups)):
+        rows = [row for row in range(len(values)) if groups[row] == group]
+        valued = sorted((row for row in rows if not pd.isna(values[row])), key=lambda row: values[row])
+        order += (valued if ascending else valued[::-1]) + [row for row in rows if pd.isna(values[row])]
+    return order
+
+
+@pytest.mark.parametrize('column', ['score', 'name'])
+@pytest.mark.parametrize('ascending', [True, False])
+@pytest.mark.parametrize('grouped', [True, False])
+def test_order_keeps_missing_values_last_within_groups(column, ascending, grouped):
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 5, 40).astype(float)
+    scores[rng.choice(40, 8, replace=False)] = np.nan
+    names = [None if rng.random() < 0.2 else 'abcde'[rng.integers(0, 5)] for _ in range(40)]
+    df = pd.DataFrame({'score': scores, 'name': names}, index=rng.permutation(40))
+    groups = rng.integers(0, 3, 40) if grouped else np.zeros(40, dtype=int)
+
+    sort_index = SortIndex(df, groups if grouped else None)
+    expected = order_reference(df[column].tolist(), groups.tolist(), ascending)
+    assert sort_index.order(column, ascending).tolist() == expected
+    # the permutation is kept, so the other direction is read from it
+    assert sort_index.order(column, not ascending).tolist() == order_reference(df[column].tolist(), groups.tolist(),
+                                                                               not ascending)
+
+
+def test_update_forgets_only_the_updated_columns():
+    df = pd.DataFrame({'a': [3.0, 1.0, 2.0], 'b': [1.0, 2.0, 3.0]})
+    sort_index = SortIndex(df)
+    assert sort_index.order('a').tolist() == [1, 2, 0]
+    assert sort_index.order('b').tolist() == [0, 1, 2]
+    sort_index.update({'a': [1.0, np.nan, 0.0]})
+    assert sort_index.order('a').tolist() == [2, 0, 1]
+    assert sort_index.take('b', ascending=False)['b'].tolist() == [3.0, 2.0, 1.0]
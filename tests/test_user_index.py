@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from user_index import UserIndex
+
+
+# the audience split as the original pandas implementation computed it from the rating rows, or over distinct users
+def split_reference(rating_df, first_ids, second_ids, distinct):
+    first_s = rating_df.loc[rating_df['anime_id'].isin(first_ids), 'user_id']
+    second_s = rating_df.loc[rating_df['anime_id'].isin(second_ids), 'user_id']
+    if distinct:
+        first, second = set(first_s), set(second_s)
+        return len(first - second), len(first & second), len(second - first)
+    return (int((~first_s.isin(second_s)).sum()), int(first_s.isin(second_s).sum()),
+            int((~second_s.isin(first_s)).sum()))
+
+
+def random_ratings(rng, n_rows, n_anime, n_users):
+    return pd.DataFrame({'anime_id': rng.integers(0, n_anime, n_rows), 'user_id': rng.integers(1, n_users, n_rows) * 7,
+                         'rating': rng.integers(-1, 11, n_rows)})
+
+
+@pytest.mark.parametrize('distinct', [True, False])
+def test_split_audience_matches_rating_rows(distinct):
+    rng = np.random.default_rng(0)
+    rating_df = random_ratings(rng, 3000, 40, 400)
+    index = UserIndex.from_ratings(rating_df['anime_id'], rating_df['user_id'], rating_df['rating'])
+    # rows added later are held apart from the index arrays until they are read, see UserIndex.add_ratings
+    added_df = random_ratings(rng, 300, 45, 500)
+    index.add_ratings(added_df['anime_id'].to_numpy(), added_df['user_id'].to_numpy(), added_df['rating'].to_numpy())
+    all_df = pd.concat([rating_df, added_df], ignore_index=True)
+
+    for _ in range(20):
+        first_ids = rng.choice(45, rng.integers(0, 6), replace=False).tolist()
+        second_ids = rng.choice(45, rng.integers(0, 6), replace=False).tolist()
+        assert (index.split_audience(first_ids, second_ids, distinct=distinct) ==
+                split_reference(all_df, first_ids, second_ids, distinct))
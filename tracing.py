@@ -0,0 +1,233 @@
+import cProfile
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+
+class Span:
+
+    # one timed operation -- rows can be set while the span is open, eg. the number of rows a dataframe step produced
+    def __init__(self, tracer, name, category, parent, depth):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.depth = depth
+        self.rows = None
+        self.started = None
+        self.seconds = None
+        self._profile = None
+
+    def __enter__(self):
+        self.tracer._enter(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.started
+        self.tracer._exit(self, exc_type is not None)
+        return False
+
+
+class _NullSpan:
+
+    # stands in for a span while tracing is disabled so instrumented code does not need to check
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+
+    # durations kept per operation for its rolling percentiles, and spans kept for recent()
+    WINDOW = 200
+    RECENT = 1000
+
+    # records the duration and row count of instrumented operations -- each operation keeps a rolling window of its
+    # durations for the percentile summary, and every span can be appended to a json lines file
+    # when disabled, span() returns a shared no-op span and traced functions call straight through
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._windows = {}
+        self._recent = deque(maxlen=Tracer.RECENT)
+
+        # cProfile capture of the next span of a category, see capture_profile
+        self._profile_path = None
+        self._profile_category = None
+        self.last_profile_path = None
+
+    # starts recording -- log_path, when given, receives one json object per finished span
+    def enable(self, log_path=None):
+        self.log_path = log_path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+            self._recent.clear()
+
+    # returns a context manager timing one operation
+    def span(self, name, category):
+        if not self.enabled:
+            return _NULL_SPAN
+        stack = self._stack()
+        return Span(self, name, category, stack[-1].name if stack else None, len(stack))
+
+    # runs the next span of category under cProfile and writes its stats to path -- by default the next background
+    # task, which holds most of the work of one interaction
+    def capture_profile(self, path, category='task'):
+        with self._lock:
+            self._profile_path = path
+            self._profile_category = category
+
+    # per operation count, rolling percentiles in milliseconds and mean row count, slowest median first
+    def summary(self):
+        with self._lock:
+            windows = {key: list(window) for key, window in self._windows.items()}
+
+        rows = []
+        for (category, name), entries in windows.items():
+            seconds = sorted(entry[0] for entry in entries)
+            row_counts = [entry[1] for entry in entries if entry[1] is not None]
+            rows.append({
+                'category': category,
+                'name': name,
+                'count': len(seconds),
+                'p50_ms': 1000 * Tracer._percentile(seconds, 0.5),
+                'p90_ms': 1000 * Tracer._percentile(seconds, 0.9),
+                'p99_ms': 1000 * Tracer._percentile(seconds, 0.99),
+                'max_ms': 1000 * seconds[-1],
+                'mean_rows': sum(row_counts) / len(row_counts) if row_counts else None
+            })
+        rows.sort(key=lambda row: row['p50_ms'], reverse=True)
+        return rows
+
+    # the most recent finished spans, oldest first
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    @staticmethod
+    def _percentile(sorted_values, fraction):
+        return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, span):
+        self._stack().append(span)
+        if self._profile_path is not None and span.category == self._profile_category:
+            with self._lock:
+                path, self._profile_path = self._profile_path, None
+            if path is not None:
+                span._profile = (cProfile.Profile(), path)
+                span._profile[0].enable()
+
+    def _exit(self, span, failed):
+        if span._profile is not None:
+            profile, path = span._profile
+            profile.disable()
+            profile.dump_stats(path)
+            self.last_profile_path = path
+            logging.info("profile of %s written to %s", span.name, path)
+
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+        record = {
+            'name': span.name,
+            'category': span.category,
+            'seconds': span.seconds,
+            'rows': span.rows,
+            'parent': span.parent,
+            'depth': span.depth,
+            'thread': threading.current_thread().name,
+            'failed': failed,
+            'time': time.time()
+        }
+        with self._lock:
+            window = self._windows.get((span.category, span.name))
+            if window is None:
+                window = self._windows[(span.category, span.name)] = deque(maxlen=Tracer.WINDOW)
+            window.append((span.seconds, span.rows))
+            self._recent.append(record)
+            if self.log_path is not None:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+class StartupTimer:
+
+    # records when each startup phase starts and how long it takes, measured from when the timer is created -- phases
+    # may run on different threads and overlap, eg. the data loading while the login frame is shown
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, started - self.started, time.perf_counter() - started))
+
+    # one line per phase in the order the phases started
+    def report(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        return '\n'.join("%-20s starts %7.3fs  takes %7.3fs" % phase for phase in phases)
+
+
+# the tracer used by the dashboard -- disabled until enabled, eg. by running main.py with --trace
+TRACER = Tracer()
+
+
+# number of rows of an operation's result, when it has any
+def _row_count(result):
+    if hasattr(result, 'shape') and hasattr(result, 'columns'):
+        return len(result)
+    return None
+
+
+# decorator timing every call of a function as a span of category, named after the function -- the row count of a
+# returned dataframe is recorded
+def traced(category, name=None):
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return fn(*args, **kwargs)
+            with TRACER.span(span_name, category) as span:
+                result = fn(*args, **kwargs)
+                span.rows = _row_count(result)
+                return result
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,207 @@
+import numpy as np
+
+
+class UserIndex:
+
+    # inverted index from anime ids to the dense indices of the users that rated them -- the users of anime_id are
+    # user_indices[indptr[anime_id]:indptr[anime_id + 1]], one entry per rating row
+    # ratings -- optional rating of every entry, aligned with user_indices
+    # rows added later are kept apart and merged into the arrays the first time these are read, see add_ratings
+    def __init__(self, indptr, user_indices, user_ids, ratings=None):
+        self._indptr = indptr
+        self._user_indices = user_indices
+        self._user_ids = user_ids
+        self._ratings = ratings
+        self.n_anime = len(indptr) - 1
+        self.n_users = len(user_ids)
+        self._user_order = None
+        self._user_rows = None
+        self._clear_added()
+
+    # rows added since the arrays were built or last merged -- flat anime id, user index and rating arrays, the
+    # positions of each anime's rows in them, and the dense index of every new user id
+    def _clear_added(self):
+        self._added_anime = np.zeros(0, dtype=np.int64)
+        self._added_users = np.zeros(0, dtype=self._user_indices.dtype)
+        self._added_ratings = None if self._ratings is None else np.zeros(0, dtype=self._ratings.dtype)
+        self._added_rows = {}
+        self._added_user_ids = {}
+
+    @property
+    def indptr(self):
+        self._merge()
+        return self._indptr
+
+    @property
+    def user_indices(self):
+        self._merge()
+        return self._user_indices
+
+    @property
+    def user_ids(self):
+        self._merge()
+        return self._user_ids
+
+    @property
+    def ratings(self):
+        self._merge()
+        return self._ratings
+
+    # memory held by the index arrays
+    @property
+    def nbytes(self):
+        nbytes = self._indptr.nbytes + self._user_indices.nbytes + self._user_ids.nbytes
+        nbytes += self._added_anime.nbytes + self._added_users.nbytes
+        if self._ratings is not None:
+            nbytes += self._ratings.nbytes + self._added_ratings.nbytes
+        return nbytes
+
+    # builds the index from the anime_id, user_id and optionally rating columns of the ratings
+    @classmethod
+    def from_ratings(cls, anime_ids, user_ids, ratings=None):
+        anime_ids = np.asarray(anime_ids)
+        user_ids, user_indices = np.unique(np.asarray(user_ids), return_inverse=True)
+        order = np.argsort(anime_ids, kind='stable')
+        n_anime = int(anime_ids.max()) + 1 if len(anime_ids) else 0
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(anime_ids, minlength=n_anime))])
+        if ratings is not None:
+            ratings = np.asarray(ratings)[order]
+        return cls(indptr, user_indices[order].astype(np.int32), user_ids, ratings)
+
+    # returns the dense index of every user id, or -1 for users not in the index
+    def user_positions(self, user_ids):
+        user_ids = np.asarray(user_ids)
+        positions = np.full(len(user_ids), -1, dtype=np.int64)
+        if len(self._user_ids):
+            if self._user_order is None:
+                self._user_order = np.argsort(self._user_ids, kind='stable')
+            sorted_ids = self._user_ids[self._user_order]
+            found = np.minimum(np.searchsorted(sorted_ids, user_ids), len(sorted_ids) - 1)
+            positions = np.where(sorted_ids[found] == user_ids, self._user_order[found], -1)
+        if self._added_user_ids:
+            missing = np.flatnonzero(positions < 0)
+            positions[missing] = [self._added_user_ids.get(user_id, -1) for user_id in user_ids[missing].tolist()]
+        return positions
+
+    # returns the entries of the given users as (user index, anime id, rating) arrays -- each user's entries are read
+    # from a copy of the index ordered by user, built on the first call, followed by the entries added since
+    def rows_of_users(self, user_indices):
+        user_indices = np.unique(np.asarray(user_indices, dtype=np.int64))
+        user_indptr, row_anime, row_ratings = self._rows_by_user()
+        users = user_indices[user_indices < len(user_indptr) - 1]
+        starts = user_indptr[users]
+        lengths = user_indptr[users + 1] - starts
+        positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+        added = np.flatnonzero(np.isin(self._added_users, user_indices))
+        users = np.concatenate([np.repeat(users, lengths), self._added_users[added]])
+        anime_ids = np.concatenate([row_anime[positions], self._added_anime[added]])
+        if row_ratings is None:
+            return users, anime_ids, None
+        return users, anime_ids, np.concatenate([row_ratings[positions], self._added_ratings[added]])
+
+    # the entries of the index arrays ordered by user, as (user indptr, anime ids, ratings)
+    def _rows_by_user(self):
+        if self._user_rows is None:
+            row_anime = np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr))
+            order = np.argsort(self._user_indices, kind='stable')
+            counts = np.bincount(self._user_indices, minlength=len(self._user_ids))
+            self._user_rows = (np.concatenate([[0], np.cumsum(counts)]), row_anime[order],
+                               None if self._ratings is None else self._ratings[order])
+        return self._user_rows
+
+    # adds rating rows, as if they came at the end of the ratings file -- users not in the index are numbered after
+    # the known users, so user_ids stays sorted only until then. the rows are kept apart, so only they are touched,
+    # until the index arrays are next read
+    # returns the dense user index of every row
+    def add_ratings(self, anime_ids, user_ids, ratings=None):
+        anime_ids = np.asarray(anime_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids)
+        positions = self.user_positions(user_ids)
+        new_ids = np.unique(user_ids[positions < 0])
+        if len(new_ids):
+            for position, user_id in enumerate(new_ids.tolist(), start=self.n_users):
+                self._added_user_ids[user_id] = position
+            self.n_users += len(new_ids)
+            positions = self.user_positions(user_ids)
+
+        first = len(self._added_anime)
+        self._added_anime = np.concatenate([self._added_anime, anime_ids])
+        self._added_users = np.concatenate([self._added_users, positions.astype(self._added_users.dtype)])
+        if self._added_ratings is not None:
+            ratings = np.asarray(ratings).astype(self._added_ratings.dtype)
+            self._added_ratings = np.concatenate([self._added_ratings, ratings])
+        order = np.argsort(anime_ids, kind='stable')
+        group_ids, starts = np.unique(anime_ids[order], return_index=True)
+        for anime_id, rows in zip(group_ids.tolist(), np.split(first + order, starts[1:])):
+            previous = self._added_rows.get(anime_id)
+            self._added_rows[anime_id] = rows if previous is None else np.concatenate([previous, rows])
+
+        self.n_anime = max(self.n_anime, int(anime_ids.max()) + 1 if len(anime_ids) else 0)
+        return positions
+
+    # inserts the added rows after the rows of their anime and appends the new user ids
+    def _merge(self):
+        if not len(self._added_anime) and not self._added_user_ids:
+            return
+        order = np.argsort(self._added_anime, kind='stable')
+        indptr = np.pad(self._indptr, (0, self.n_anime + 1 - len(self._indptr)), mode='edge')
+        ends = indptr[self._added_anime[order] + 1]
+        self._user_indices = np.insert(self._user_indices, ends, self._added_users[order])
+        if self._ratings is not None:
+            self._ratings = np.insert(self._ratings, ends, self._added_ratings[order])
+        self._indptr = indptr + np.concatenate([[0], np.cumsum(np.bincount(self._added_anime, minlength=self.n_anime))])
+
+        new_ids = sorted(self._added_user_ids, key=self._added_user_ids.get)
+        self._user_ids = np.concatenate([self._user_ids, np.array(new_ids, dtype=self._user_ids.dtype)])
+        self._user_order = None
+        self._user_rows = None
+        self._clear_added()
+
+    # returns the user indices of the rating rows of one anime
+    def users_of(self, anime_id):
+        users = self._user_indices[:0]
+        if 0 <= anime_id < len(self._indptr) - 1:
+            users = self._user_indices[self._indptr[anime_id]:self._indptr[anime_id + 1]]
+        added = self._added_rows.get(anime_id)
+        return users if added is None else np.concatenate([users, self._added_users[added]])
+
+    # returns the ratings of the rating rows of one anime, aligned with users_of
+    def ratings_of(self, anime_id):
+        ratings = self._ratings[:0]
+        if 0 <= anime_id < len(self._indptr) - 1:
+            ratings = self._ratings[self._indptr[anime_id]:self._indptr[anime_id + 1]]
+        added = self._added_rows.get(anime_id)
+        return ratings if added is None else np.concatenate([ratings, self._added_ratings[added]])
+
+    # returns the user indices of every rating row of the given anime
+    def _rating_users(self, anime_ids):
+        if len(anime_ids) == 0:
+            return self._user_indices[:0]
+        return np.concatenate([self.users_of(anime_id) for anime_id in anime_ids])
+
+    # returns a boolean mask over all users marking the users that rated any of the given anime
+    def users_mask(self, anime_ids):
+        mask = np.zeros(self.n_users, dtype=bool)
+        mask[self._rating_users(anime_ids)] = True
+        return mask
+
+    # returns the number of rating rows each user has for the given anime
+    def rating_counts(self, anime_ids):
+        return np.bincount(self._rating_users(anime_ids), minlength=self.n_users)
+
+    # returns the number of users rating the given anime
+    def count_users(self, anime_ids):
+        return int(self.users_mask(anime_ids).sum())
+
+    # splits the audience of two sets of anime into users of only the first, users of both and users of only the second
+    # -- distinct=False counts rating rows instead of users the same way the original pandas implementation did
+    def split_audience(self, first_ids, second_ids, distinct=True):
+        if distinct:
+            first = self.users_mask(first_ids)
+            second = self.users_mask(second_ids)
+            return int((first & ~second).sum()), int((first & second).sum()), int((second & ~first).sum())
+
+        first = self.rating_counts(first_ids)
+        second = self.rating_counts(second_ids)
+        return int(first[second == 0].sum()), int(first[second > 0].sum()), int(second[first == 0].sum())
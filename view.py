@@ -1,15 +1,11 @@
 import tkinter as tk
 from tkinter import ttk
 
-from model import Model
+from model_constants import ModelConstants
+from tracing import traced
 
-import pandas as pd
-
-import matplotlib
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-matplotlib.use("TkAgg")
+# the treeview and chart modules pull in numpy and matplotlib, so they are imported when the main frame is built -- the
+# login frame only needs tkinter, see Controller._warm_up
 
 
 class View(tk.Tk):
@@ -21,7 +17,7 @@ class View(tk.Tk):
 
     USER_PIE_DESC = "This pie graph shows the number of MyAnimeList.net members that view the original anime, new anime, or both in the catalog. This updates as you add anime to the catalog."
 
-    GENRE_BAR_DESC = "This bar graph compares the viewership of the most viewed genres on MyAnimeList.net."
+    GENRE_BAR_DESC = "This bar graph compares how many MyAnimeList.net members viewed the most viewed genres in the catalog."
 
     SIMILARITY_DESC = "The similarity view shows the rating similarity score(r_score), content similarity score(c_score), and the combined similarity score(combined_score) of anime that can be added to the catalog. It also shows the predicted rating(p_rating) for Aniflix users. Click 'Find Similar Anime' to generate new scores based on the selected anime in the catalog."
 
@@ -38,25 +34,28 @@ class View(tk.Tk):
     RED = "#7f270c"
     DARK_GREY = "#1c1c1c"
 
+    # filter bar choice that leaves the genre or type unfiltered
+    ANY_OPTION = "Any"
+
     ENTRY_PAD = 5
     FRAME_PADDING = 10
     BUTTON_PAD = 10
     PIE_PAD = 10
 
     COLUMN_WIDTHS = {
-        Model.ANIME_ID: 60,
-        Model.NAME: 200,
-        Model.GENRE: 150,
-        Model.TYPE: 60,
-        Model.RATING: 60,
-        Model.USER_ID: 60,
-        Model.C_SCORE: 60,
-        Model.R_SCORE: 60,
-        Model.COMBINED_SCORE: 70,
-        Model.A_RATING: 60,
-        Model.P_RATING: 70,
-        Model.EPISODES: 60,
-        Model.MEMBERS: 60
+        ModelConstants.ANIME_ID: 60,
+        ModelConstants.NAME: 200,
+        ModelConstants.GENRE: 150,
+        ModelConstants.TYPE: 60,
+        ModelConstants.RATING: 60,
+        ModelConstants.USER_ID: 60,
+        ModelConstants.C_SCORE: 60,
+        ModelConstants.R_SCORE: 60,
+        ModelConstants.COMBINED_SCORE: 70,
+        ModelConstants.A_RATING: 60,
+        ModelConstants.P_RATING: 70,
+        ModelConstants.EPISODES: 60,
+        ModelConstants.MEMBERS: 60
     }
 
     def __init__(self, controller):
@@ -77,14 +76,28 @@ class View(tk.Tk):
         self.last_tv_clicked = None
 
         self.login_frame = None
+        self.login_button = None
+        self.loading_bar = None
         self.warning_label = None
         self.username_entry = None
         self.password_entry = None
 
         self.catalog_tv = None
         self.sim_tv = None
+        self.load_more_button = None
+        self.optimize_budget = None
+        self.optimize_weighted = None
+        self.filter_vars = None
+        self.filter_range_vars = None
         self.user_pie_parent = None
         self.genre_bar_parent = None
+        self.user_pie_chart = None
+        self.genre_bar_chart = None
+
+        self.timings_window = None
+        self.timings_tv = None
+        self.timings_label = None
+        self.trace_enabled = None
 
     # creates and shows all the widgets for the login screen
     def show_login_frame(self):
@@ -109,8 +122,10 @@ class View(tk.Tk):
         self.warning_label = ttk.Label(self.login_frame)
         self.warning_label.grid(row=3, column=0, columnspan=2)
 
-        login_button = ttk.Button(self.login_frame, text="Login", width=35, command=self.controller.on_login_button_clicked)
-        login_button.grid(row=4, column=0, columnspan=2, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+        self.login_button = ttk.Button(self.login_frame, text="Login", width=35, command=self.controller.on_login_button_clicked)
+        self.login_button.grid(row=4, column=0, columnspan=2, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+        self.loading_bar = ttk.Progressbar(self.login_frame, mode='determinate', maximum=1.0)
 
     # allows the controller to retrieve the login info
     def get_login_info(self):
@@ -120,12 +135,26 @@ class View(tk.Tk):
     def show_incorrect_login_message(self):
         self.warning_label.config(text='Incorrect username and password.')
 
+    # shows the data loading progress under the login form and disables the login button while loading
+    def show_loading_progress(self, message, fraction):
+        self.login_button.state(['disabled'])
+        self.warning_label.config(text=message)
+        self.loading_bar.grid(row=5, column=0, columnspan=2, sticky='ew', padx=View.BUTTON_PAD)
+        self.loading_bar['value'] = fraction
+
+    # shows a warning when loading the data failed and lets the user try again
+    def show_loading_failed_message(self):
+        self.loading_bar.grid_remove()
+        self.login_button.state(['!disabled'])
+        self.warning_label.config(text='Failed to load the application data.')
+
     # destroys the widget containing the login form -- this is meant to be done after correctly logging in and before showing the main frame widget
     def destroy_login_frame(self):
         self.login_frame.destroy()
 
     # shows the main frame that contains the main UI for the application
-    def show_main_frame(self, catalog_df, similarity_df, user_counts, genre_views_df):
+    # filter_options -- genres and types offered by the similarity filter bar, see Model.get_filter_options
+    def show_main_frame(self, catalog_df, similarity_df, user_counts, genre_views_df, filter_options):
 
         # create frames for organization
         main_frame = ttk.Frame(self)
@@ -162,8 +191,7 @@ class View(tk.Tk):
 
         # configure catalog treeview scrollbar
         catalog_scroll = ttk.Scrollbar(top_frame)
-        catalog_scroll.configure(command=self.catalog_tv.yview)
-        self.catalog_tv.configure(yscrollcommand=catalog_scroll.set)
+        self.catalog_tv.attach_scrollbar(catalog_scroll)
         catalog_scroll.grid(sticky=['w', 's', 'n'], row=2, column=1)
 
         # create similarity label, description, and treeview
@@ -179,8 +207,7 @@ class View(tk.Tk):
 
         # configure similarity treeview scrollbar
         sim_scroll = ttk.Scrollbar(bottom_frame)
-        sim_scroll.configure(command=self.sim_tv.yview)
-        self.sim_tv.configure(yscrollcommand=sim_scroll.set)
+        self.sim_tv.attach_scrollbar(sim_scroll)
         sim_scroll.grid(sticky=['w', 's', 'n'], row=2, column=1)
 
         # create buttons for adding, removing and resetting anime in the catalog -- also includes button for generating new similarity scores
@@ -199,6 +226,31 @@ class View(tk.Tk):
                                 command=self.controller.on_sim_button_clicked)
         sim_button.grid(sticky="W", row=0, column=4, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
 
+        self.load_more_button = ttk.Button(control_frame, text="Load More Similar Anime",
+                                           command=self.controller.on_load_more_button_clicked)
+        self.load_more_button.grid(sticky="W", row=0, column=5, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+        # create the controls for adding the anime that reach the most new users
+        self.optimize_budget = tk.IntVar(value=5)
+        optimize_spinbox = ttk.Spinbox(control_frame, from_=1, to=100, width=4, textvariable=self.optimize_budget)
+        optimize_spinbox.grid(sticky="W", row=0, column=6, padx=View.ENTRY_PAD)
+
+        self.optimize_weighted = tk.BooleanVar(value=False)
+        optimize_check = ttk.Checkbutton(control_frame, text="Weight by score", variable=self.optimize_weighted)
+        optimize_check.grid(sticky="W", row=0, column=7, padx=View.ENTRY_PAD)
+
+        optimize_button = ttk.Button(control_frame, text="Add Best Reach Anime",
+                                     command=self.controller.on_optimize_button_clicked)
+        optimize_button.grid(sticky="W", row=0, column=8, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+        timings_button = ttk.Button(control_frame, text="Timings", command=self.controller.on_timings_button_clicked)
+        timings_button.grid(sticky="W", row=0, column=9, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+        # create the filter bar narrowing the similarity list as the user types
+        filter_frame = ttk.Frame(control_frame)
+        filter_frame.grid(sticky="W", row=1, column=0, columnspan=10, padx=View.BUTTON_PAD)
+        self._create_filter_bar(filter_frame, filter_options)
+
         # create shared user pie graph, label, and description
         user_pie_label = ttk.Label(bottom_frame, text="Shared Users", font=View.LABEL_FONT)
         user_pie_label.grid(sticky='s', row=0, column=2)
@@ -219,46 +271,104 @@ class View(tk.Tk):
         self.genre_bar_parent = top_frame
         self.create_genre_bar_graph(genre_views_df)
 
-    # creates the shared user pie graph and displays it in the user_pie_parent widget
+    # creates the name, genre, type, episodes and members filters -- every change is sent to the controller
+    def _create_filter_bar(self, parent, filter_options):
+        self.filter_vars = {
+            ModelConstants.NAME: tk.StringVar(),
+            ModelConstants.GENRE: tk.StringVar(value=View.ANY_OPTION),
+            ModelConstants.TYPE: tk.StringVar(value=View.ANY_OPTION)
+        }
+        self.filter_range_vars = {
+            ModelConstants.EPISODES: (tk.StringVar(), tk.StringVar()),
+            ModelConstants.MEMBERS: (tk.StringVar(), tk.StringVar())
+        }
+
+        column = 0
+        ttk.Label(parent, text="Filter by name").grid(row=0, column=column, padx=View.ENTRY_PAD)
+        ttk.Entry(parent, width=24, textvariable=self.filter_vars[ModelConstants.NAME]).grid(row=0, column=column + 1)
+        column += 2
+
+        for label, option in (("Genre", ModelConstants.GENRE), ("Type", ModelConstants.TYPE)):
+            ttk.Label(parent, text=label).grid(row=0, column=column, padx=View.ENTRY_PAD)
+            combobox = ttk.Combobox(parent, width=14, state='readonly', textvariable=self.filter_vars[option],
+                                    values=[View.ANY_OPTION] + list(filter_options[option]))
+            combobox.grid(row=0, column=column + 1)
+            column += 2
+
+        for label, option in (("Episodes", ModelConstants.EPISODES), ("Members", ModelConstants.MEMBERS)):
+            low_var, high_var = self.filter_range_vars[option]
+            ttk.Label(parent, text=label).grid(row=0, column=column, padx=View.ENTRY_PAD)
+            ttk.Entry(parent, width=7, textvariable=low_var).grid(row=0, column=column + 1)
+            ttk.Label(parent, text="to").grid(row=0, column=column + 2, padx=View.ENTRY_PAD)
+            ttk.Entry(parent, width=7, textvariable=high_var).grid(row=0, column=column + 3)
+            column += 4
+
+        clear_button = ttk.Button(parent, text="Clear Filters", command=self.clear_sim_filters)
+        clear_button.grid(row=0, column=column, padx=View.BUTTON_PAD, pady=View.ENTRY_PAD)
+
+        variables = list(self.filter_vars.values()) + [var for pair in self.filter_range_vars.values() for var in pair]
+        for variable in variables:
+            variable.trace_add('write', lambda *args: self.controller.on_sim_filter_changed())
+
+    # allows the controller to retrieve the similarity filters -- range bounds that are not numbers are ignored
+    def get_sim_filters(self):
+        filters = {ModelConstants.NAME: self.filter_vars[ModelConstants.NAME].get()}
+        genre = self.filter_vars[ModelConstants.GENRE].get()
+        if genre != View.ANY_OPTION:
+            filters[ModelConstants.GENRE] = [genre]
+        anime_type = self.filter_vars[ModelConstants.TYPE].get()
+        if anime_type != View.ANY_OPTION:
+            filters[ModelConstants.TYPE] = anime_type
+        for option, (low_var, high_var) in self.filter_range_vars.items():
+            filters[option] = (View._parse_bound(low_var.get()), View._parse_bound(high_var.get()))
+        return filters
+
+    # empties every similarity filter
+    def clear_sim_filters(self):
+        self.filter_vars[ModelConstants.NAME].set("")
+        self.filter_vars[ModelConstants.GENRE].set(View.ANY_OPTION)
+        self.filter_vars[ModelConstants.TYPE].set(View.ANY_OPTION)
+        for low_var, high_var in self.filter_range_vars.values():
+            low_var.set("")
+            high_var.set("")
+
+    @staticmethod
+    def _parse_bound(text):
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+    # allows the controller to retrieve the number of anime to add and whether to weight them by score
+    def get_optimize_options(self):
+        return [self.optimize_budget.get(), self.optimize_weighted.get()]
+
+    # enables the 'Load More' button only while there are similarity rows that are not shown yet
+    def set_load_more_enabled(self, enabled):
+        if enabled:
+            self.load_more_button.state(['!disabled'])
+        else:
+            self.load_more_button.state(['disabled'])
+
+    # creates the shared user pie graph in the user_pie_parent widget the first time it is called and updates the
+    # same chart in place afterwards -- rapid updates are drawn once
     def create_user_pie_graph(self, user_counts):
-        fig = plt.Figure(figsize=(4.5, 3), dpi=100, facecolor=self.DARK_GREY)
-        plot = fig.add_subplot(111)
-        names = list()
-        values = list()
-        colors = list()
-
-        # fills the names, values and colors lists based on the user_counts input -- some counts may not exist every time this is called
-        for key in user_counts.keys():
-            if user_counts[key] != 0:
-                names.append(key + "=" + str(user_counts[key]))
-                values.append(user_counts[key])
-                if key == 'original':
-                    colors.append(View.DARK_GREEN)
-                elif key == 'shared':
-                    colors.append(View.BLUE_GREEN)
-                elif key == 'new':
-                    colors.append(View.BLUE)
-
-        fig.patch.set_facecolor(self.DARK_GREY)
-        plt.rcParams['text.color'] = 'white'
-        plot.pie(values, labels=names, wedgeprops={'linewidth': 2, 'edgecolor': self.DARK_GREY}, colors=colors)
-        canvas = FigureCanvasTkAgg(fig, self.user_pie_parent)
-        canvas.get_tk_widget().grid(sticky="E", row=2, column=2, padx=self.PIE_PAD)
-
-    # creates the genre view count bar graph and displays it in the genre_bar_parent widget
+        if self.user_pie_chart is None:
+            from charts import PieChart
+            self.user_pie_chart = PieChart(self.user_pie_parent, keys=['original', 'shared', 'new'],
+                                           colors=[View.DARK_GREEN, View.BLUE_GREEN, View.BLUE], edge_color=self.DARK_GREY,
+                                           text_color='white', figsize=(4.5, 3), dpi=100,
+                                           sticky="E", row=2, column=2, padx=self.PIE_PAD)
+        self.user_pie_chart.update(user_counts)
+
+    # creates the genre view count bar graph in the genre_bar_parent widget the first time it is called and updates the
+    # same chart in place afterwards
     def create_genre_bar_graph(self, genre_views_df):
-        fig = plt.Figure(figsize=(8, 6), dpi=50)
-        ax = fig.add_subplot(111)
-
-        view_counts = genre_views_df[Model.VIEW_COUNT].values
-        genres = genre_views_df[Model.GENRE].values
-
-        ax.bar(genres, view_counts)
-        ax.set_ylabel("VIEWERS")
-        ax.set_xlabel("TOP GENRES")
-        ax.ticklabel_format(axis='y', style='plain')
-        canvas = FigureCanvasTkAgg(fig, self.genre_bar_parent)
-        canvas.get_tk_widget().grid(sticky="E", row=2, column=2, padx=self.PIE_PAD)
+        if self.genre_bar_chart is None:
+            from charts import BarChart
+            self.genre_bar_chart = BarChart(self.genre_bar_parent, x_label="TOP GENRES", y_label="VIEWERS", figsize=(8, 6),
+                                            dpi=50, sticky="E", row=2, column=2, padx=self.PIE_PAD)
+        self.genre_bar_chart.update((genre_views_df[ModelConstants.GENRE].tolist(), genre_views_df[ModelConstants.VIEW_COUNT].tolist()))
 
     # called when a treeview is clicked
     def _on_tv_clicked(self, event):
@@ -285,7 +395,8 @@ class View(tk.Tk):
     # creates a treeview based on a dataframe, sets a click event, and attaches it to a parent widget
     @staticmethod
     def _create_tv(parent, dataframe, left_click_command):
-        tv = ttk.Treeview(parent, height=10)
+        from virtual_treeview import VirtualTreeview
+        tv = VirtualTreeview(parent, height=10)
         tv.bind("<Button-1>", left_click_command)
         tv['columns'] = list(dataframe.columns)
         tv["show"] = "headings"
@@ -293,28 +404,60 @@ class View(tk.Tk):
         for column in tv["columns"]:
             tv.heading(column, text=column)
 
+        # configure row style
+        tv.tag_configure("old", background=View.DARK_GREEN)
+        tv.tag_configure("f", font=View.STD_FONT)
+
         View._set_tv_column_sizes(tv)
         View.update_tv_rows(tv, dataframe)
         return tv
 
-    # updates a treeview's rows by deleting all previous rows and refilling the treeview
+    # updates a treeview's rows -- only the visible rows are materialized and rows that are already shown are reused
     @staticmethod
+    @traced('render')
     def update_tv_rows(tv, df):
-        # delete old rows
-        for row in tv.get_children():
-            tv.delete(row)
-
-        # insert new rows
-        df_rows = df.to_numpy().tolist()
-        for row in df_rows:
-            if row[0] in Model.ORIGINAL_CATALOG_ANIME_IDS:
-                tv.insert("", "end", values=row, tags=("old", "f"))
-            else:
-                tv.insert("", "end", values=row, tags=("new", "f"))
-
-        # configure row style
-        tv.tag_configure("old", background=View.DARK_GREEN)
-        tv.tag_configure("f", font=View.STD_FONT)
+        tv.set_rows(df, highlight_ids=ModelConstants.ORIGINAL_CATALOG_ANIME_IDS)
+
+    # shows the per operation timing summary in its own window, creating the window the first time it is called
+    def show_timings(self, timings_df, enabled):
+        if self.timings_window is None or not self.timings_window.winfo_exists():
+            self.timings_window = tk.Toplevel(self)
+            self.timings_window.title('Timings')
+
+            self.trace_enabled = tk.BooleanVar(value=enabled)
+            trace_check = ttk.Checkbutton(self.timings_window, text="Record timings", variable=self.trace_enabled,
+                                          command=lambda: self.controller.on_trace_toggled(self.trace_enabled.get()))
+            trace_check.grid(sticky="W", row=0, column=0, padx=View.ENTRY_PAD, pady=View.ENTRY_PAD)
+
+            refresh_button = ttk.Button(self.timings_window, text="Refresh",
+                                        command=self.controller.on_timings_button_clicked)
+            refresh_button.grid(sticky="W", row=0, column=1, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+            profile_button = ttk.Button(self.timings_window, text="Profile Next Interaction",
+                                        command=self.controller.on_profile_button_clicked)
+            profile_button.grid(sticky="W", row=0, column=2, padx=View.BUTTON_PAD, pady=View.BUTTON_PAD)
+
+            self.timings_label = ttk.Label(self.timings_window)
+            self.timings_label.grid(sticky="W", row=1, column=0, columnspan=3, padx=View.ENTRY_PAD)
+
+            self.timings_tv = self._create_tv(self.timings_window, timings_df, left_click_command=lambda event: None)
+            self.timings_tv.grid(row=2, column=0, columnspan=3, padx=View.FRAME_PADDING, pady=View.FRAME_PADDING)
+        else:
+            self.trace_enabled.set(enabled)
+            self.update_tv_rows(self.timings_tv, timings_df)
+            self.timings_window.lift()
+
+        if not enabled:
+            self.show_timings_message("Timings are not being recorded.")
+        elif len(timings_df) == 0:
+            self.show_timings_message("No operations recorded yet.")
+        else:
+            self.show_timings_message("")
+
+    # shows a message above the timing summary
+    def show_timings_message(self, message):
+        if self.timings_label is not None and self.timings_label.winfo_exists():
+            self.timings_label.config(text=message)
 
     # get the selected row in a treeview
     @staticmethod
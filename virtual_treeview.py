@@ -0,0 +1,81 @@
+from tkinter import ttk
+
+import numpy as np
+
+
+class VirtualTreeview(ttk.Treeview):
+
+    # number of rows materialized at first and added each time the view is scrolled near its last row
+    PAGE_SIZE = 100
+    # fraction of the materialized rows that must be scrolled past before the next page is fetched
+    FETCH_THRESHOLD = 0.9
+
+    # treeview that only materializes the first rows of its dataframe and fetches more as it is scrolled -- rows are
+    # keyed by the value of the first column so updates are applied as inserts, deletes, moves and value changes
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self._df = None
+        self._highlight_ids = ()
+        self._shown = 0
+        self._rows = {}
+        self._scrollbar = None
+        self.configure(yscrollcommand=self._on_yscroll)
+
+    # connects a vertical scrollbar -- use this instead of setting yscrollcommand so scrolling can fetch more rows
+    def attach_scrollbar(self, scrollbar):
+        self._scrollbar = scrollbar
+        scrollbar.configure(command=self.yview)
+
+    # shows the rows of a dataframe, rows whose key is in highlight_ids are tagged "old" and the rest "new" -- the
+    # window goes back to the first page, rows scrolled into view earlier are fetched again as needed
+    def set_rows(self, df, highlight_ids=()):
+        self._df = df
+        self._highlight_ids = highlight_ids
+        self._sync(VirtualTreeview.PAGE_SIZE)
+
+    # number of rows in the dataframe, materialized or not
+    def row_count(self):
+        return 0 if self._df is None else len(self._df)
+
+    # materializes the first n rows of the dataframe, reusing the items that already exist for the same keys --
+    # missing values are shown as empty cells, which also keeps rows holding them equal to themselves when diffed
+    def _sync(self, n):
+        window_df = self._df.iloc[:n]
+        values = window_df.astype(object).where(window_df.notna(), '').to_numpy().tolist()
+        key_values = window_df.iloc[:, 0].to_numpy()
+        keys = [str(key) for key in key_values.tolist()]
+        highlighted = np.isin(key_values, list(self._highlight_ids))
+
+        # delete the rows that left the window
+        kept = set(keys)
+        removed = [iid for iid in self._rows if iid not in kept]
+        if removed:
+            self.delete(*removed)
+            for iid in removed:
+                del self._rows[iid]
+
+        # insert new rows, update changed rows and move rows whose position changed
+        children = list(self.get_children())
+        for index, (iid, row) in enumerate(zip(keys, values)):
+            tags = ("old", "f") if highlighted[index] else ("new", "f")
+            if iid not in self._rows:
+                self.insert("", index, iid=iid, values=row, tags=tags)
+                children.insert(index, iid)
+            else:
+                if self._rows[iid] != row:
+                    self.item(iid, values=row, tags=tags)
+                if index >= len(children) or children[index] != iid:
+                    self.move(iid, "", index)
+                    children.remove(iid)
+                    children.insert(index, iid)
+            self._rows[iid] = row
+
+        self._shown = len(keys)
+
+    # forwards the scroll position to the scrollbar and fetches the next page when the end of the window is visible
+    def _on_yscroll(self, first, last):
+        if self._scrollbar is not None:
+            self._scrollbar.set(first, last)
+        if (self._df is not None and self._shown < len(self._df)
+                and float(last) >= VirtualTreeview.FETCH_THRESHOLD):
+            self._sync(self._shown + VirtualTreeview.PAGE_SIZE)
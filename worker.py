@@ -0,0 +1,77 @@
+import logging
+import queue
+import threading
+
+from tracing import TRACER
+
+
+class BackgroundWorker:
+
+    # how often the Tk main loop checks for finished tasks
+    POLL_INTERVAL_MS = 30
+
+    # runs tasks one at a time on a background thread and hands their results back to the Tk main loop -- callbacks are
+    # always called on the Tk thread, tasks never touch Tk widgets
+    def __init__(self, tk_root):
+        self.root = tk_root
+        self._tasks = queue.Queue()
+        self._results = queue.Queue()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, name="BackgroundWorker", daemon=True)
+        self._thread.start()
+        self.root.after(BackgroundWorker.POLL_INTERVAL_MS, self._poll)
+
+    # queues a task -- a task submitted with a key supersedes earlier tasks with the same key, those are skipped if they
+    # have not started yet and their results are dropped if they have, tasks without a key always run and report back
+    # when on_progress is given the task is called with a progress(message, fraction) keyword argument
+    # name -- names the task and its callbacks when they are traced, defaults to the key or the task's own name
+    def submit(self, fn, on_done=None, key=None, on_error=None, on_progress=None, name=None):
+        if name is None:
+            name = key or getattr(fn, '__qualname__', 'task')
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+        self._tasks.put((key, generation, name, fn, on_done, on_error, on_progress))
+        return generation
+
+    # checks whether a task is still the latest one submitted for its key
+    def _is_current(self, key, generation):
+        if key is None:
+            return True
+        with self._lock:
+            return self._generations.get(key) == generation
+
+    def _run(self):
+        while True:
+            key, generation, name, fn, on_done, on_error, on_progress = self._tasks.get()
+            if not self._is_current(key, generation):
+                continue
+            try:
+                with TRACER.span(name, 'task'):
+                    if on_progress is not None:
+                        def progress(message, fraction, key=key, generation=generation, on_progress=on_progress):
+                            self._results.put((key, generation, name, on_progress, (message, fraction)))
+                        result = fn(progress=progress)
+                    else:
+                        result = fn()
+                self._results.put((key, generation, name, on_done, (result,)))
+            except Exception as e:
+                logging.error("Exception occurred", exc_info=True)
+                self._results.put((key, generation, name, on_error, (e,)))
+
+    # calls the callbacks of finished tasks on the Tk thread
+    def _poll(self):
+        try:
+            while True:
+                key, generation, name, callback, args = self._results.get_nowait()
+                if callback is not None and self._is_current(key, generation):
+                    try:
+                        with TRACER.span(name, 'render'):
+                            callback(*args)
+                    except Exception as e:
+                        logging.error("Exception occurred", exc_info=True)
+        except queue.Empty:
+            pass
+        self.root.after(BackgroundWorker.POLL_INTERVAL_MS, self._poll)